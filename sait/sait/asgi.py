@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sait.settings')
+# Страницы для чтения выполняют независимые запросы одновременно (settings.ASYNC_VIEWS)
+os.environ.setdefault('SAIT_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
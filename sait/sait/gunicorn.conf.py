@@ -0,0 +1,63 @@
+"""Конфигурация gunicorn для запуска под ASGI.
+
+Запуск из каталога проекта:
+    pip install -r requirements.txt
+    gunicorn -c sait/gunicorn.conf.py
+
+Воркеры uvicorn обслуживают sait.asgi:application, где включены
+асинхронные страницы (settings.ASYNC_VIEWS). Запросы к БД каждой страницы
+выполняются в потоках пула asyncio - до min(32, CPU + 4) на воркер. Чтобы
+соединений с PostgreSQL не стало больше, чем потоков, каждый воркер берет
+их из пула psycopg (SAIT_DB_POOL=1) размером SAIT_DB_POOL_SIZE. Всего
+соединений до workers * SAIT_DB_POOL_SIZE, и это должно уложиться в
+max_connections сервера (SAIT_DB_MAX_CONNECTIONS, по умолчанию 100) за
+вычетом запаса для команд, cron и psql. Число воркеров по умолчанию
+выбирается так, чтобы уложиться.
+"""
+import multiprocessing
+import os
+
+# Воркеры читают настройки Django уже с этими переменными
+os.environ.setdefault('SAIT_DB_POOL', '1')
+os.environ.setdefault('SAIT_DB_POOL_SIZE', '8')
+
+DB_MAX_CONNECTIONS = int(os.environ.get('SAIT_DB_MAX_CONNECTIONS', 100))
+# Соединения для management-команд, cron и ручной работы
+DB_RESERVED_CONNECTIONS = 10
+DB_POOL_SIZE = int(os.environ['SAIT_DB_POOL_SIZE'])
+
+wsgi_app = 'sait.asgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.environ.get('SAIT_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('SAIT_WORKERS', max(1, min(
+    multiprocessing.cpu_count() * 2 + 1,
+    (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // DB_POOL_SIZE,
+))))
+# Воркер, занятый дольше timeout, перезапускается
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = '-'
+
+
+def on_starting(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sait.settings')
+    from sait_app import auth_backends, throttle
+    if workers > 1 and not throttle.is_shared():
+        raise RuntimeError(
+            f'Кэш THROTTLE_CACHE_ALIAS не общий или без атомарного incr: при {workers} воркерах '
+            f'лимиты входа будут превышаться до {workers} раз. Нужен Redis (SAIT_REDIS_URL) или Memcached'
+        )
+    if workers > 1 and not auth_backends.is_shared():
+        raise RuntimeError(
+            'Кэш AUTH_USER_CACHE_ALIAS виден только своему процессу: смена пароля или блокировка '
+            'в одном воркере не дойдет до остальных. Нужен общий кэш (SAIT_REDIS_URL)'
+        )
+    if workers * DB_POOL_SIZE > DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS:
+        raise RuntimeError(
+            f'{workers} воркеров по {DB_POOL_SIZE} соединений не помещаются в '
+            f'max_connections={DB_MAX_CONNECTIONS}: уменьшите SAIT_WORKERS или SAIT_DB_POOL_SIZE'
+        )
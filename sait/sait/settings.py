@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,11 +38,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'sait_app',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Статика из STATIC_ROOT при DEBUG=False: сжатые копии и долгий кэш, без сессий и БД
+    'sait_app.staticfiles.StaticFilesMiddleware',
+    # Сжатие brotli/gzip: выше остальных, чтобы сжимать уже готовый ответ
+    'sait_app.compression.CompressionMiddleware',
+    # До сессий: сохранение сессии тоже запись, после нее читаем с основной базы
+    'sait_app.db_router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,11 +60,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'sait.urls'
 
+# Отступы в шаблонах .html убираются один раз при загрузке (sait_app/template_loaders.py);
+# SAIT_TEMPLATE_MINIFY=0 - исходная разметка, например для отладки шаблонов
+TEMPLATE_MINIFY = os.environ.get('SAIT_TEMPLATE_MINIFY', '1') == '1'
+_template_loaders = (
+    ['sait_app.template_loaders.FilesystemLoader', 'sait_app.template_loaders.AppDirectoriesLoader']
+    if TEMPLATE_MINIFY else
+    ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR/"templates"],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -64,26 +80,116 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Скомпилированные шаблоны хранятся в памяти процесса и при DEBUG
+            'loaders': [('django.template.loaders.cached.Loader', _template_loaders)],
         },
     },
 ]
 
 WSGI_APPLICATION = 'sait.wsgi.application'
 
+# Асинхронные версии страниц для чтения (sait_app/views_async.py).
+# sait/asgi.py включает их сам; под WSGI каждая такая страница
+# запускала бы свой цикл событий, поэтому там остаются синхронные.
+ASYNC_VIEWS = os.environ.get('SAIT_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+def _database(host):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'travel_diary',  # Имя вашей базы данных
         'USER': 'postgres',  # Имя пользователя PostgreSQL
         'PASSWORD': '1234',  # Пароль пользователя
-        'HOST': 'localhost',  # Хост (обычно localhost)
+        'HOST': host,  # Хост (обычно localhost)
         'PORT': '5432',  # Порт (обычно 5432)
+        # Соединение переживает запрос и проверяется перед повторным использованием
+        'CONN_MAX_AGE': int(os.environ.get('SAIT_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.environ.get('SAIT_DB_POOL') == '1':
+        # Пул psycopg 3 (pip install "psycopg[pool]"); с пулом CONN_MAX_AGE должен быть 0.
+        # Под ASGI его включает gunicorn.conf.py: max_size ограничивает соединения воркера
+        from psycopg_pool import ConnectionPool
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS'] = {'pool': {
+            'min_size': 2,
+            'max_size': int(os.environ.get('SAIT_DB_POOL_SIZE', 20)),
+            'timeout': 10,
+            'check': ConnectionPool.check_connection,
+        }}
+    return database
+
+
+DATABASES = {
+    'default': _database(os.environ.get('SAIT_DB_HOST', 'localhost')),
+}
+
+# Реплики для чтения (sait_app/db_router.py): SAIT_DB_REPLICAS=host1,host2
+# создает псевдонимы replica1, replica2. Для локальной проверки хватит
+# SAIT_DB_REPLICAS=localhost - реплика смотрит в ту же базу.
+DATABASE_REPLICAS = []
+for _number, _host in enumerate(filter(None, os.environ.get('SAIT_DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{_number}'] = {**_database(_host.strip()), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_number}')
+
+DATABASE_ROUTERS = ['sait_app.db_router.ReplicaRouter']
+# Сколько секунд после записи браузер читает только с основной базы
+DATABASE_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Инвалидация построена на версиях в кэше: fragment_cache.bump/bump_trips, поколение
+# карты (travel_map.py). Поэтому кэш обязан быть общим для всех воркеров gunicorn и
+# для management-команд (import_diaries, rebuild_map_stats, generate_scale_data):
+# с LocMemCache у каждого процесса свои версии, и остальные воркеры до
+# FRAGMENT_CACHE_TIMEOUT отдают устаревшие карточки и отзывы.
+# В продакшене - Redis: SAIT_REDIS_URL=redis://localhost:6379/0 (pip install redis).
+# Без него - LocMemCache: годится для runserver и одного воркера, а gunicorn.conf.py
+# не запустит несколько воркеров без общего кэша. Файловый кэш (общий для процессов
+# одной машины) включается только явно, SAIT_CACHE_DIR=/var/cache/sait: он медленный -
+# каждая запись перебирает файлы каталога - и его incr не атомарен.
+if os.environ.get('SAIT_REDIS_URL'):
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['SAIT_REDIS_URL'],
     }
+elif os.environ.get('SAIT_CACHE_DIR'):
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['SAIT_CACHE_DIR'],
+        # По умолчанию 300 записей - версии фрагментов вытеснялись бы постоянно
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+else:
+    _default_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sait'}
+# Тесты идут в одном процессе, а внешний кэш пережил бы прогон
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    _default_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sait'}
+
+CACHES = {
+    'default': _default_cache,
+}
+
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Лимиты попыток входа и регистрации (sait_app/throttle.py): scope -> (попыток, окно в секундах).
+# Счетчики должны быть общими для всех воркеров (иначе лимит умножается на их число) -
+# общий кэш default с атомарным incr (Redis, Memcached); gunicorn.conf.py не стартует
+# несколько воркеров с LocMemCache или файловым кэшем.
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_RATES = {
+    'login_ip': (20, 5 * 60),
+    'login_username': (5, 5 * 60),
+    'register_ip': (5, 60 * 60),
 }
+# Заголовок с адресом клиента за прокси, например 'HTTP_X_FORWARDED_FOR'; None - REMOTE_ADDR
+THROTTLE_IP_HEADER = None
 
 
 # Password validation
@@ -129,12 +235,50 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STATICFILES_DIRS = [BASE_DIR/'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic пишет имена с хэшем содержимого и сжатые копии .gz/.br (sait_app/staticfiles.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'sait_app.staticfiles.CompressedManifestStaticFilesStorage'},
+    # Фото и аватары: имя файла - sha256 содержимого, одинаковые загрузки хранятся один раз.
+    # Каталог должен совпадать с default: копии и gc_media работают через default_storage
+    'blobs': {'BACKEND': 'sait_app.blobs.BlobStorage'},
+}
+# Файлы с хэшем в имени не меняются - кэшируем на год; остальные - ненадолго
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_UNHASHED_MAX_AGE = 60 * 60
+
 import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Настройки аутентификации
+# Сессии читаются из кэша и пишутся в БД; пользователь с профилем - тоже из кэша
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['sait_app.auth_backends.CachedModelBackend']
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 15 * 60
+# С кэшем одного процесса (LocMemCache) смена пароля в другом процессе не дошла бы до
+# этого - пользователь тогда читается из БД. Тестам, идущим в одном процессе, можно
+AUTH_USER_CACHE_REQUIRE_SHARED = not TESTING
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# Уменьшенные копии фотографий и аватаров (sait_app/images.py)
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_ASYNC = True
+
+# Удаление поездок (sait_app/trip_purge.py): строки фото и отзывов удаляются в фоне порциями
+TRIP_PURGE_ASYNC = True
+TRIP_PURGE_BATCH_SIZE = 500
+
+# Рейтинг лучших поездок (sait_app/leaderboard.py): к отзывам поездки добавляется
+# LEADERBOARD_PRIOR_WEIGHT воображаемых отзывов со средней оценкой по сайту
+LEADERBOARD_PRIOR_WEIGHT = 5
+LEADERBOARD_MIN_REVIEWS = 1
+LEADERBOARD_SIZE = 50
+
+# Пакетная загрузка фото (sait_app/uploads.py)
+PHOTO_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+PHOTO_UPLOAD_WORKERS = 8
@@ -1,42 +1,89 @@
 from django.contrib import admin
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
-from .models import UserProfile, Trip, TripPhoto, Review
+from .models import UserProfile, Trip, TripPhoto, TripRanking, Review, Country, CountryAlias, CountryStats
+from .pagination import EstimatedCountPaginator
+from . import search, travel_map
+
+
+class FastChangeListMixin:
+    """Общие настройки списков для больших таблиц"""
+    paginator = EstimatedCountPaginator
+    # Не считаем размер всей таблицы повторно при включенных фильтрах
+    show_full_result_count = False
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ['user', 'created_at', 'updated_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email']
     list_filter = ['created_at']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['user']
 
 
 @admin.register(Trip)
-class TripAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'country', 'start_date', 'end_date', 'reviews_count', 'average_rating',
-                    'created_at']
-    list_filter = ['country', 'start_date', 'created_at']
+class TripAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ['title', 'user', 'country', 'start_date', 'end_date', 'photos_count', 'reviews_count',
+                    'average_rating', 'created_at']
+    list_select_related = ['user']
+    # Фильтр по справочнику стран: SELECT DISTINCT country прошел бы по всей таблице поездок
+    list_filter = ['country_ref', 'start_date', 'created_at']
     search_fields = ['title', 'description', 'country', 'user__username']
     date_hierarchy = 'start_date'
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'approved_reviews_count', 'rating_sum', 'country_ref']
+    raw_id_fields = ['user']
+
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк текущей страницы, без GROUP BY по всей таблице
+        photos = TripPhoto.objects.filter(trip=OuterRef('pk')).order_by().values('trip')
+        return super().get_queryset(request).annotate(
+            photos_total=Coalesce(Subquery(photos.annotate(total=Count('pk')).values('total')), 0),
+            rating_avg=Case(
+                When(approved_reviews_count=0, then=Value(0.0)),
+                default=F('rating_sum') * 1.0 / F('approved_reviews_count'),
+                output_field=FloatField(),
+            ),
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по GIN-индексу вместо ILIKE '%q%' по всем search_fields
+        if search_term and search.is_supported():
+            queryset = queryset.filter(
+                search.search_filter(search.search_query(search_term)) | Q(user__username=search_term)
+            )
+            return queryset, False
+        return super().get_search_results(request, queryset, search_term)
+
+    def photos_count(self, obj):
+        return obj.photos_total
+
+    photos_count.short_description = 'Фото'
+    photos_count.admin_order_field = 'photos_total'
 
     def reviews_count(self, obj):
         return obj.reviews_count()
 
     reviews_count.short_description = 'Отзывов'
+    reviews_count.admin_order_field = 'approved_reviews_count'
 
     def average_rating(self, obj):
         return obj.average_rating()
 
     average_rating.short_description = 'Рейтинг'
+    average_rating.admin_order_field = 'rating_avg'
 
 
 @admin.register(TripPhoto)
-class TripPhotoAdmin(admin.ModelAdmin):
+class TripPhotoAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ['trip', 'image_preview', 'caption', 'order', 'uploaded_at']
-    list_filter = ['uploaded_at', 'trip__country']
+    list_select_related = ['trip']
+    list_filter = ['uploaded_at', 'trip__country_ref']
     search_fields = ['trip__title', 'caption']
     list_editable = ['order']
+    raw_id_fields = ['trip']
 
     def image_preview(self, obj):
         if obj.image:
@@ -47,20 +94,81 @@ class TripPhotoAdmin(admin.ModelAdmin):
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ['user', 'trip', 'rating_stars', 'created_at', 'is_approved', 'is_edited']
+    list_select_related = ['user', 'trip']
     list_filter = ['rating', 'created_at', 'is_approved']
     search_fields = ['user__username', 'trip__title', 'comment']
     list_editable = ['is_approved']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['user', 'trip']
+    actions = ['approve_reviews', 'reject_reviews']
+
+    @admin.action(description='Одобрить выбранные отзывы', permissions=['change'])
+    def approve_reviews(self, request, queryset):
+        # Один UPDATE на все строки, агрегаты - по разу на затронутую поездку
+        rows = queryset.approve()
+        self.message_user(request, f'Одобрено отзывов: {rows}')
+
+    @admin.action(description='Отклонить выбранные отзывы', permissions=['change'])
+    def reject_reviews(self, request, queryset):
+        rows = queryset.reject()
+        self.message_user(request, f'Отклонено отзывов: {rows}')
 
     def rating_stars(self, obj):
         return obj.get_rating_stars()
 
     rating_stars.short_description = 'Рейтинг'
+    rating_stars.admin_order_field = 'rating'
 
     def is_edited(self, obj):
         return obj.is_edited
 
     is_edited.short_description = 'Редактирован'
-    is_edited.boolean = True
\ No newline at end of file
+    is_edited.boolean = True
+
+
+class CountryAliasInline(admin.TabularInline):
+    model = CountryAlias
+    extra = 1
+
+
+@admin.register(Country)
+class CountryAdmin(admin.ModelAdmin):
+    list_display = ['name', 'name_en', 'iso2', 'iso3', 'latitude', 'longitude']
+    search_fields = ['name', 'name_en', 'iso2', 'iso3']
+    inlines = [CountryAliasInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        travel_map.invalidate_aliases()
+        # Новые написания могли подойти к поездкам, которые раньше не распознались
+        linked = travel_map.relink_trips()
+        if linked:
+            self.message_user(request, f'Привязано поездок к справочнику: {linked}')
+
+
+@admin.register(CountryStats)
+class CountryStatsAdmin(admin.ModelAdmin):
+    list_display = ['country', 'trips_count', 'total_days', 'reviews_count', 'average_rating', 'updated_at']
+    list_select_related = ['country']
+    ordering = ['-trips_count']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TripRanking)
+class TripRankingAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ['trip', 'country', 'score', 'reviews_count', 'updated_at']
+    list_select_related = ['trip', 'country']
+    list_filter = ['country']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,311 @@
+"""Read-only JSON API поездок, фото и отзывов.
+
+Каждый ответ несет сильный ETag и Last-Modified. Валидаторы строятся до
+основного запроса: для списка поездок - из агрегата по Trip (последний
+updated_at и число видимых поездок) и версии списка в кэше, для ресурсов
+поездки - из Trip.updated_at и версий ``photos``/``reviews`` (см.
+fragment_cache.py). Агрегат из БД замечает и записи в обход сигналов
+(bulk_create, update() в командах), версия - смену агрегатов отзывов,
+которая updated_at не трогает. Совпавший If-None-Match или If-Modified-Since получает
+304 без выборки данных.
+
+Параметр ``fields`` (через запятую) ограничивает набор полей; поля,
+которые не запрошены, не читаются из БД.
+"""
+import datetime
+import functools
+import hashlib
+
+from django.db.models import Count, Max, Q
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from . import fragment_cache
+from .images import VARIANT_WIDTHS, variant_name
+from .models import Review, Trip, TripPhoto
+from .pagination import CursorPaginator, InvalidCursor
+
+TRIP_FIELDS = {
+    # имя в ответе: поля модели, которые нужно прочитать
+    'id': ('id',),
+    'title': ('title',),
+    'country': ('country',),
+    'start_date': ('start_date',),
+    'end_date': ('end_date',),
+    'duration_days': ('start_date', 'end_date'),
+    'description': ('description',),
+    'author': ('user__username',),
+    'rating': ('approved_reviews_count', 'rating_sum'),
+    'reviews_count': ('approved_reviews_count',),
+    'updated_at': ('updated_at',),
+    'url': ('id',),
+}
+PHOTO_FIELDS = {
+    'id': ('id',),
+    'image': ('image',),
+    'thumbnail': ('image', 'variants_ready'),
+    'caption': ('caption',),
+    'order': ('order',),
+    'uploaded_at': ('uploaded_at',),
+}
+REVIEW_FIELDS = {
+    'id': ('id',),
+    'author': ('user__username',),
+    'rating': ('rating',),
+    'comment': ('comment',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
+
+TRIPS_ORDERING = ['-start_date', '-id']
+PHOTOS_ORDERING = ['order', 'id']
+REVIEWS_ORDERING = ['-created_at', '-id']
+TRIPS_PER_PAGE = 20
+PHOTOS_PER_PAGE = 50
+REVIEWS_PER_PAGE = 50
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _version_datetime(version):
+    return datetime.datetime.fromtimestamp(version / 1e9, tz=datetime.timezone.utc)
+
+
+def _strong_etag(*parts):
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def requested_fields(request, available):
+    """Запрошенные поля в порядке справочника; неизвестные поля - ошибка 400"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = names - set(available)
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return [name for name in available if name in names]
+
+
+def _select(queryset, fields, available, ordering):
+    # Ключи сортировки нужны курсору, даже если клиент их не запросил
+    columns = {'id', *(name.lstrip('-') for name in ordering)}
+    for name in fields:
+        columns.update(available[name])
+    related = {column.split('__')[0] for column in columns if '__' in column}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*sorted(columns))
+
+
+def _trip_state(request, pk):
+    """Валидаторы ресурсов поездки; один запрос на запрос клиента"""
+    state = getattr(request, '_api_trip_state', None)
+    if state is None:
+        updated_at = Trip.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404('Поездка не найдена')
+        trip = Trip(pk=pk, updated_at=updated_at)
+        state = request._api_trip_state = {
+            'updated_at': updated_at,
+            'versions': fragment_cache.versions(trip),
+        }
+    return state
+
+
+def _trip_last_modified(request, pk, dependencies):
+    state = _trip_state(request, pk)
+    return max([state['updated_at'], *(
+        _version_datetime(state['versions'][dependency]) for dependency in dependencies
+    )])
+
+
+def _trip_etag(request, pk, resource, dependencies):
+    state = _trip_state(request, pk)
+    return _strong_etag(
+        resource, pk, state['updated_at'].isoformat(),
+        *(state['versions'][dependency] for dependency in dependencies),
+        request.GET.get('fields', ''), request.GET.get('cursor', ''),
+    )
+
+
+def _json(request, payload):
+    response = JsonResponse(payload, json_dumps_params={'ensure_ascii': False})
+    # Клиент хранит ответ, но перед использованием сверяет валидаторы
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _api_view(view):
+    """Ошибки API отдаются в JSON, а не HTML-страницей"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as error:
+            return _error(str(error), 400)
+        except Http404 as error:
+            return _error(str(error), 404)
+    return wrapper
+
+
+def _page(request, queryset, ordering, per_page):
+    paginator = CursorPaginator(queryset, ordering, per_page)
+    try:
+        return paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise BadRequest('Некорректный курсор')
+
+
+def _next_url(request, page):
+    if not page.has_next():
+        return None
+    query = request.GET.copy()
+    query['cursor'] = page.next_cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def serialize_trip(trip, fields):
+    values = {
+        'id': lambda: trip.pk,
+        'title': lambda: trip.title,
+        'country': lambda: trip.country,
+        'start_date': lambda: trip.start_date,
+        'end_date': lambda: trip.end_date,
+        'duration_days': trip.duration_days,
+        'description': lambda: trip.description,
+        'author': lambda: trip.user.username,
+        'rating': trip.average_rating,
+        'reviews_count': trip.reviews_count,
+        'updated_at': lambda: trip.updated_at,
+        'url': lambda: reverse('api_trip_detail', args=[trip.pk]),
+    }
+    return {name: values[name]() for name in fields}
+
+
+def serialize_photo(photo, fields):
+    values = {
+        'id': lambda: photo.pk,
+        'image': lambda: photo.image.url,
+        'thumbnail': lambda: (
+            photo.image.storage.url(variant_name(photo.image.name, VARIANT_WIDTHS['photo'][0], 'webp'))
+            if photo.variants_ready else photo.image.url
+        ),
+        'caption': lambda: photo.caption,
+        'order': lambda: photo.order,
+        'uploaded_at': lambda: photo.uploaded_at,
+    }
+    return {name: values[name]() for name in fields}
+
+
+def serialize_review(review, fields):
+    values = {
+        'id': lambda: review.pk,
+        'author': lambda: review.user.username,
+        'rating': lambda: review.rating,
+        'comment': lambda: review.comment,
+        'created_at': lambda: review.created_at,
+        'updated_at': lambda: review.updated_at,
+    }
+    return {name: values[name]() for name in fields}
+
+
+def _trips_state(request):
+    """Валидаторы списка поездок из БД; один запрос на запрос клиента.
+
+    Помеченная на удаление поездка получает новый updated_at (trip_purge),
+    поэтому максимум берется по всем строкам, а число - только по видимым.
+    """
+    state = getattr(request, '_api_trips_state', None)
+    if state is None:
+        state = request._api_trips_state = Trip.all_objects.aggregate(
+            updated_at=Max('updated_at'), count=Count('pk', filter=Q(deleted_at__isnull=True)),
+        )
+    return state
+
+
+def _trips_etag(request):
+    state = _trips_state(request)
+    updated_at = state['updated_at'].isoformat() if state['updated_at'] else ''
+    return _strong_etag(
+        'trips', updated_at, state['count'], fragment_cache.trips_version(),
+        request.GET.get('fields', ''), request.GET.get('cursor', ''),
+    )
+
+
+def _trips_last_modified(request):
+    updated_at = _trips_state(request)['updated_at']
+    version = _version_datetime(fragment_cache.trips_version())
+    return max(updated_at, version) if updated_at else version
+
+
+@require_safe
+@_api_view
+@condition(etag_func=_trips_etag, last_modified_func=_trips_last_modified)
+def trip_list(request):
+    """Лента поездок по курсору: ?cursor=...&fields=id,title"""
+    fields = requested_fields(request, TRIP_FIELDS)
+    trips = _select(Trip.objects.all(), fields, TRIP_FIELDS, TRIPS_ORDERING)
+    page = _page(request, trips, TRIPS_ORDERING, TRIPS_PER_PAGE)
+    return _json(request, {
+        'results': [serialize_trip(trip, fields) for trip in page],
+        'next': _next_url(request, page),
+    })
+
+
+@require_safe
+@_api_view
+@condition(
+    etag_func=lambda request, pk: _trip_etag(request, pk, 'trip', fragment_cache.DEPENDENCIES),
+    last_modified_func=lambda request, pk: _trip_last_modified(request, pk, fragment_cache.DEPENDENCIES),
+)
+def trip_detail(request, pk):
+    fields = requested_fields(request, TRIP_FIELDS)
+    trip = _select(Trip.objects.filter(pk=pk), fields, TRIP_FIELDS, ['id']).first()
+    if trip is None:
+        raise Http404('Поездка не найдена')
+    return _json(request, serialize_trip(trip, fields))
+
+
+@require_safe
+@_api_view
+@condition(
+    etag_func=lambda request, pk: _trip_etag(request, pk, 'photos', ['photos']),
+    last_modified_func=lambda request, pk: _trip_last_modified(request, pk, ['photos']),
+)
+def trip_photos(request, pk):
+    fields = requested_fields(request, PHOTO_FIELDS)
+    photos = _select(TripPhoto.objects.filter(trip_id=pk), fields, PHOTO_FIELDS, PHOTOS_ORDERING)
+    page = _page(request, photos, PHOTOS_ORDERING, PHOTOS_PER_PAGE)
+    return _json(request, {
+        'results': [serialize_photo(photo, fields) for photo in page],
+        'next': _next_url(request, page),
+    })
+
+
+@require_safe
+@_api_view
+@condition(
+    etag_func=lambda request, pk: _trip_etag(request, pk, 'reviews', ['reviews']),
+    last_modified_func=lambda request, pk: _trip_last_modified(request, pk, ['reviews']),
+)
+def trip_reviews(request, pk):
+    """Одобренные отзывы поездки"""
+    fields = requested_fields(request, REVIEW_FIELDS)
+    reviews = _select(
+        Review.objects.filter(trip_id=pk, is_approved=True), fields, REVIEW_FIELDS, REVIEWS_ORDERING
+    )
+    page = _page(request, reviews, REVIEWS_ORDERING, REVIEWS_PER_PAGE)
+    return _json(request, {
+        'results': [serialize_review(review, fields) for review in page],
+        'next': _next_url(request, page),
+    })
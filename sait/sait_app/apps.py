@@ -6,6 +6,4 @@ class SaitAppConfig(AppConfig):
     name = 'sait_app'
 
     def ready(self):
-        # Уберите эту строку, если удалили signals.py
-        # import sait_app.signals
-        pass
\ No newline at end of file
+        import sait_app.signals  # noqa: F401
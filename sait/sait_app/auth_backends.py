@@ -0,0 +1,93 @@
+"""Пользователь запроса из кэша вместе с профилем.
+
+AuthenticationMiddleware на каждый запрос читает auth_user, а шапка
+base.html - еще и профиль для аватара. CachedModelBackend хранит в кэше
+пользователя с уже загруженным user.profile, так что страница
+авторизованного пользователя (с сессиями cached_db) не делает ни одного
+запроса ради входа.
+
+Сохранение пользователя или профиля записывает свежую копию в кэш
+(signals.py), удаление - убирает ее. Изменения в обход save()
+(QuerySet.update) должны вызывать forget_user сами.
+
+Кэш обязан быть общим для всех процессов: иначе смена пароля или
+блокировка в одном воркере (или в manage.py changepassword) не доходит
+до остальных, и старые сессии живут до AUTH_USER_CACHE_TIMEOUT. Если кэш
+виден только своему процессу, бэкенд читает пользователя из БД, а
+gunicorn.conf.py не стартует несколько воркеров.
+"""
+import copy
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+from .throttle import PROCESS_LOCAL_BACKENDS
+
+
+def _cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def is_shared():
+    return settings.CACHES[settings.AUTH_USER_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _load(user_id):
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+    except UserModel.DoesNotExist:
+        return None
+    remember_user(user)
+    return user
+
+
+def _snapshot(user):
+    """Копия пользователя, у которой из связей загружен только профиль"""
+    profile = user._state.fields_cache.get('profile')
+    cached = copy.copy(user)
+    cached.__dict__.pop('_prefetched_objects_cache', None)
+    cached._state.fields_cache = {'profile': None}
+    if profile is not None:
+        cached_profile = copy.copy(profile)
+        cached_profile._state.fields_cache = {'user': cached}
+        cached._state.fields_cache['profile'] = cached_profile
+    return cached
+
+
+def remember_user(user):
+    """Кладет пользователя в кэш, если его профиль уже загружен (или точно отсутствует)"""
+    if not type(user).profile.is_cached(user):
+        forget_user(user.pk)
+        return
+    _cache().set(_key(user.pk), _snapshot(user), settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def forget_user(user_id):
+    _cache().delete(_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = _cache().get(_key(user_id)) if _use_cache() else None
+        if user is None:
+            user = _load(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await _cache().aget(_key(user_id)) if _use_cache() else None
+        if user is None:
+            user = await sync_to_async(_load)(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+
+def _use_cache():
+    # В тестах и runserver процесс один - его кэш и есть общий
+    return is_shared() or not settings.AUTH_USER_CACHE_REQUIRE_SHARED
@@ -0,0 +1,204 @@
+"""Хранение загруженных фото и аватаров по содержимому.
+
+BlobStorage при записи считает sha256 прямо по потоку и кладет файл под
+именем ``trip_photos/ab/cd/<sha256>.jpg``. Одинаковые загрузки получают
+одно имя: второй раз файл не пишется, строки TripPhoto просто указывают
+на уже лежащий блоб (и на его готовые уменьшенные копии).
+
+Сколько строк ссылается на блоб, хранит MediaBlob.refs. Счетчик растет
+при записи в хранилище и уменьшается в release(), когда строка удалена или
+сменила файл; файл удаляется после коммита, только если счетчик дошел до
+нуля. Прибавление и удаление идут под блокировкой строки MediaBlob, поэтому
+параллельная загрузка того же содержимого не потеряет файл. Расхождения
+(строки, созданные с готовым именем в обход хранилища) выравнивает команда
+media_blobs --rebuild. Файлы, загруженные до появления блобов, удаляются
+по-старому - проверкой ссылок (media_gc).
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter, defaultdict
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest
+
+STORAGE_ALIAS = 'blobs'
+# Приставка временных файлов: недописанные остатки подберет gc_media
+INCOMING_PREFIX = '.incoming-'
+
+
+def blob_storage():
+    """Хранилище для ImageField: вызывается при загрузке моделей"""
+    return storages[STORAGE_ALIAS]
+
+
+def blob_name(name, digest):
+    """trip_photos/2025/01/02/IMG.JPG -> trip_photos/ab/cd/<digest>.jpg"""
+    top = name.split('/', 1)[0]
+    extension = os.path.splitext(name)[1].lower()
+    return f'{top}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class BlobStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла - sha256 содержимого"""
+
+    def stage(self, name, content):
+        """Пишет содержимое во временный файл, считая sha256: (имя блоба, временный файл, размер).
+
+        Без обращений к БД - можно звать из пула потоков, а store() - в потоке запроса.
+        """
+        directory = self.path(name.split('/', 1)[0])
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=INCOMING_PREFIX)
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(descriptor, 'wb') as output:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return blob_name(name, digest.hexdigest()), temporary, size
+
+    def store(self, staged):
+        """Берет ссылку на блоб и, если его еще нет, кладет файл на место; возвращает имя"""
+        name, temporary, size = staged
+        try:
+            with transaction.atomic():
+                _take(name, size)
+                self._place(name, temporary)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return name
+
+    def _save(self, name, content):
+        return self.store(self.stage(name, content))
+
+    def _place(self, name, temporary):
+        """Кладет файл блоба, если его еще нет; вызывать под блокировкой строки блоба"""
+        path = self.path(name)
+        if os.path.exists(path):
+            # Свежий mtime: gc_media не тронет блоб, пока строка загрузки не закоммичена
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary, path)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменит хэш содержимого, подбирать свободное не нужно
+        return name
+
+    def delete(self, name):
+        """Отказ от ссылки (откат неудачной загрузки): файл удалит последний отказ"""
+        release([name])
+
+
+def _take(name, size):
+    """+1 ссылка на блоб; строка блоба остается заблокированной до конца транзакции"""
+    from .models import MediaBlob
+    while True:
+        if MediaBlob.objects.filter(pk=name).update(refs=F('refs') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, refs=1)
+            return
+        except IntegrityError:
+            # Ту же строку только что вставила параллельная загрузка - повторяем UPDATE
+            continue
+
+
+def release(names):
+    """-1 ссылка за каждое имя, после коммита удаляет блобы без ссылок.
+
+    Возвращает имена, которых нет среди блобов: их файлы проверяет media_gc.
+    """
+    from .models import MediaBlob
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return []
+    tracked = set(MediaBlob.objects.filter(pk__in=counts).values_list('pk', flat=True))
+    by_count = defaultdict(list)
+    for name in sorted(tracked):
+        by_count[counts[name]].append(name)
+    for count, group in by_count.items():
+        MediaBlob.objects.filter(pk__in=group).update(refs=Greatest(F('refs') - count, Value(0)))
+    if tracked:
+        transaction.on_commit(lambda: collect(sorted(tracked)))
+    return sorted(set(counts) - tracked)
+
+
+def collect(names):
+    """Удаляет файлы и строки блобов с нулевым счетчиком; возвращает их число"""
+    from . import media_gc
+    from .models import MediaBlob
+    deleted = 0
+    for name in names:
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=name, refs=0).first()
+            if blob is None:
+                continue
+            # Строка могла получить имя в обход хранилища - счетчик ее не видел
+            live = media_gc.reference_counts([name])[name]
+            if live:
+                MediaBlob.objects.filter(pk=name).update(refs=live)
+                continue
+            # Уменьшенные копии пишет images.py через default_storage - удаляем там же
+            media_gc.delete_file(name)
+            blob.delete()
+            deleted += 1
+    return deleted
+
+
+def rebuild(batch_size=1000):
+    """Пересчитывает счетчики по строкам TripPhoto и UserProfile; возвращает (исправлено, удалено)"""
+    from . import media_gc
+    from .models import MediaBlob
+    fixed = 0
+    orphans = []
+    last_name = ''
+    while True:
+        blobs = list(
+            MediaBlob.objects.filter(pk__gt=last_name).order_by('pk').values_list('pk', 'refs')[:batch_size]
+        )
+        if not blobs:
+            break
+        last_name = blobs[-1][0]
+        counts = media_gc.reference_counts(name for name, _ in blobs)
+        for name, refs in blobs:
+            if counts[name] != refs:
+                MediaBlob.objects.filter(pk=name).update(refs=counts[name])
+                fixed += 1
+            if not counts[name]:
+                orphans.append(name)
+    return fixed, collect(orphans)
+
+
+def forget(names):
+    """Убирает строки блобов, чьи файлы удалил gc_media"""
+    from .models import MediaBlob
+    MediaBlob.objects.filter(pk__in=list(names)).delete()
+
+
+def stats():
+    """Сколько блобов и ссылок и сколько байт сэкономило совпадение содержимого"""
+    from .models import MediaBlob
+    totals = MediaBlob.objects.filter(refs__gt=0).aggregate(
+        blobs=Count('pk'),
+        references=Sum('refs'),
+        stored=Sum('size'),
+        uploaded=Sum(F('size') * F('refs')),
+    )
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['saved'] = totals['uploaded'] - totals['stored']
+    return totals
@@ -0,0 +1,115 @@
+"""Сжатие ответов brotli или gzip по Accept-Encoding.
+
+Страницы дневника - это в основном повторяющаяся разметка, и сжимаются они
+в 5-10 раз. CompressionMiddleware выбирает brotli, если клиент его
+принимает и установлен пакет brotli, иначе gzip, и сжимает как обычные,
+так и потоковые ответы (в том числе асинхронные под ASGI).
+
+gzip идет через функции django.utils.text, как в GZipMiddleware: они
+добавляют случайные байты против атаки BREACH. У brotli такого заголовка
+нет, поэтому страницы, в которые попал токен CSRF (формы), сжимаются gzip.
+Пакет brotli указан в requirements.txt.
+"""
+import re
+
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .staticfiles import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - без пакета brotli сжимаем только gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|javascript|xml|geo\+json|manifest\+json)|image/svg\+xml)'
+)
+# Короче этого сжатие не окупается
+MIN_LENGTH = 200
+# Баланс скорости и размера для сжатия на лету; 11 - только для статики заранее
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    # get_token() ставит этот флаг: токен CSRF есть в теле - только gzip со случайной длиной
+    has_csrf_token = request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+    if brotli is not None and 'br' in accepted and not has_csrf_token:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        # Отдаем кусок сразу, а не ждем заполнения буфера компрессора
+        data += compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def agzip_sequence(sequence, max_random_bytes):
+    # Как в GZipMiddleware: каждый кусок - отдельный член gzip, браузеры склеивают их сами
+    async for chunk in sequence:
+        yield compress_string(chunk, max_random_bytes=max_random_bytes)
+
+
+async def abrotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    async for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        if response.status_code == 206 or response.has_header('Content-Encoding'):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < MIN_LENGTH:
+            return response
+        # Vary ставится и без сжатия: кэш не должен отдать несжатый ответ тому, кто ждет сжатый
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = (
+                    abrotli_sequence(response.streaming_content) if encoding == 'br'
+                    else agzip_sequence(response.streaming_content, self.max_random_bytes)
+                )
+            else:
+                response.streaming_content = (
+                    brotli_sequence(response.streaming_content) if encoding == 'br'
+                    else compress_sequence(response.streaming_content, max_random_bytes=self.max_random_bytes)
+                )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Сжатое тело уже не совпадает побайтно: сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,103 @@
+"""Справочник стран: ISO-коды, названия и приблизительные центроиды.
+
+Формат: (iso2, iso3, название, name_en, широта, долгота, доп. синонимы).
+Используется миграцией справочника и командой sync_countries.
+"""
+
+COUNTRIES = [
+    ('RU', 'RUS', 'Россия', 'Russia', 61.52, 105.32, ('рф', 'российская федерация', 'russian federation')),
+    ('BY', 'BLR', 'Беларусь', 'Belarus', 53.71, 27.95, ('белоруссия', 'республика беларусь')),
+    ('UA', 'UKR', 'Украина', 'Ukraine', 48.38, 31.17, ()),
+    ('KZ', 'KAZ', 'Казахстан', 'Kazakhstan', 48.02, 66.92, ()),
+    ('UZ', 'UZB', 'Узбекистан', 'Uzbekistan', 41.38, 64.59, ()),
+    ('KG', 'KGZ', 'Киргизия', 'Kyrgyzstan', 41.20, 74.77, ('кыргызстан',)),
+    ('TJ', 'TJK', 'Таджикистан', 'Tajikistan', 38.86, 71.28, ()),
+    ('TM', 'TKM', 'Туркменистан', 'Turkmenistan', 38.97, 59.56, ('туркмения',)),
+    ('AZ', 'AZE', 'Азербайджан', 'Azerbaijan', 40.14, 47.58, ()),
+    ('AM', 'ARM', 'Армения', 'Armenia', 40.07, 45.04, ()),
+    ('GE', 'GEO', 'Грузия', 'Georgia', 42.32, 43.36, ()),
+    ('MD', 'MDA', 'Молдавия', 'Moldova', 47.41, 28.37, ('молдова',)),
+    ('EE', 'EST', 'Эстония', 'Estonia', 58.60, 25.01, ()),
+    ('LV', 'LVA', 'Латвия', 'Latvia', 56.88, 24.60, ()),
+    ('LT', 'LTU', 'Литва', 'Lithuania', 55.17, 23.88, ()),
+    ('FI', 'FIN', 'Финляндия', 'Finland', 61.92, 25.75, ()),
+    ('SE', 'SWE', 'Швеция', 'Sweden', 60.13, 18.64, ()),
+    ('NO', 'NOR', 'Норвегия', 'Norway', 60.47, 8.47, ()),
+    ('DK', 'DNK', 'Дания', 'Denmark', 56.26, 9.50, ()),
+    ('IS', 'ISL', 'Исландия', 'Iceland', 64.96, -19.02, ()),
+    ('GB', 'GBR', 'Великобритания', 'United Kingdom', 55.38, -3.44, ('англия', 'uk', 'great britain', 'britain', 'england')),
+    ('IE', 'IRL', 'Ирландия', 'Ireland', 53.41, -8.24, ()),
+    ('FR', 'FRA', 'Франция', 'France', 46.23, 2.21, ()),
+    ('DE', 'DEU', 'Германия', 'Germany', 51.17, 10.45, ()),
+    ('NL', 'NLD', 'Нидерланды', 'Netherlands', 52.13, 5.29, ('голландия', 'holland')),
+    ('BE', 'BEL', 'Бельгия', 'Belgium', 50.50, 4.47, ()),
+    ('LU', 'LUX', 'Люксембург', 'Luxembourg', 49.82, 6.13, ()),
+    ('CH', 'CHE', 'Швейцария', 'Switzerland', 46.82, 8.23, ()),
+    ('AT', 'AUT', 'Австрия', 'Austria', 47.52, 14.55, ()),
+    ('IT', 'ITA', 'Италия', 'Italy', 41.87, 12.57, ()),
+    ('ES', 'ESP', 'Испания', 'Spain', 40.46, -3.75, ()),
+    ('PT', 'PRT', 'Португалия', 'Portugal', 39.40, -8.22, ()),
+    ('GR', 'GRC', 'Греция', 'Greece', 39.07, 21.82, ()),
+    ('CY', 'CYP', 'Кипр', 'Cyprus', 35.13, 33.43, ()),
+    ('MT', 'MLT', 'Мальта', 'Malta', 35.94, 14.38, ()),
+    ('PL', 'POL', 'Польша', 'Poland', 51.92, 19.15, ()),
+    ('CZ', 'CZE', 'Чехия', 'Czechia', 49.82, 15.47, ('czech republic',)),
+    ('SK', 'SVK', 'Словакия', 'Slovakia', 48.67, 19.70, ()),
+    ('HU', 'HUN', 'Венгрия', 'Hungary', 47.16, 19.50, ()),
+    ('RO', 'ROU', 'Румыния', 'Romania', 45.94, 24.97, ()),
+    ('BG', 'BGR', 'Болгария', 'Bulgaria', 42.73, 25.49, ()),
+    ('RS', 'SRB', 'Сербия', 'Serbia', 44.02, 21.01, ()),
+    ('ME', 'MNE', 'Черногория', 'Montenegro', 42.71, 19.37, ()),
+    ('HR', 'HRV', 'Хорватия', 'Croatia', 45.10, 15.20, ()),
+    ('SI', 'SVN', 'Словения', 'Slovenia', 46.15, 14.99, ()),
+    ('BA', 'BIH', 'Босния и Герцеговина', 'Bosnia and Herzegovina', 43.92, 17.68, ()),
+    ('MK', 'MKD', 'Северная Македония', 'North Macedonia', 41.61, 21.75, ('македония',)),
+    ('AL', 'ALB', 'Албания', 'Albania', 41.15, 20.17, ()),
+    ('TR', 'TUR', 'Турция', 'Turkey', 38.96, 35.24, ('türkiye', 'turkiye')),
+    ('IL', 'ISR', 'Израиль', 'Israel', 31.05, 34.85, ()),
+    ('JO', 'JOR', 'Иордания', 'Jordan', 30.59, 36.24, ()),
+    ('EG', 'EGY', 'Египет', 'Egypt', 26.82, 30.80, ()),
+    ('MA', 'MAR', 'Марокко', 'Morocco', 31.79, -7.09, ()),
+    ('TN', 'TUN', 'Тунис', 'Tunisia', 33.89, 9.54, ()),
+    ('AE', 'ARE', 'ОАЭ', 'United Arab Emirates', 23.42, 53.85, ('объединенные арабские эмираты', 'эмираты', 'uae')),
+    ('SA', 'SAU', 'Саудовская Аравия', 'Saudi Arabia', 23.89, 45.08, ()),
+    ('QA', 'QAT', 'Катар', 'Qatar', 25.35, 51.18, ()),
+    ('OM', 'OMN', 'Оман', 'Oman', 21.51, 55.92, ()),
+    ('IR', 'IRN', 'Иран', 'Iran', 32.43, 53.69, ()),
+    ('IN', 'IND', 'Индия', 'India', 20.59, 78.96, ()),
+    ('LK', 'LKA', 'Шри-Ланка', 'Sri Lanka', 7.87, 80.77, ()),
+    ('MV', 'MDV', 'Мальдивы', 'Maldives', 3.20, 73.22, ()),
+    ('NP', 'NPL', 'Непал', 'Nepal', 28.39, 84.12, ()),
+    ('CN', 'CHN', 'Китай', 'China', 35.86, 104.20, ('кнр',)),
+    ('MN', 'MNG', 'Монголия', 'Mongolia', 46.86, 103.85, ()),
+    ('JP', 'JPN', 'Япония', 'Japan', 36.20, 138.25, ()),
+    ('KR', 'KOR', 'Южная Корея', 'South Korea', 35.91, 127.77, ('корея', 'korea')),
+    ('VN', 'VNM', 'Вьетнам', 'Vietnam', 14.06, 108.28, ()),
+    ('TH', 'THA', 'Таиланд', 'Thailand', 15.87, 100.99, ('тайланд',)),
+    ('KH', 'KHM', 'Камбоджа', 'Cambodia', 12.57, 104.99, ()),
+    ('LA', 'LAO', 'Лаос', 'Laos', 19.86, 102.50, ()),
+    ('MY', 'MYS', 'Малайзия', 'Malaysia', 4.21, 101.98, ()),
+    ('SG', 'SGP', 'Сингапур', 'Singapore', 1.35, 103.82, ()),
+    ('ID', 'IDN', 'Индонезия', 'Indonesia', -0.79, 113.92, ('бали', 'bali')),
+    ('PH', 'PHL', 'Филиппины', 'Philippines', 12.88, 121.77, ()),
+    ('AU', 'AUS', 'Австралия', 'Australia', -25.27, 133.78, ()),
+    ('NZ', 'NZL', 'Новая Зеландия', 'New Zealand', -40.90, 174.89, ()),
+    ('US', 'USA', 'США', 'United States', 37.09, -95.71, ('соединенные штаты', 'америка', 'usa', 'united states of america')),
+    ('CA', 'CAN', 'Канада', 'Canada', 56.13, -106.35, ()),
+    ('MX', 'MEX', 'Мексика', 'Mexico', 23.63, -102.55, ()),
+    ('CU', 'CUB', 'Куба', 'Cuba', 21.52, -77.78, ()),
+    ('DO', 'DOM', 'Доминиканская Республика', 'Dominican Republic', 18.74, -70.16, ('доминикана',)),
+    ('BR', 'BRA', 'Бразилия', 'Brazil', -14.24, -51.93, ()),
+    ('AR', 'ARG', 'Аргентина', 'Argentina', -38.42, -63.62, ()),
+    ('CL', 'CHL', 'Чили', 'Chile', -35.68, -71.54, ()),
+    ('PE', 'PER', 'Перу', 'Peru', -9.19, -75.02, ()),
+    ('CO', 'COL', 'Колумбия', 'Colombia', 4.57, -74.30, ()),
+    ('EC', 'ECU', 'Эквадор', 'Ecuador', -1.83, -78.18, ()),
+    ('BO', 'BOL', 'Боливия', 'Bolivia', -16.29, -63.59, ()),
+    ('ZA', 'ZAF', 'ЮАР', 'South Africa', -30.56, 22.94, ('южно-африканская республика',)),
+    ('KE', 'KEN', 'Кения', 'Kenya', -0.02, 37.91, ()),
+    ('TZ', 'TZA', 'Танзания', 'Tanzania', -6.37, 34.89, ('занзибар', 'zanzibar')),
+    ('SC', 'SYC', 'Сейшелы', 'Seychelles', -4.68, 55.49, ('сейшельские острова',)),
+    ('MU', 'MUS', 'Маврикий', 'Mauritius', -20.35, 57.55, ()),
+    ('NA', 'NAM', 'Намибия', 'Namibia', -22.96, 18.49, ()),
+]
@@ -0,0 +1,127 @@
+"""Чтение с реплик PostgreSQL и «прилипание» к основной базе после записи.
+
+ReplicaMiddleware отправляет чтения запросов GET/HEAD на одну из реплик
+settings.DATABASE_REPLICAS. Первая же запись в запросе переключает его
+оставшиеся чтения на основную базу, а ответ ставит cookie: следующие
+DATABASE_STICKY_SECONDS секунд этот браузер читает только с основной
+базы и видит свои изменения, даже если реплика отстает.
+
+Вне запросов (команды, миграции, фоновые потоки без контекста запроса)
+и внутри транзакций все идет на основную базу.
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'sait_primary'
+# Сессии читаются с основной базы: отставшая реплика «разлогинила» бы пользователя
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# Изменяемое состояние запроса; потоки sync_to_async получают ту же ссылку
+_request_state = contextvars.ContextVar('sait_db_request_state', default=None)
+
+
+class _State:
+    __slots__ = ('read_alias', 'wrote')
+
+    def __init__(self, read_alias):
+        self.read_alias = read_alias
+        self.wrote = False
+
+
+def _sticky_until(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def choose_replica(request):
+    """Реплика для запроса или None, если читать нужно с основной базы"""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or request.method not in ('GET', 'HEAD'):
+        return None
+    if _sticky_until(request) > time.time():
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.read_alias is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Чтение внутри транзакции должно видеть ее же изменения
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит репликацией
+        return db not in settings.DATABASE_REPLICAS
+
+
+def _begin(request):
+    return _request_state.set(_State(choose_replica(request)))
+
+
+def _finish(request, response, token):
+    state = _request_state.get()
+    _request_state.reset(token)
+    if state.wrote:
+        window = settings.DATABASE_STICKY_SECONDS
+        response.set_cookie(
+            STICKY_COOKIE, f'{time.time() + window:.0f}',
+            max_age=window, httponly=True, samesite='Lax',
+        )
+    return response
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения на время запроса; работает под WSGI и ASGI"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _begin(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _request_state.reset(token)
+            raise
+        return _finish(request, response, token)
+
+    async def __acall__(self, request):
+        token = _begin(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _request_state.reset(token)
+            raise
+        return _finish(request, response, token)
@@ -23,7 +23,8 @@ class CustomUserCreationForm(UserCreationForm):
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        # Без учета регистра: по UPPER(email) есть индекс (миграция 0011_user_email_upper_index)
+        if User.objects.filter(email__iexact=email).exists():
             raise forms.ValidationError('Пользователь с таким email уже существует.')
         return email
 
@@ -96,4 +97,51 @@ class TripForm(forms.ModelForm):
             'start_date': 'Дата начала',
             'end_date': 'Дата окончания',
             'description': 'Рассказ о поездке',
-        }
\ No newline at end of file
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'Дата окончания не может быть раньше даты начала.')
+        return cleaned_data
+
+
+class TravelPeriodForm(forms.Form):
+    MODES = [
+        ('overlap', 'Были в пути хотя бы день'),
+        ('within', 'Поездка целиком в эти даты'),
+        ('spanning', 'Были в пути все эти дни'),
+    ]
+
+    date_from = forms.DateField(label='С', widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    date_to = forms.DateField(
+        label='По', required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        help_text='Без второй даты - кто был в пути в этот день',
+    )
+    mode = forms.ChoiceField(
+        label='Условие', choices=MODES, required=False, widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    mine = forms.BooleanField(label='Только мои поездки', required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_to < date_from:
+            self.add_error('date_to', 'Конец промежутка не может быть раньше начала.')
+        return cleaned_data
+
+    def filter(self, trips):
+        """Поездки, подходящие под период; форма должна быть валидной"""
+        date_from = self.cleaned_data['date_from']
+        date_to = self.cleaned_data['date_to']
+        if date_to is None:
+            return trips.in_progress(date_from)
+        mode = self.cleaned_data['mode'] or 'overlap'
+        return {
+            'overlap': trips.overlapping,
+            'within': trips.within,
+            'spanning': trips.spanning,
+        }[mode](date_from, date_to)
@@ -0,0 +1,172 @@
+"""Кэш HTML-фрагментов карточек и разделов страницы поездки.
+
+Ключ фрагмента состоит из имени, Trip.updated_at и версий зависимостей
+поездки: ``photos`` (набор фото) и ``reviews`` (агрегаты отзывов). Версии
+хранятся в кэше и меняются сигналами моделей (см. signals.py), поэтому
+старые фрагменты просто перестают находиться и вытесняются по таймауту.
+
+Версии - метки time_ns, поэтому годятся и как время последнего изменения
+(Last-Modified в API). Отдельная версия ``trips`` относится ко всему
+списку поездок.
+
+Счетчики попаданий копятся в памяти процесса и попадают в кэш пачкой -
+раз в STATS_FLUSH_EVERY обращений или STATS_FLUSH_SECONDS секунд, а не
+записью в кэш на каждый фрагмент. Несброшенный остаток при остановке
+процесса теряется: счетчики приблизительные.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+PREFIX = 'diary:fragment'
+DEPENDENCIES = ('photos', 'reviews')
+HITS_KEY = f'{PREFIX}:stats:hits'
+TRIPS_VERSION_KEY = f'{PREFIX}:version:trips'
+MISSES_KEY = f'{PREFIX}:stats:misses'
+STATS_FLUSH_EVERY = 100
+STATS_FLUSH_SECONDS = 10
+
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def get_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _version_key(trip_id, dependency):
+    return f'{PREFIX}:version:{trip_id}:{dependency}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def bump(trip_ids, *dependencies):
+    """Меняет версии зависимостей; фрагменты с этими зависимостями устаревают"""
+    version = _new_version()
+    get_cache().set_many(
+        {
+            _version_key(trip_id, dependency): version
+            for trip_id in trip_ids
+            for dependency in dependencies or DEPENDENCIES
+        },
+        None,
+    )
+
+
+def forget(trip_ids):
+    get_cache().delete_many([
+        _version_key(trip_id, dependency)
+        for trip_id in trip_ids
+        for dependency in DEPENDENCIES
+    ])
+
+
+def versions(trip):
+    """Версии зависимостей поездки, один запрос к кэшу на объект"""
+    cached = getattr(trip, '_fragment_versions', None)
+    if cached is not None:
+        return cached
+    cache = get_cache()
+    keys = {dependency: _version_key(trip.pk, dependency) for dependency in DEPENDENCIES}
+    found = cache.get_many(keys.values())
+    result = {}
+    missing = {}
+    for dependency, key in keys.items():
+        if key in found:
+            result[dependency] = found[key]
+        else:
+            # Версию вытеснили из кэша: новая версия не совпадет ни с одним старым фрагментом
+            result[dependency] = missing[key] = _new_version()
+    if missing:
+        cache.set_many(missing, None)
+    trip._fragment_versions = result
+    return result
+
+
+def bump_trips():
+    """Меняет версию списка поездок: поездка добавлена, изменена или удалена"""
+    get_cache().set(TRIPS_VERSION_KEY, _new_version(), None)
+
+
+def trips_version():
+    cache = get_cache()
+    version = cache.get(TRIPS_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+        if not cache.add(TRIPS_VERSION_KEY, version, None):
+            version = cache.get(TRIPS_VERSION_KEY, version)
+    return version
+
+
+def fragment_key(name, trip, dependencies=()):
+    parts = [PREFIX, name, str(trip.pk), str(trip.updated_at.timestamp())]
+    if dependencies:
+        trip_versions = versions(trip)
+        parts.extend(f'{dependency}{trip_versions[dependency]}' for dependency in dependencies)
+    return ':'.join(parts)
+
+
+def _count(key):
+    with _pending_lock:
+        _pending[key] += 1
+        due = (
+            sum(_pending.values()) >= STATS_FLUSH_EVERY
+            or time.monotonic() - _flushed_at >= STATS_FLUSH_SECONDS
+        )
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Переносит накопленные в процессе счетчики в кэш: по incr на счетчик"""
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    cache = get_cache()
+    for key, count in pending.items():
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def get_fragment(key):
+    html = get_cache().get(key)
+    _count(MISSES_KEY if html is None else HITS_KEY)
+    return html
+
+
+def set_fragment(key, html):
+    get_cache().set(key, html, timeout())
+
+
+def stats():
+    flush_stats()
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    with _pending_lock:
+        _pending.clear()
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
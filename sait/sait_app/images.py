@@ -0,0 +1,136 @@
+"""Уменьшенные копии фотографий и аватаров.
+
+Копии лежат рядом с оригиналом: ``photo.jpg`` -> ``photo.220w.webp``,
+``photo.220w.jpg`` и т.д. Строятся в фоновом пуле потоков после коммита
+транзакции; пока они не готовы, шаблоны показывают оригинал.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from . import fragment_cache
+
+logger = logging.getLogger(__name__)
+
+# Ширины копий в пикселях для каждого типа изображений
+VARIANT_WIDTHS = {
+    'photo': (220, 800),
+    'avatar': (64, 128),
+}
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def variant_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{ext}'
+
+
+def variant_names(name, preset):
+    """Имена всех копий для оригинала ``name``"""
+    return [
+        variant_name(name, width, ext)
+        for width in VARIANT_WIDTHS[preset]
+        for ext in VARIANT_FORMATS
+    ]
+
+
+def build_variants(name, preset, storage=default_storage):
+    """Строит и сохраняет все копии оригинала ``name``"""
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    for width in VARIANT_WIDTHS[preset]:
+        resized = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for ext, (pil_format, options) in VARIANT_FORMATS.items():
+            target = variant_name(name, width, ext)
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def variant_srcset(field_file, preset, ext):
+    storage = field_file.storage
+    return ', '.join(
+        f'{storage.url(variant_name(field_file.name, width, ext))} {width}w'
+        for width in VARIANT_WIDTHS[preset]
+    )
+
+
+def delete_variants(name, preset, storage=default_storage):
+    for target in variant_names(name, preset):
+        if storage.exists(target):
+            storage.delete(target)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def build_trip_photo_variants(photo_id):
+    from .models import TripPhoto
+    photo = TripPhoto.objects.filter(pk=photo_id).only('trip_id', 'image').first()
+    if photo is None or not photo.image:
+        return
+    # Тот же блоб у другой строки - его копии уже лежат рядом с файлом
+    if not TripPhoto.objects.filter(image=photo.image.name, variants_ready=True).exists():
+        build_variants(photo.image.name, 'photo')
+    # Оригинал могли заменить, пока строились копии
+    if TripPhoto.objects.filter(pk=photo_id, image=photo.image.name).update(variants_ready=True):
+        fragment_cache.bump([photo.trip_id], 'photos')
+
+
+def build_avatar_variants(profile_id):
+    from .auth_backends import forget_user
+    from .models import UserProfile
+    profile = UserProfile.objects.filter(pk=profile_id).only('avatar', 'user_id').first()
+    if profile is None or not profile.avatar:
+        return
+    build_variants(profile.avatar.name, 'avatar')
+    if UserProfile.objects.filter(pk=profile_id, avatar=profile.avatar.name).update(avatar_variants_ready=True):
+        # update() идет в обход сигналов: копия в кэше входа еще без уменьшенных аватаров
+        forget_user(profile.user_id)
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Не удалось построить копии изображения: %s%r', func.__name__, args)
+    finally:
+        # Соединение потока пула не должно висеть открытым
+        connections.close_all()
+
+
+def schedule(func, *args):
+    """Ставит построение копий в очередь после коммита текущей транзакции"""
+    if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run, func, *args))
+    else:
+        transaction.on_commit(lambda: func(*args))
@@ -0,0 +1,114 @@
+"""Рейтинг лучших поездок, общий и по странам.
+
+Простое среднее ставит поездку с одним отзывом «5» выше поездки с сотней
+отзывов и средним 4.8. Поэтому поездки ранжируются по байесовскому
+среднему: к отзывам поездки добавляется LEADERBOARD_PRIOR_WEIGHT
+воображаемых отзывов со средней оценкой по всем поездкам.
+
+Оценки хранятся в TripRanking и читаются по индексу (country, -score) -
+страница рейтинга не агрегирует ни Review, ни Trip. Строка поездки
+пересчитывается вместе с агрегатами ее отзывов (refresh_trip_review_stats)
+из сохраненных Trip.approved_reviews_count и rating_sum. Общее среднее
+хранится в строке LeaderboardState - одно значение на все процессы - и
+ненадолго кэшируется; команда rebuild_leaderboard (по расписанию) считает
+его заново и выравнивает оценки, посчитанные со старым значением.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+MEAN_KEY = 'diary:leaderboard:mean'
+# Кэш может быть свой у каждого процесса: после rebuild остальные
+# увидят новое среднее не позже чем через MEAN_TIMEOUT секунд
+MEAN_TIMEOUT = 300
+STATE_PK = 1
+RANKED_FIELDS = ('pk', 'country_ref_id', 'approved_reviews_count', 'rating_sum')
+
+
+def bayesian_score(rating_sum, reviews_count, mean, weight):
+    return (weight * mean + rating_sum) / (weight + reviews_count)
+
+
+def global_mean():
+    """Средняя оценка по всем одобренным отзывам - из агрегатов Trip"""
+    from .models import Trip
+    totals = Trip.objects.order_by().aggregate(
+        ratings=Sum('rating_sum'), reviews=Sum('approved_reviews_count'),
+    )
+    if not totals['reviews']:
+        return 0.0
+    return totals['ratings'] / totals['reviews']
+
+
+def prior_mean():
+    """Среднее из LeaderboardState; первый вызов сохраняет текущее global_mean()"""
+    from .models import LeaderboardState
+    mean = cache.get(MEAN_KEY)
+    if mean is None:
+        state, _ = LeaderboardState.objects.get_or_create(pk=STATE_PK, defaults={'mean': global_mean})
+        mean = state.mean
+        cache.set(MEAN_KEY, mean, MEAN_TIMEOUT)
+    return mean
+
+
+def _ranked(trips):
+    return trips.filter(
+        approved_reviews_count__gte=settings.LEADERBOARD_MIN_REVIEWS
+    ).order_by().values_list(*RANKED_FIELDS)
+
+
+def _save(rows, mean):
+    from .models import TripRanking
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    TripRanking.objects.bulk_create(
+        [
+            TripRanking(trip_id=pk, country_id=country_id, reviews_count=count,
+                        score=bayesian_score(rating_sum, count, mean, weight))
+            for pk, country_id, count, rating_sum in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['trip'],
+        update_fields=['country', 'score', 'reviews_count', 'updated_at'],
+    )
+
+
+def refresh(trip_ids):
+    """Пересчитывает строки рейтинга поездок; выбывшие (нет отзывов, удалены) убирает"""
+    from .models import Trip, TripRanking
+    trip_ids = set(trip_ids) - {None}
+    if not trip_ids:
+        return
+    rows = list(_ranked(Trip.objects.filter(pk__in=trip_ids)))
+    TripRanking.objects.filter(trip_id__in=trip_ids - {row[0] for row in rows}).delete()
+    if rows:
+        _save(rows, prior_mean())
+
+
+def rebuild(batch_size=1000):
+    """Полный пересчет с новым общим средним; возвращает (среднее, число строк)"""
+    from .models import LeaderboardState, Trip, TripRanking
+    mean = global_mean()
+    LeaderboardState.objects.update_or_create(pk=STATE_PK, defaults={'mean': mean})
+    ranked = _ranked(Trip.objects.all())
+    total = 0
+    last_pk = 0
+    while True:
+        rows = list(ranked.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        _save(rows, mean)
+        total += len(rows)
+    TripRanking.objects.exclude(trip__in=ranked.values('pk')).delete()
+    transaction.on_commit(lambda: cache.set(MEAN_KEY, mean, MEAN_TIMEOUT))
+    return mean, total
+
+
+def top(country_id=None, limit=None):
+    """Лучшие поездки - срез индекса без агрегации"""
+    from .models import TripRanking
+    rankings = TripRanking.objects.filter(trip__deleted_at__isnull=True).select_related('trip')
+    if country_id is not None:
+        rankings = rankings.filter(country_id=country_id)
+    return rankings.order_by('-score', 'trip_id')[:limit or settings.LEADERBOARD_SIZE]
@@ -0,0 +1,114 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+
+from .models import Review, Trip, TripPhoto, UserProfile
+from .pagination import CursorPaginator, InvalidCursor
+
+# Отзывы поездки отдаются порциями по частичному индексу review_trip_approved_idx
+TRIP_REVIEWS_ORDERING = ['-created_at', '-id']
+TRIP_REVIEWS_PER_PAGE = 20
+
+
+def _trip_photos():
+    return TripPhoto.objects.order_by('order', 'uploaded_at')
+
+
+def trip_reviews_page(pk, cursor=None):
+    """Порция одобренных отзывов поездки с пользователями и профилями"""
+    reviews = Review.objects.filter(trip_id=pk, is_approved=True).select_related('user__profile')
+    paginator = CursorPaginator(reviews, TRIP_REVIEWS_ORDERING, TRIP_REVIEWS_PER_PAGE)
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        return paginator.page()
+
+
+def load_trip_detail(pk, cursor=None):
+    """Данные страницы поездки за фиксированное число запросов.
+
+    Три запроса независимо от числа фото и отзывов: поездка с автором,
+    упорядоченные фото и первая порция одобренных отзывов с пользователями
+    и профилями (остальные догружаются по курсору). Рейтинг и число
+    отзывов берутся из сохраненных агрегатов Trip.
+    """
+    trip = get_object_or_404(
+        Trip.objects.select_related('user').prefetch_related(
+            Prefetch('photos', queryset=_trip_photos(), to_attr='photo_list'),
+        ),
+        pk=pk,
+    )
+    return {
+        'trip': trip,
+        'photos': trip.photo_list,
+        'reviews': trip_reviews_page(pk, cursor),
+    }
+
+
+def _pooled():
+    """Все базы работают через пул psycopg (OPTIONS['pool'], SAIT_DB_POOL=1)"""
+    return all(
+        connections.settings[alias].get('OPTIONS', {}).get('pool')
+        for alias in connections.settings
+    )
+
+
+def _own_connection(func):
+    def run():
+        try:
+            return func()
+        finally:
+            # Как в images._run: соединение потока пула не должно висеть открытым,
+            # иначе каждый поток держит свое. С пулом psycopg закрытие только
+            # возвращает соединение в пул
+            connections.close_all()
+    return run
+
+
+def _serial(funcs):
+    def run():
+        return [func() for func in funcs]
+    return run
+
+
+async def gather_queries(*funcs):
+    """Выполняет независимые синхронные выборки одновременно.
+
+    Асинхронный ORM Django выполняет запросы по очереди в одном потоке,
+    поэтому каждая выборка запускается в своем потоке пула со своим
+    соединением. Без пула psycopg это стоило бы нового подключения на
+    каждый запрос, поэтому выборки идут по очереди одним вызовом в общем
+    синхронном потоке с его постоянным соединением (CONN_MAX_AGE).
+    Результаты возвращаются в порядке аргументов.
+    """
+    if not _pooled():
+        return await sync_to_async(_serial(funcs))()
+    return await asyncio.gather(*(
+        sync_to_async(_own_connection(func), thread_sensitive=False)() for func in funcs
+    ))
+
+
+async def aload_trip_detail(pk, cursor=None):
+    """Асинхронная load_trip_detail: три запроса выполняются одновременно"""
+    trip, photos, reviews = await gather_queries(
+        lambda: get_object_or_404(Trip.objects.select_related('user'), pk=pk),
+        lambda: list(_trip_photos().filter(trip_id=pk)),
+        lambda: trip_reviews_page(pk, cursor),
+    )
+    return {'trip': trip, 'photos': photos, 'reviews': reviews}
+
+
+def load_profile(user):
+    """Профиль для шапки base.html; кладется в кэш связи user.profile"""
+    if not user.is_authenticated:
+        return None
+    if type(user).profile.is_cached(user):
+        # Пользователь из кэша входа (auth_backends.py) приходит с профилем
+        return user._state.fields_cache['profile']
+    profile = UserProfile.objects.filter(user=user).first()
+    if profile is not None:
+        user.profile = profile
+    return profile
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from sait_app.models import Trip
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Имитирует опрос API мобильным клиентом и считает долю ответов 304'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=500, help='Число запросов клиента')
+        parser.add_argument('--trips', type=int, default=20, help='Сколько поездок опрашивает клиент')
+        parser.add_argument(
+            '--change-rate',
+            type=float,
+            default=0.1,
+            help='Вероятность изменить случайную поездку перед очередным запросом',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        trip_ids = list(Trip.objects.order_by('-id').values_list('pk', flat=True)[:options['trips']])
+        if not trip_ids:
+            raise CommandError('Нет поездок: сначала запустите generate_scale_data.')
+        rnd = random.Random(options['seed'])
+        urls = [reverse('api_trip_list'), reverse('api_trip_list') + '?fields=id,title,country,rating']
+        for pk in trip_ids:
+            urls += [
+                reverse('api_trip_detail', args=[pk]),
+                reverse('api_trip_photos', args=[pk]),
+                reverse('api_trip_reviews', args=[pk]),
+            ]
+
+        samples = {200: [], 304: []}
+        queries = {200: [], 304: []}
+        etags = {}
+        client = Client()
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                    transaction.atomic():
+                for _ in range(options['polls']):
+                    if rnd.random() < options['change_rate']:
+                        # Правка поездки меняет ее ресурсы и список; откатывается в конце
+                        trip = Trip.objects.get(pk=rnd.choice(trip_ids))
+                        trip.title = f'{trip.title[:180]} *'
+                        trip.save()
+                    url = rnd.choice(urls)
+                    headers = {'HTTP_IF_NONE_MATCH': etags[url]} if url in etags else {}
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        response = client.get(url, **headers)
+                        elapsed = (time.perf_counter() - started) * 1000
+                    if response.status_code not in samples:
+                        raise CommandError(f'{url}: неожиданный ответ {response.status_code}')
+                    samples[response.status_code].append(elapsed)
+                    queries[response.status_code].append(len(context.captured_queries))
+                    etags[url] = response['ETag']
+                raise Rollback
+        except Rollback:
+            pass
+
+        total = options['polls']
+        self.stdout.write(f'Запросов: {total}, изменений: ~{options["change_rate"]:.0%} перед запросом')
+        for status, timings in samples.items():
+            if not timings:
+                continue
+            self.stdout.write(
+                f'{status}: {len(timings)} ({len(timings) / total:.0%}), '
+                f'медиана {statistics.median(timings):.2f} мс, '
+                f'запросов к БД в среднем {statistics.fmean(queries[status]):.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Доля ответов 304: {len(samples[304]) / total:.0%}'))
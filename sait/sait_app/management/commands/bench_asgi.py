@@ -0,0 +1,166 @@
+import asyncio
+import importlib
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, reverse
+
+from sait_app import urls as app_urls
+from sait_app.models import Trip
+
+SERVERS = ('wsgi', 'asgi')
+ROUTES = ('home', 'trip_detail', 'profile', 'my_reviews')
+
+
+@contextmanager
+def async_views(enabled):
+    """Пересобирает маршруты с асинхронными или синхронными страницами"""
+    def rebuild():
+        importlib.reload(app_urls)
+        clear_url_caches()
+
+    try:
+        with override_settings(ASYNC_VIEWS=enabled):
+            rebuild()
+            yield
+    finally:
+        rebuild()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность страниц для чтения под WSGI и ASGI при параллельной нагрузке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Запросов на страницу и сервер')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных клиентов')
+        parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+        parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+        parser.add_argument('--username', help='Пользователь для личных страниц (по умолчанию автор поездки)')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        trip_ids = list(Trip.objects.order_by('-id').values_list('pk', flat=True)[:50])
+        if not trip_ids:
+            raise CommandError('Нет поездок: сначала запустите generate_scale_data.')
+        user = self.bench_user(options['username'], trip_ids[0])
+        urls = {
+            'home': [reverse('home')],
+            'trip_detail': [reverse('trip_detail', args=[pk]) for pk in trip_ids],
+            'profile': [reverse('profile')],
+            'my_reviews': [reverse('my_reviews')],
+        }
+
+        results = []
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for server in options['servers']:
+                run = self.run_asgi if server == 'asgi' else self.run_wsgi
+                with async_views(server == 'asgi'):
+                    for route in options['routes']:
+                        result = run(user, urls[route], options)
+                        result.update(route=route, server=server)
+                        results.append(result)
+                        self.report(result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({
+                    'database': settings.DATABASES['default']['ENGINE'],
+                    'concurrency': options['concurrency'],
+                    'requests': options['requests'],
+                    'results': results,
+                }, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def bench_user(self, username, trip_id):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username!r} не найден.')
+        return Trip.objects.select_related('user').get(pk=trip_id).user
+
+    def worker_slices(self, options):
+        """Номера запросов каждого клиента: всего ровно --requests"""
+        concurrency = max(1, min(options['concurrency'], options['requests']))
+        return [range(worker, options['requests'], concurrency) for worker in range(concurrency)]
+
+    def clients(self, client_class, user, count):
+        """Вход до замера: первые запросы создают сессии и строку UserStats"""
+        clients = []
+        for _ in range(count):
+            clients.append(client_class())
+            clients[-1].force_login(user)
+        return clients
+
+    def run_wsgi(self, user, urls, options):
+        def worker(client, numbers):
+            timings, statuses = [], set()
+            try:
+                for number in numbers:
+                    started = time.perf_counter()
+                    response = client.get(urls[number % len(urls)])
+                    timings.append((time.perf_counter() - started) * 1000)
+                    statuses.add(response.status_code)
+            finally:
+                # Тестовый Client не закрывает соединения после запроса, а поток пула их бросил бы
+                connections.close_all()
+            return timings, statuses
+
+        slices = self.worker_slices(options)
+        clients = self.clients(Client, user, len(slices))
+        clients[0].get(urls[0])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(len(slices)) as pool:
+            outcomes = list(pool.map(worker, clients, slices))
+        return self.summary(outcomes, time.perf_counter() - started)
+
+    def run_asgi(self, user, urls, options):
+        async def worker(client, numbers):
+            timings, statuses = [], set()
+            for number in numbers:
+                started = time.perf_counter()
+                response = await client.get(urls[number % len(urls)])
+                timings.append((time.perf_counter() - started) * 1000)
+                statuses.add(response.status_code)
+            return timings, statuses
+
+        async def main(clients, slices):
+            await clients[0].get(urls[0])
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*(
+                worker(client, numbers) for client, numbers in zip(clients, slices)
+            ))
+            return outcomes, time.perf_counter() - started
+
+        slices = self.worker_slices(options)
+        # Не asyncio.run: синхронные части запросов идут в этом потоке и его соединении,
+        # а не в отдельном потоке asgiref, соединение которого никто не закроет
+        outcomes, elapsed = async_to_sync(main)(self.clients(AsyncClient, user, len(slices)), slices)
+        return self.summary(outcomes, elapsed)
+
+    def summary(self, outcomes, elapsed):
+        timings = [timing for worker_timings, _ in outcomes for timing in worker_timings]
+        statuses = set().union(*(worker_statuses for _, worker_statuses in outcomes))
+        cuts = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+        return {
+            'status': sorted(statuses),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(cuts[49], 2),
+            'p95_ms': round(cuts[94], 2),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f'{result["route"]:<14}{result["server"]:<6}{result["rps"]:>8.1f} запр/с  '
+            f'p50 {result["p50_ms"]:>8.1f}  p95 {result["p95_ms"]:>8.1f} мс  {result["status"]}'
+        )
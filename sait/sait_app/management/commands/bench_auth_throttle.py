@@ -0,0 +1,90 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+TARGETS = ('login', 'register')
+BENCH_CACHE = 'throttle_bench'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Имитирует перебор паролей и сравнивает CPU на вход и регистрацию без лимитов и с лимитами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200, help='Попыток на цель и режим')
+        parser.add_argument('--ips', type=int, default=2, help='С какого числа адресов идет атака')
+        parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+
+    def handle(self, *args, **options):
+        caches = {**settings.CACHES, BENCH_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': BENCH_CACHE,
+        }}
+        for target in options['targets']:
+            results = {}
+            for mode, rates in (('без лимитов', {}), ('с лимитами', settings.THROTTLE_RATES)):
+                # Свой пустой кэш на прогон: счетчики рабочего кэша не трогаем
+                caches[BENCH_CACHE]['LOCATION'] = f'{BENCH_CACHE}-{target}-{len(results)}'
+                with override_settings(
+                    CACHES=caches, THROTTLE_CACHE_ALIAS=BENCH_CACHE, THROTTLE_RATES=rates,
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                ):
+                    results[mode] = self.attack(target, options)
+                self.report(target, mode, results[mode], options['attempts'])
+            unprotected, protected = results.values()
+            saved = 1 - protected['cpu'] / unprotected['cpu'] if unprotected['cpu'] else 0
+            self.stdout.write(self.style.SUCCESS(f'{target}: сэкономлено CPU {saved:.0%}'))
+
+    def payload(self, target, number):
+        if target == 'login':
+            return reverse('login'), {'username': f'victim-{number % 7}', 'password': f'guess-{number}'}
+        return reverse('register'), {
+            'username': f'bot-{number}', 'email': f'bot-{number}@example.com',
+            'first_name': 'Бот', 'last_name': 'Ботов',
+            'password1': f'Str0ng-pass-{number}', 'password2': f'Str0ng-pass-{number}',
+        }
+
+    def attack(self, target, options):
+        statuses = {}
+        client = Client()
+        # Каждый ответ 429 иначе попадает в лог предупреждением
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            # Созданные «ботами» пользователи откатываются
+            with transaction.atomic():
+                cpu_started, started = time.process_time(), time.perf_counter()
+                for number in range(options['attempts']):
+                    url, data = self.payload(target, number)
+                    ip = f'203.0.113.{number % options["ips"] + 1}'
+                    response = client.post(url, data, REMOTE_ADDR=ip)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    client.logout()
+                result = {
+                    'cpu': time.process_time() - cpu_started,
+                    'wall': time.perf_counter() - started,
+                    'statuses': statuses,
+                }
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            request_logger.setLevel(level)
+        return result
+
+    def report(self, target, mode, result, attempts):
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(result['statuses'].items()))
+        self.stdout.write(
+            f'{target:<9}{mode:<13}CPU {result["cpu"]:>7.2f} с ({result["cpu"] / attempts * 1000:.1f} мс/попытку), '
+            f'время {result["wall"]:.2f} с, ответы {statuses}'
+        )
@@ -0,0 +1,108 @@
+import datetime
+import random
+import re
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from sait_app.models import Trip
+
+FIRST_DAY = datetime.date(2005, 1, 1)
+INDEX_SCAN_RE = re.compile(r'(?:Index (?:Only )?Scan using|Bitmap Index Scan on) (\S+)')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает фильтры по периоду поездки: сравнения start_date/end_date (B-tree) и daterange (GiST)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=1000000, help='Сколько поездок сгенерировать')
+        parser.add_argument('--years', type=int, default=20, help='На сколько лет разбросать даты начала')
+        parser.add_argument('--max-days', type=int, default=30, help='Наибольшая длительность поездки')
+        parser.add_argument('--window', type=int, default=14, help='Длина промежутка для пересечения, дней')
+        parser.add_argument('--samples', type=int, default=5, help='Сколько случайных дат проверить')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+        parser.add_argument('--keep', action='store_true', help='Не удалять сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Бенчмарк требует PostgreSQL.')
+        try:
+            with transaction.atomic():
+                self.generate(options)
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Сгенерированные данные удалены.')
+
+    def generate(self, options):
+        started = time.perf_counter()
+        author = User.objects.create_user(f'bench-periods-{time.monotonic_ns()}')
+        # Одним INSERT ... SELECT: через ORM миллион строк вставлялся бы минуты
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setseed(0.42)')
+            cursor.execute(
+                f'''
+                INSERT INTO {Trip._meta.db_table}
+                    (user_id, title, country, start_date, end_date, description,
+                     approved_reviews_count, rating_sum, created_at, updated_at)
+                SELECT %s, 'Поездка ' || n, 'Россия', day, day + (random() * %s)::int, '', 0, 0, now(), now()
+                FROM (
+                    SELECT n, %s::date + (random() * %s)::int AS day FROM generate_series(1, %s) AS n
+                ) AS generated
+                ''',
+                [author.pk, options['max_days'], FIRST_DAY, options['years'] * 365, options['trips']],
+            )
+            cursor.execute(f'ANALYZE {Trip._meta.db_table}')
+        self.stdout.write(f'Поездок: {options["trips"]} за {time.perf_counter() - started:.1f} с')
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            found = queryset.count()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, found
+
+    def plan(self, queryset):
+        """Какой индекс выбрал планировщик"""
+        used = INDEX_SCAN_RE.search(queryset.only('pk').explain())
+        if used is None:
+            return 'Seq Scan'
+        return 'GiST' if used.group(1) == 'trip_period_gist_idx' else 'B-tree'
+
+    def run(self, options):
+        rnd = random.Random(42)
+        trips = Trip.objects.all()
+        span = options['years'] * 365
+        self.stdout.write(
+            f'{"запрос":<30}{"B-tree, мс":>12}{"план":>10}{"GiST, мс":>12}{"план":>10}{"найдено":>10}{"ускорение":>12}'
+        )
+        for _ in range(options['samples']):
+            day = FIRST_DAY + datetime.timedelta(days=rnd.randint(0, span))
+            end = day + datetime.timedelta(days=options['window'] - 1)
+            cases = (
+                (f'в пути {day:%d.%m.%Y}',
+                 trips.filter(Q(start_date__lte=day, end_date__gte=day)), trips.in_progress(day)),
+                (f'пересекает {day:%d.%m}-{end:%d.%m.%Y}',
+                 trips.filter(Q(start_date__lte=end, end_date__gte=day)), trips.overlapping(day, end)),
+                (f'внутри {day:%d.%m}-{end:%d.%m.%Y}',
+                 trips.filter(Q(start_date__gte=day, end_date__lte=end)), trips.within(day, end)),
+            )
+            for label, baseline_qs, gist_qs in cases:
+                baseline, expected = self.measure(baseline_qs, options['repeat'])
+                gist, found = self.measure(gist_qs, options['repeat'])
+                if found != expected:
+                    raise CommandError(f'{label}: результаты расходятся ({expected} и {found})')
+                self.stdout.write(
+                    f'{label:<30}{baseline:>12.1f}{self.plan(baseline_qs):>10}{gist:>12.1f}'
+                    f'{self.plan(gist_qs):>10}{found:>10}{baseline / gist:>11.1f}x'
+                )
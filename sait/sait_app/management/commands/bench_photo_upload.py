@@ -0,0 +1,102 @@
+import datetime
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image
+
+from sait_app.models import Trip, TripPhoto
+from sait_app.uploads import save_trip_photos
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пакетную загрузку фото с прежним циклом TripPhoto.objects.create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Число фото в одной загрузке')
+        parser.add_argument('--size', type=int, default=2000, help='Ширина тестового фото, px')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Искусственная задержка записи в хранилище, мс (имитация сетевого хранилища)',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов каждого варианта')
+
+    def handle(self, *args, **options):
+        buffer = BytesIO()
+        Image.effect_noise((options['size'], options['size'] * 3 // 4), 64).convert('RGB').save(
+            buffer, 'JPEG', quality=90
+        )
+        payload = buffer.getvalue()
+        self.stdout.write(
+            f'{options["count"]} фото по {len(payload) // 1024} КБ, задержка хранилища '
+            f'{options["latency"]} мс'
+        )
+
+        media_root = tempfile.mkdtemp()
+        storage_save = default_storage._save
+        latency = options['latency'] / 1000
+
+        def slow_save(name, content):
+            time.sleep(latency)
+            return storage_save(name, content)
+
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                default_storage._save = slow_save
+                for label, upload in (('цикл create()', self.upload_loop), ('bulk', self.upload_bulk)):
+                    timings = [
+                        self.measure(upload, payload, options['count'])
+                        for _ in range(options['repeat'])
+                    ]
+                    best = min(timings)
+                    self.stdout.write(
+                        f'{label:>15}: лучшее {best:.3f} с, '
+                        f'{options["count"] / best:.1f} фото/с'
+                    )
+        finally:
+            default_storage._save = storage_save
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def measure(self, upload, payload, count):
+        files = [
+            SimpleUploadedFile(f'bench_{i}.jpg', payload, content_type='image/jpeg')
+            for i in range(count)
+        ]
+        try:
+            # Все строки откатываются, файлы удаляются вместе с временным MEDIA_ROOT
+            with transaction.atomic():
+                user = User.objects.create_user(f'bench-upload-{time.monotonic_ns()}')
+                trip = Trip.objects.create(
+                    user=user,
+                    title='Бенчмарк',
+                    country='Россия',
+                    start_date=datetime.date.today(),
+                    end_date=datetime.date.today(),
+                    description='',
+                )
+                started = time.perf_counter()
+                upload(trip, files)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            return elapsed
+
+    def upload_loop(self, trip, files):
+        for photo in files:
+            TripPhoto.objects.create(trip=trip, image=photo)
+
+    def upload_bulk(self, trip, files):
+        save_trip_photos(trip, files)
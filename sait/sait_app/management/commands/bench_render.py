@@ -0,0 +1,137 @@
+import copy
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from sait_app import compression
+from sait_app.models import Trip
+
+PAGES = ('home', 'trip_detail', 'profile')
+BENCH_CACHE = 'render_bench'
+LOADERS = {
+    True: ['sait_app.template_loaders.FilesystemLoader', 'sait_app.template_loaders.AppDirectoriesLoader'],
+    False: ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader'],
+}
+
+
+def templates_setting(minify):
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0].pop('APP_DIRS', None)
+    templates[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', LOADERS[minify])]
+    return templates
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время отрисовки и размер home, trip_detail и profile: без сжатия, gzip, brotli, с минификацией и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Замеров на страницу и вариант')
+        parser.add_argument('--warmup', type=int, default=3, help='Прогревочных запросов')
+        parser.add_argument('--trip', type=int, help='Поездка для trip_detail (по умолчанию с наибольшим числом отзывов)')
+        parser.add_argument('--username', help='Пользователь для profile (по умолчанию автор поездки)')
+        parser.add_argument('--pages', nargs='+', choices=PAGES, default=list(PAGES))
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        trip = self.bench_trip(options['trip'])
+        user = self.bench_user(options['username'], trip)
+        urls = {
+            'home': reverse('home'),
+            'trip_detail': reverse('trip_detail', args=[trip.pk]),
+            'profile': reverse('profile'),
+        }
+        encodings = ['identity', 'gzip'] + (['br'] if compression.brotli is not None else [])
+        if len(encodings) == 2:
+            self.stdout.write('Пакет brotli не установлен - замеряется только gzip.')
+
+        results = []
+        caches = {**settings.CACHES, BENCH_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': BENCH_CACHE,
+        }}
+        for minify in (False, True):
+            # Свой пустой кэш фрагментов: иначе варианты отдавали бы разметку друг друга
+            caches[BENCH_CACHE]['LOCATION'] = f'{BENCH_CACHE}-{minify}'
+            with override_settings(
+                TEMPLATES=templates_setting(minify), CACHES=caches, FRAGMENT_CACHE_ALIAS=BENCH_CACHE,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ):
+                client = Client()
+                client.force_login(user)
+                for page in options['pages']:
+                    for encoding in encodings:
+                        results.append(self.measure(client, page, urls[page], minify, encoding, options))
+                        self.report(results[-1])
+
+        self.summary(results, options['pages'], encodings)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({'requests': options['requests'], 'results': results}, output,
+                          ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def bench_trip(self, pk):
+        trips = Trip.objects.all()
+        if pk is not None:
+            trips = trips.filter(pk=pk)
+        else:
+            trips = trips.annotate(total=Count('reviews')).order_by('-total', 'pk')
+        trip = trips.select_related('user').first()
+        if trip is None:
+            raise CommandError('Нет поездок: сначала запустите generate_scale_data.')
+        return trip
+
+    def bench_user(self, username, trip):
+        if not username:
+            return trip.user
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {username!r} не найден.')
+
+    def measure(self, client, page, url, minify, encoding, options):
+        headers = {} if encoding == 'identity' else {'HTTP_ACCEPT_ENCODING': encoding}
+        for _ in range(options['warmup']):
+            client.get(url, **headers)
+        timings = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            response = client.get(url, **headers)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        body = response.content
+        return {
+            'page': page,
+            'minify': minify,
+            'encoding': response.get('Content-Encoding', 'identity'),
+            'median_ms': round(statistics.median(timings), 2),
+            'bytes': len(body),
+        }
+
+    def report(self, row):
+        minify = 'мин.' if row['minify'] else 'исх.'
+        self.stdout.write(
+            f'{row["page"]:<12}{minify:<6}{row["encoding"]:<10}'
+            f'медиана {row["median_ms"]:>7.2f} мс  {row["bytes"]:>8} байт'
+        )
+
+    def summary(self, results, pages, encodings):
+        sizes = {(row['page'], row['minify'], row['encoding']): row['bytes'] for row in results}
+        best = encodings[-1]
+        for page in pages:
+            plain = sizes[(page, False, 'identity')]
+            smallest = sizes.get((page, True, best))
+            if smallest:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{page}: {plain} -> {smallest} байт ({best}, с минификацией), '
+                    f'в {plain / smallest:.1f} раза меньше'
+                ))
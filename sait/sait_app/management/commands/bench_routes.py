@@ -0,0 +1,172 @@
+import json
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from sait_app.models import Review, Trip
+
+MODES = ('anonymous', 'user')
+
+
+class Command(BaseCommand):
+    help = 'Замеряет p50/p95/p99 и число запросов к БД для именованных страниц sait_app'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Замеров на страницу и режим')
+        parser.add_argument('--warmup', type=int, default=3, help='Прогревочных запросов')
+        parser.add_argument('--sample', type=int, default=20, help='Сколько разных поездок обходить')
+        parser.add_argument('--username', help='Пользователь для режима user (по умолчанию автор поездки)')
+        parser.add_argument('--routes', nargs='+', help='Только эти страницы')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения p95')
+
+    def handle(self, *args, **options):
+        trip_ids = self.sample_trips(options['sample'])
+        if not trip_ids:
+            raise CommandError('Нет поездок: сначала запустите generate_scale_data.')
+        user = self.bench_user(options['username'], trip_ids)
+        routes = self.routes(user, trip_ids)
+        if options['routes']:
+            unknown = set(options['routes']) - set(routes)
+            if unknown:
+                raise CommandError(f'Неизвестные страницы: {", ".join(sorted(unknown))}')
+            routes = {name: routes[name] for name in options['routes']}
+
+        results = []
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for mode in options['modes']:
+                client = Client()
+                if mode == 'user':
+                    client.force_login(user)
+                for name, urls in routes.items():
+                    results.append(self.measure(client, mode, name, urls, options))
+                    self.report(results[-1])
+
+        payload = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'user': user.username,
+            'trips': Trip.objects.order_by().count(),
+            'reviews': Review.objects.order_by().count(),
+            'requests': options['requests'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(payload, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def sample_trips(self, count):
+        # Равномерно по диапазону id, без ORDER BY random() по всей таблице
+        bounds = Trip.objects.order_by('pk').values_list('pk', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            return []
+        step = max(1, (last - first) // max(count, 1))
+        trip_ids = []
+        for pk in range(first, last + 1, step):
+            found = bounds.filter(pk__gte=pk).first()
+            if found is not None and found not in trip_ids:
+                trip_ids.append(found)
+            if len(trip_ids) >= count:
+                break
+        return trip_ids
+
+    def bench_user(self, username, trip_ids):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username!r} не найден.')
+        return Trip.objects.select_related('user').get(pk=trip_ids[0]).user
+
+    def routes(self, user, trip_ids):
+        """Имя страницы -> список адресов, которые обходятся по кругу"""
+        own_trip = Trip.objects.filter(user=user).values_list('pk', flat=True).first() or trip_ids[0]
+        own_review = Review.objects.filter(user=user).values_list('pk', flat=True).first()
+        routes = {
+            'home': [reverse('home')],
+            'trip_feed': [reverse('trip_feed')],
+            'trip_detail': [reverse('trip_detail', args=[pk]) for pk in trip_ids],
+            'travel_map': [reverse('travel_map')],
+            'travel_map_data': [reverse('travel_map_data'), reverse('travel_map_data') + '?scope=mine'],
+            'search': [reverse('search') + '?q=горы', reverse('search') + '?q=водопад'],
+            'login': [reverse('login')],
+            'register': [reverse('register')],
+            'profile': [reverse('profile')],
+            'profile_trips': [reverse('profile_trips')],
+            'profile_reviews': [reverse('profile_reviews')],
+            'edit_profile': [reverse('edit_profile')],
+            'my_reviews': [reverse('my_reviews')],
+            'my_reviews_feed': [reverse('my_reviews_feed')],
+            'add_trip': [reverse('add_trip')],
+            'edit_trip': [reverse('edit_trip', args=[own_trip])],
+            'delete_trip': [reverse('delete_trip', args=[own_trip])],
+        }
+        if own_review is not None:
+            routes['edit_review'] = [reverse('edit_review', args=[own_review])]
+            routes['delete_review'] = [reverse('delete_review', args=[own_review])]
+        # logout и delete_avatar принимают только POST и меняют состояние - не замеряем
+        return routes
+
+    def measure(self, client, mode, name, urls, options):
+        for index in range(options['warmup']):
+            client.get(urls[index % len(urls)])
+        timings = []
+        queries = []
+        statuses = set()
+        for index in range(options['requests']):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(urls[index % len(urls)])
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        cuts = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+        return {
+            'route': name,
+            'mode': mode,
+            'status': sorted(statuses),
+            'p50_ms': round(cuts[49], 2),
+            'p95_ms': round(cuts[94], 2),
+            'p99_ms': round(cuts[98], 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f'{result["route"]:<16}{result["mode"]:<10}'
+            f'p50 {result["p50_ms"]:>8.1f}  p95 {result["p95_ms"]:>8.1f}  p99 {result["p99_ms"]:>8.1f} мс  '
+            f'запросов {result["queries_median"]:g}/{result["queries_max"]}  {result["status"]}'
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as previous_file:
+            previous = {
+                (row['route'], row['mode']): row for row in json.load(previous_file)['results']
+            }
+        self.stdout.write(f'Сравнение p95 с {path}:')
+        for row in results:
+            old = previous.get((row['route'], row['mode']))
+            if old is None:
+                continue
+            change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            self.stdout.write(
+                f'{row["route"]:<16}{row["mode"]:<10}{old["p95_ms"]:>8.1f} -> {row["p95_ms"]:>8.1f} мс '
+                f'({change:+.0f}%), запросов {old["queries_max"]} -> {row["queries_max"]}'
+            )
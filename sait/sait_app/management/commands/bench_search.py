@@ -0,0 +1,116 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from sait_app import search
+from sait_app.models import Review, Trip
+
+WORDS = (
+    'горы озеро море пляж музей собор замок рынок вокзал поезд самолет палатка '
+    'поход экскурсия закат рассвет туман снег ледник водопад пустыня степь тайга '
+    'mountain lake beach museum castle market train flight hiking sunset glacier '
+    'waterfall desert island harbour temple street food coffee wine'
+).split()
+COUNTRIES = ['Россия', 'Грузия', 'Армения', 'Турция', 'Italy', 'Norway', 'Japan', 'Peru']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает полнотекстовый поиск (GIN) с поиском icontains на сгенерированном корпусе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=100000, help='Размер корпуса поездок')
+        parser.add_argument('--reviews', type=int, default=2, help='Отзывов на поездку')
+        parser.add_argument('--words', type=int, default=120, help='Слов в рассказе')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['водопад', 'glacier', 'закат море', 'ледник'],
+            help='Поисковые запросы',
+        )
+        parser.add_argument('--keep', action='store_true', help='Не удалять сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Бенчмарк требует PostgreSQL.')
+        try:
+            with transaction.atomic():
+                self.generate(options)
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Сгенерированные данные удалены.')
+
+    def generate(self, options):
+        rnd = random.Random(42)
+        started = time.perf_counter()
+        author = User.objects.create_user(f'bench-search-{time.monotonic_ns()}')
+        readers = User.objects.bulk_create(
+            User(username=f'{author.username}-{i}') for i in range(options['reviews'])
+        )
+        today = datetime.date.today()
+        batch = 5000
+        for offset in range(0, options['trips'], batch):
+            trips = Trip.objects.bulk_create(
+                Trip(
+                    user=author,
+                    title=' '.join(rnd.choices(WORDS, k=4)).capitalize(),
+                    country=rnd.choice(COUNTRIES),
+                    start_date=today,
+                    end_date=today,
+                    description=' '.join(rnd.choices(WORDS, k=options['words'])),
+                )
+                for _ in range(min(batch, options['trips'] - offset))
+            )
+            # bulk_create идет мимо сигналов; векторы отзывов считает ReviewQuerySet.bulk_create
+            search.refresh_search_vectors(trip.pk for trip in trips)
+            Review.objects.bulk_create(
+                Review(
+                    user=reader,
+                    trip=trip,
+                    rating=rnd.randint(1, 5),
+                    comment=' '.join(rnd.choices(WORDS, k=20)),
+                )
+                for trip in trips
+                for reader in readers
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Trip._meta.db_table}')
+            cursor.execute(f'ANALYZE {Review._meta.db_table}')
+        self.stdout.write(
+            f'Корпус: {options["trips"]} поездок, {options["trips"] * len(readers)} отзывов '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+
+    def measure(self, build_queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = list(build_queryset()[:10])
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, len(rows)
+
+    def run(self, options):
+        trips = Trip.objects.all()
+        self.stdout.write(f'{"запрос":<16}{"icontains, мс":>16}{"FTS, мс":>12}{"ускорение":>12}')
+        for text in options['queries']:
+            baseline, _ = self.measure(
+                lambda: search.search_trips_icontains(trips, text).order_by('-id'), options['repeat']
+            )
+            fts, found = self.measure(
+                lambda: search.search_trips(trips, text).order_by('-rank', '-id'), options['repeat']
+            )
+            self.stdout.write(
+                f'{text:<16}{baseline:>16.1f}{fts:>12.1f}{baseline / fts:>11.1f}x'
+                f'  (первая страница: {found})'
+            )
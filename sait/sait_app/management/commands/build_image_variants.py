@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from sait_app import images
+from sait_app.models import TripPhoto, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии для уже загруженных фотографий и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии, даже если они уже готовы',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Число параллельных потоков (1 - без пула, в текущем потоке)',
+        )
+
+    def handle(self, *args, **options):
+        photos = TripPhoto.objects.exclude(image='')
+        profiles = UserProfile.objects.exclude(avatar__isnull=True).exclude(avatar='')
+        if not options['force']:
+            photos = photos.filter(variants_ready=False)
+            profiles = profiles.filter(avatar_variants_ready=False)
+
+        tasks = [
+            (images.build_trip_photo_variants, pk)
+            for pk in photos.values_list('pk', flat=True).iterator()
+        ] + [
+            (images.build_avatar_variants, pk)
+            for pk in profiles.values_list('pk', flat=True).iterator()
+        ]
+
+        if options['workers'] > 1:
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+            results = pool.map(lambda task: self.build(*task, close_connection=True), tasks)
+        else:
+            pool = None
+            results = (self.build(*task) for task in tasks)
+
+        failed = 0
+        for done, ok in enumerate(results, 1):
+            if not ok:
+                failed += 1
+            if done % 100 == 0:
+                self.stdout.write(f'Обработано {done} из {len(tasks)}')
+        if pool is not None:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {len(tasks) - failed} изображений, ошибок: {failed}'
+        ))
+
+    def build(self, func, pk, close_connection=False):
+        try:
+            func(pk)
+            return True
+        except Exception as exc:
+            self.stderr.write(f'{func.__name__}({pk}): {exc}')
+            return False
+        finally:
+            if close_connection:
+                connections.close_all()
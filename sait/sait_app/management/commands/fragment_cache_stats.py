@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from sait_app import fragment_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает счетчики попаданий и промахов кэша фрагментов '
+        '(для LocMemCache счетчики видны только внутри процесса сервера; '
+        'воркеры сбрасывают их в кэш раз в несколько секунд)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики')
+
+    def handle(self, *args, **options):
+        stats = fragment_cache.stats()
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {stats["hit_ratio"]:.1%}'
+        )
+        if options['reset']:
+            fragment_cache.reset_stats()
+            self.stdout.write('Счетчики обнулены.')
@@ -0,0 +1,80 @@
+import json
+import os
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from sait_app import blobs, media_gc
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы фото и аватаров, на которые не ссылается ни одна строка (mark-and-sweep)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что было бы удалено')
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе стольких секунд: их строка может быть еще не закоммичена',
+        )
+        parser.add_argument('--chunk', type=int, default=1000, help='Файлов на одну проверку в БД')
+        parser.add_argument(
+            '--max-files',
+            type=int,
+            default=0,
+            help='Остановиться после стольких просмотренных файлов (0 - без ограничения)',
+        )
+        parser.add_argument(
+            '--state',
+            help='Файл отметки: следующий запуск продолжит с первого непройденного каталога',
+        )
+        parser.add_argument('--verbose-files', action='store_true', help='Выводить имена удаляемых файлов')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, FileSystemStorage):
+            raise CommandError('gc_media работает только с файловым хранилищем (FileSystemStorage).')
+        state_path = options['state']
+        after = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as state_file:
+                after = json.load(state_file).get('after')
+
+        dry_run = options['dry_run']
+        seen = deleted = freed = 0
+        finished = True
+        for directory, scanned, garbage, done in media_gc.sweep(options['min_age'], options['chunk'], after):
+            if done:
+                # Каталог пройден полностью - прерванный запуск продолжится со следующего
+                if state_path and not dry_run:
+                    self.save_state(state_path, directory)
+                continue
+            seen += scanned
+            for name, size in garbage:
+                if options['verbose_files']:
+                    self.stdout.write(name)
+                if not dry_run:
+                    default_storage.delete(name)
+                deleted += 1
+                freed += size
+            if garbage and not dry_run:
+                # Блоб без строк-ссылок (счетчик разошелся) удален - его строка тоже не нужна
+                blobs.forget(name for name, _ in garbage)
+            if options['max_files'] and seen >= options['max_files']:
+                finished = False
+                break
+        if finished and state_path and not dry_run and os.path.exists(state_path):
+            # Полный проход завершен, следующий начнется сначала
+            os.remove(state_path)
+
+        verb = 'Было бы удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {seen}. {verb}: {deleted}, {freed / 1024 / 1024:.1f} МБ'
+            + ('' if finished else ' (остановлено по --max-files)')
+        ))
+
+    def save_state(self, path, directory):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as state_file:
+            json.dump({'after': directory}, state_file, ensure_ascii=False)
+        os.replace(temporary, path)
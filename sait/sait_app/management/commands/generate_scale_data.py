@@ -0,0 +1,170 @@
+import datetime
+import random
+import time
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from PIL import Image
+
+from sait_app import images, search, travel_map
+from sait_app.countries_data import COUNTRIES
+from sait_app.models import Review, Trip, TripPhoto, UserProfile
+
+WORDS = (
+    'горы озеро море пляж музей собор замок рынок вокзал поезд самолет палатка '
+    'поход экскурсия закат рассвет туман снег ледник водопад пустыня степь тайга '
+    'город деревня остров побережье маршрут перевал долина каньон вулкан крепость '
+    'храм площадь набережная кафе ужин завтрак гид карта рюкзак дорога мост'
+).split()
+COMMENTS = [
+    'Отличный рассказ, спасибо!', 'Тоже хочу туда поехать.', 'Красивые фотографии.',
+    'Полезные советы по маршруту.', 'Сколько стоила поездка?', 'Были там в прошлом году.',
+]
+PLACEHOLDER_COLORS = ['#1E4388', '#FFDD00', '#2E7D32', '#C62828', '#6A1B9A', '#00838F', '#EF6C00', '#455A64']
+
+
+class Command(BaseCommand):
+    help = 'Генерирует пользователей, поездки, отзывы и фото для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50000, help='Число пользователей')
+        parser.add_argument('--trips', type=int, default=1000000, help='Число поездок')
+        parser.add_argument('--reviews', type=int, default=10000000, help='Число отзывов')
+        parser.add_argument('--photos-per-trip', type=int, default=2, help='Фото на поездку')
+        parser.add_argument('--placeholders', type=int, default=8, help='Сколько разных картинок-заглушек')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Поездок в одной транзакции')
+        parser.add_argument('--prefix', default='scale', help='Префикс имен пользователей')
+        parser.add_argument('--password', default='scale-pass', help='Пароль всех пользователей')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['reviews'] and options['users'] < 2:
+            raise CommandError('Для отзывов нужно хотя бы два пользователя.')
+        if User.objects.filter(username__startswith=f'{options["prefix"]}-').exists():
+            raise CommandError(f'Пользователи с префиксом {options["prefix"]!r} уже есть.')
+        self.rnd = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        user_ids = self.timed('Пользователи', options['users'], self.create_users, options)
+        placeholders = self.create_placeholders(options['placeholders'])
+        self.timed(
+            'Поездки, отзывы и фото',
+            options['trips'],
+            self.create_trips,
+            options, user_ids, placeholders,
+        )
+        self.timed('Агрегаты карты', options['trips'], call_command, 'rebuild_map_stats', stdout=self.stdout)
+        self.timed('Рейтинг поездок', options['trips'], call_command, 'rebuild_leaderboard', stdout=self.stdout)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.0f} с'))
+
+    def timed(self, label, count, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label}: {count} за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f}/с)')
+        return result
+
+    def create_users(self, options):
+        # Один хэш на всех: PBKDF2 для каждого пользователя занял бы часы
+        password = make_password(options['password'])
+        user_ids = []
+        batch = 5000
+        for offset in range(0, options['users'], batch):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    User(username=f'{options["prefix"]}-{number:07d}', password=password,
+                         email=f'{options["prefix"]}-{number:07d}@example.com')
+                    for number in range(offset, min(offset + batch, options['users']))
+                )
+                UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_placeholders(self, count):
+        """Несколько картинок на все фото: миллион файлов для замеров не нужен"""
+        names = []
+        for index in range(count):
+            buffer = BytesIO()
+            color = PLACEHOLDER_COLORS[index % len(PLACEHOLDER_COLORS)]
+            Image.new('RGB', (1200, 900), color).save(buffer, 'JPEG', quality=80)
+            name = default_storage.save(
+                f'trip_photos/placeholders/placeholder-{index}.jpg', ContentFile(buffer.getvalue())
+            )
+            images.build_variants(name, 'photo')
+            names.append(name)
+        return names
+
+    def trip_country(self):
+        row = self.rnd.choice(COUNTRIES)
+        # Часть авторов пишет страну по-английски, как в реальных данных
+        return row[3] if self.rnd.random() < 0.1 else row[2]
+
+    def make_trip(self, user_ids, today):
+        start = today - datetime.timedelta(days=self.rnd.randint(0, 3650))
+        country = self.trip_country()
+        return Trip(
+            user_id=self.rnd.choice(user_ids),
+            title=f'{" ".join(self.rnd.choices(WORDS, k=3)).capitalize()} - {country}',
+            country=country,
+            country_ref_id=travel_map.resolve_country(country),
+            start_date=start,
+            end_date=start + datetime.timedelta(days=self.rnd.randint(0, 20)),
+            description=' '.join(self.rnd.choices(WORDS, k=self.rnd.randint(40, 200))),
+        )
+
+    def review_count(self, options, users, index):
+        """Отзывы распределяются поровну, остаток достается первым поездкам"""
+        per_trip, remainder = divmod(options['reviews'], options['trips'])
+        return min(per_trip + (index < remainder), users - 1)
+
+    def create_trips(self, options, user_ids, placeholders):
+        today = datetime.date.today()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for offset in range(0, options['trips'], options['batch_size']):
+            size = min(options['batch_size'], options['trips'] - offset)
+            with transaction.atomic():
+                trips = Trip.objects.bulk_create(self.make_trip(user_ids, today) for _ in range(size))
+                reviews = []
+                for index, trip in enumerate(trips, start=offset):
+                    # Берем на одного больше, чтобы автор не комментировал свою поездку
+                    count = self.review_count(options, len(user_ids), index)
+                    readers = [
+                        reader for reader in self.rnd.sample(user_ids, count + 1)
+                        if reader != trip.user_id
+                    ][:count]
+                    for reader in readers:
+                        reviews.append(Review(
+                            user_id=reader,
+                            trip=trip,
+                            rating=self.rnd.choices((1, 2, 3, 4, 5), weights=(1, 2, 5, 10, 12))[0],
+                            comment=self.rnd.choice(COMMENTS),
+                            is_approved=self.rnd.random() < 0.95,
+                            created_at=now - datetime.timedelta(minutes=self.rnd.randint(0, 10 ** 6)),
+                        ))
+                # Агрегаты пересчитываются ниже одним UPDATE на пачку
+                Review.objects.bulk_create(reviews, batch_size=5000, refresh_stats=False)
+                TripPhoto.objects.bulk_create(
+                    (
+                        TripPhoto(trip=trip, image=self.rnd.choice(placeholders), order=order,
+                                  variants_ready=True)
+                        for trip in trips
+                        for order in range(options['photos_per_trip'])
+                    ),
+                    batch_size=5000,
+                )
+                trip_ids = [trip.pk for trip in trips]
+                Trip.objects.filter(pk__in=trip_ids).refresh_review_stats()
+                search.refresh_search_vectors(trip_ids)
+                search.refresh_review_vectors(Review.objects.filter(trip_id__in=trip_ids))
+            done = offset + size
+            if done % (options['batch_size'] * 50) == 0 or done == options['trips']:
+                self.stdout.write(f'  поездок: {done}')
@@ -0,0 +1,341 @@
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from sait_app import blobs, fragment_cache, search, travel_map, user_stats
+from sait_app.forms import ReviewForm, TripForm
+from sait_app.models import Review, Trip, TripPhoto
+from sait_app.uploads import IMAGE_SIGNATURES, max_photo_size
+
+REVIEW_COPY_FIELDS = ['user', 'trip', 'rating', 'comment', 'created_at', 'updated_at', 'is_approved']
+PHOTO_COPY_FIELDS = ['trip', 'image', 'caption', 'variants_ready', 'uploaded_at', 'order']
+SIGNATURES = tuple(signature for group in IMAGE_SIGNATURES.values() for signature in group)
+
+
+def copy_supported():
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def copy_rows(model, field_names, objs):
+    """Вставка через COPY FROM STDIN (psycopg 3); объекты не получают pk"""
+    fields = [model._meta.get_field(name) for name in field_names]
+    quote = connection.ops.quote_name
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields)
+    )
+    with connection.cursor() as cursor, cursor.copy(sql) as copy:
+        for obj in objs:
+            copy.write_row([field.get_prep_value(getattr(obj, field.attname)) for field in fields])
+
+
+class Command(BaseCommand):
+    help = 'Загружает поездки с фото и отзывами из JSONL или CSV пачками, с продолжением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv')
+        parser.add_argument('--format', choices=('auto', 'jsonl', 'csv'), default='auto')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Поездок в одной транзакции')
+        parser.add_argument(
+            '--method',
+            choices=('auto', 'bulk', 'copy'),
+            default='auto',
+            help='Вставка отзывов и фото: bulk_create или COPY (PostgreSQL с psycopg 3)',
+        )
+        parser.add_argument('--photos-root', default='.', help='Относительно чего указаны пути фото')
+        parser.add_argument('--workers', type=int, default=8, help='Потоков копирования фото')
+        parser.add_argument('--checkpoint', help='Файл отметки прогресса (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Начать с начала, не глядя на отметку')
+        parser.add_argument('--errors', help='Файл JSONL для отклоненных строк')
+        parser.add_argument('--show-errors', type=int, default=20, help='Сколько ошибок вывести')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format']
+        if file_format == 'auto':
+            file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if copy_supported() else 'bulk'
+        elif method == 'copy' and not copy_supported():
+            raise CommandError('COPY доступен только в PostgreSQL с драйвером psycopg 3.')
+        self.method = method
+        self.options = options
+        self.user_ids = {}
+        self.shown_errors = 0
+        self.errors_file = open(options['errors'], 'a', encoding='utf-8') if options['errors'] else None
+
+        self.checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        self.state = self.load_checkpoint(path, options['restart'])
+        if self.state['finished']:
+            self.stdout.write(f'{path} уже загружен (отметка {self.checkpoint_path}); --restart - загрузить заново.')
+            return
+        if self.state['line']:
+            self.stdout.write(f'Продолжаем после строки {self.state["line"]}')
+
+        started = time.perf_counter()
+        counts = {'trips': 0, 'reviews': 0, 'photos': 0, 'rejected': 0}
+        try:
+            records = self.read(path, file_format)
+            records = itertools.dropwhile(lambda item: item[0] <= self.state['line'], records)
+            while True:
+                batch = list(itertools.islice(records, options['batch_size']))
+                if not batch:
+                    break
+                batch_counts = self.import_batch(batch)
+                for key, value in batch_counts.items():
+                    counts[key] += value
+                    self.state['counts'][key] += value
+                self.state['line'] = batch[-1][0]
+                self.save_checkpoint()
+                self.stdout.write(f'  строк: {self.state["line"]}, поездок за запуск: {counts["trips"]}')
+        finally:
+            if self.errors_file:
+                self.errors_file.close()
+
+        # Агрегаты карты и рейтинг дешевле пересчитать целиком, чем для каждой пачки
+        call_command('rebuild_map_stats', stdout=self.stdout)
+        call_command('rebuild_leaderboard', stdout=self.stdout)
+        fragment_cache.bump_trips()
+        self.state['finished'] = True
+        self.save_checkpoint()
+        self.report(counts, time.perf_counter() - started)
+
+    # Отметка прогресса
+
+    def load_checkpoint(self, path, restart):
+        fresh = {
+            'input': os.path.abspath(path), 'line': 0, 'finished': False,
+            'counts': {'trips': 0, 'reviews': 0, 'photos': 0, 'rejected': 0},
+        }
+        if restart or not os.path.exists(self.checkpoint_path):
+            return fresh
+        with open(self.checkpoint_path, encoding='utf-8') as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state.get('input') != fresh['input']:
+            raise CommandError(f'Отметка {self.checkpoint_path} относится к другому файлу: {state.get("input")}')
+        return state
+
+    def save_checkpoint(self):
+        # Запись через временный файл: оборванная запись не портит отметку
+        temporary = f'{self.checkpoint_path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(self.state, checkpoint_file, ensure_ascii=False)
+        os.replace(temporary, self.checkpoint_path)
+
+    # Чтение и проверка
+
+    def read(self, path, file_format):
+        """Пары (номер строки, запись); номер - для отметки и сообщений об ошибках"""
+        with open(path, encoding='utf-8', newline='') as source:
+            if file_format == 'csv':
+                # Строка CSV - поездка; фото перечисляются в колонке photos через «|»
+                reader = csv.DictReader(source)
+                for record in reader:
+                    names = (record.pop('photos', None) or '').split('|')
+                    record['photos'] = [{'path': name.strip()} for name in names if name.strip()]
+                    yield reader.line_num, record
+                return
+            for number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    record = {'_error': f'некорректный JSON: {error}'}
+                yield number, record
+
+    def reject(self, number, errors):
+        self.state_rejected += 1
+        if self.errors_file:
+            self.errors_file.write(json.dumps({'line': number, 'errors': errors}, ensure_ascii=False) + '\n')
+        if self.shown_errors < self.options['show_errors']:
+            self.shown_errors += 1
+            self.stderr.write(f'Строка {number}: {errors}')
+
+    def validate(self, number, record):
+        """Поездка, отзывы и фото записи или None, если поездку загрузить нельзя"""
+        if '_error' in record:
+            self.reject(number, record['_error'])
+            return None
+        form = TripForm(data=record)
+        if not form.is_valid():
+            self.reject(number, form.errors.get_json_data())
+            return None
+        trip = form.save(commit=False)
+        trip.country_ref_id = travel_map.resolve_country(trip.country)
+
+        reviews = []
+        seen = set()
+        for index, item in enumerate(record.get('reviews') or []):
+            review_form = ReviewForm(data=item)
+            username = item.get('username')
+            if not review_form.is_valid() or not username or username in seen:
+                errors = review_form.errors.get_json_data() or 'нет автора или повторный отзыв'
+                self.reject(number, {f'reviews[{index}]': errors})
+                continue
+            seen.add(username)
+            review = review_form.save(commit=False)
+            created_at = parse_datetime(str(item.get('created_at') or ''))
+            if created_at is not None:
+                review.created_at = created_at if timezone.is_aware(created_at) else timezone.make_aware(created_at)
+            review.is_approved = item.get('is_approved', True) in (True, 1, '1', 'true')
+            reviews.append((username, review))
+
+        photos = []
+        for index, item in enumerate(record.get('photos') or []):
+            item = {'path': item} if isinstance(item, str) else item
+            source = os.path.join(self.options['photos_root'], item.get('path') or '')
+            caption = str(item.get('caption') or '')[:200]
+            photos.append((index, source, caption))
+        return {'number': number, 'username': record.get('username'), 'trip': trip,
+                'reviews': reviews, 'photos': photos}
+
+    def resolve_users(self, usernames):
+        """id пользователей по именам: один запрос на пачку, найденные запоминаются"""
+        missing = sorted(set(usernames) - self.user_ids.keys() - {None})
+        for offset in range(0, len(missing), 5000):
+            self.user_ids.update(
+                User.objects.filter(username__in=missing[offset:offset + 5000]).values_list('username', 'pk')
+            )
+
+    # Фото
+
+    def check_photo(self, source):
+        size = os.path.getsize(source)
+        if size > max_photo_size():
+            return 'слишком большой файл'
+        with open(source, 'rb') as image:
+            if not image.read(16).startswith(SIGNATURES):
+                return 'содержимое не похоже на изображение'
+        return None
+
+    def copy_photo(self, task):
+        photo, source = task
+        try:
+            problem = self.check_photo(source)
+        except OSError as error:
+            problem = f'не удалось прочитать файл: {error.strerror}'
+        if problem:
+            return None, f'{source}: {problem}'
+        field = TripPhoto._meta.get_field('image')
+        with open(source, 'rb') as image:
+            name = field.generate_filename(photo, os.path.basename(source))
+            if isinstance(field.storage, blobs.BlobStorage):
+                # Ссылку на блоб берет copy_photos: в потоках пула нет своих соединений с БД
+                return field.storage.stage(name, File(image)), None
+            return field.storage.save(name, File(image)), None
+
+    def copy_photos(self, items):
+        """Копирует фото пачки в MEDIA_ROOT параллельно"""
+        tasks = []
+        for item in items:
+            for order, source, caption in item['photos']:
+                tasks.append((TripPhoto(image='', caption=caption, order=order), source, item))
+        if not tasks:
+            return []
+        workers = max(1, min(self.options['workers'], len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self.copy_photo, [(photo, source) for photo, source, _ in tasks]))
+        storage = TripPhoto._meta.get_field('image').storage
+        copied = []
+        for (photo, _, item), (name, problem) in zip(tasks, results):
+            if problem:
+                self.reject(item['number'], {'photos': problem})
+                continue
+            if isinstance(name, tuple):
+                name = storage.store(name)
+            photo.image = name
+            photo.trip = item['trip']
+            copied.append(photo)
+        return copied
+
+    # Загрузка пачки
+
+    def import_batch(self, batch):
+        self.state_rejected = 0
+        items = [item for item in (self.validate(number, record) for number, record in batch) if item]
+        self.resolve_users(
+            [item['username'] for item in items]
+            + [username for item in items for username, _ in item['reviews']]
+        )
+        accepted = []
+        for item in items:
+            author_id = self.user_ids.get(item['username'])
+            if author_id is None:
+                self.reject(item['number'], {'username': f'пользователь {item["username"]!r} не найден'})
+                continue
+            item['trip'].user_id = author_id
+            accepted.append(item)
+
+        photos = self.copy_photos(accepted)
+        try:
+            with transaction.atomic():
+                trips = Trip.objects.bulk_create([item['trip'] for item in accepted])
+                now = timezone.now()
+                reviews = []
+                for item in accepted:
+                    for username, review in item['reviews']:
+                        reviewer_id = self.user_ids.get(username)
+                        if reviewer_id is None:
+                            self.reject(item['number'], {'reviews': f'пользователь {username!r} не найден'})
+                            continue
+                        review.user_id = reviewer_id
+                        review.trip_id = item['trip'].pk
+                        review.updated_at = now
+                        reviews.append(review)
+                for photo in photos:
+                    photo.trip_id = photo.trip.pk
+                    photo.uploaded_at = now
+                if self.method == 'copy':
+                    copy_rows(Review, REVIEW_COPY_FIELDS, reviews)
+                    copy_rows(TripPhoto, PHOTO_COPY_FIELDS, photos)
+                else:
+                    # Агрегаты пересчитываются ниже одним UPDATE на пачку
+                    Review.objects.bulk_create(reviews, batch_size=5000, refresh_stats=False)
+                    TripPhoto.objects.bulk_create(photos, batch_size=5000)
+
+                trip_ids = [trip.pk for trip in trips]
+                Trip.objects.filter(pk__in=trip_ids).refresh_review_stats()
+                search.refresh_search_vectors(trip_ids)
+                search.refresh_review_vectors(Review.objects.filter(trip_id__in=trip_ids))
+                # Отзывы и фото сохранены в обход сигналов - версии для фрагментов и ETag API
+                fragment_cache.bump(trip_ids)
+                user_stats.refresh(
+                    {trip.user_id for trip in trips} | {review.user_id for review in reviews}
+                )
+        except Exception:
+            for photo in photos:
+                photo.image.storage.delete(photo.image.name)
+            raise
+        return {
+            'trips': len(trips), 'reviews': len(reviews), 'photos': len(photos),
+            'rejected': self.state_rejected,
+        }
+
+    def report(self, counts, elapsed):
+        self.stdout.write(f'Загрузка ({self.method}) за {elapsed:.1f} с:')
+        for key, label in (('trips', 'поездок'), ('reviews', 'отзывов'), ('photos', 'фото')):
+            self.stdout.write(f'  {label}: {counts[key]} ({counts[key] / max(elapsed, 1e-9):.0f}/с)')
+        self.stdout.write(f'  отклонено: {counts["rejected"]}')
+        if counts['photos']:
+            self.stdout.write('Уменьшенные копии фото: manage.py build_image_variants')
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего с начала файла: поездок {self.state["counts"]["trips"]}, '
+            f'отзывов {self.state["counts"]["reviews"]}, фото {self.state["counts"]["photos"]}'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from sait_app import blobs
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько места сэкономило хранение фото и аватаров по содержимому'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Сначала пересчитать счетчики ссылок по строкам и удалить блобы без ссылок',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Блобов на один запрос при пересчете')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            fixed, deleted = blobs.rebuild(options['batch_size'])
+            self.stdout.write(f'Исправлено счетчиков: {fixed}, удалено блобов без ссылок: {deleted}')
+        totals = blobs.stats()
+        self.stdout.write(
+            f'Блобов: {totals["blobs"]}, ссылок на них: {totals["references"]}\n'
+            f'Загружено: {totals["uploaded"] / 1024 / 1024:.1f} МБ, '
+            f'хранится: {totals["stored"] / 1024 / 1024:.1f} МБ'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Сэкономлено: {totals["saved"]} байт ({totals["saved"] / 1024 / 1024:.1f} МБ)'
+        ))
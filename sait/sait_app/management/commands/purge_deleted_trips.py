@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from sait_app import trip_purge
+from sait_app.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Дочищает поездки, помеченные на удаление, если фоновая очистка не завершилась'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Строк фото или отзывов за транзакцию')
+
+    def handle(self, *args, **options):
+        trip_ids = list(
+            Trip.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at').values_list('pk', flat=True)
+        )
+        for trip_id in trip_ids:
+            trip_purge.purge_trip(trip_id, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено поездок: {len(trip_ids)}'))
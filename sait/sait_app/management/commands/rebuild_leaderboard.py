@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sait_app import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает общее среднее и байесовские оценки рейтинга лучших поездок (запускать по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк рейтинга записывать одним INSERT',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mean, total = leaderboard.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поездок в рейтинге: {total}, средняя оценка по сайту: {mean:.3f}'
+        ))
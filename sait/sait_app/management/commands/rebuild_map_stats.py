@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from sait_app import travel_map
+from sait_app.models import CountryStats, Trip, UserCountryStats
+
+
+class Command(BaseCommand):
+    help = 'Обновляет справочник стран, привязку поездок к нему и агрегаты карты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк статистики вставлять за один INSERT',
+        )
+        parser.add_argument(
+            '--show-unknown',
+            type=int,
+            default=20,
+            help='Сколько нераспознанных написаний страны вывести',
+        )
+
+    def handle(self, *args, **options):
+        travel_map.sync_countries()
+
+        # Одно UPDATE на каждое различное написание страны
+        unknown = []
+        texts = Trip.objects.order_by().values_list('country', flat=True).distinct()
+        for text in texts.iterator():
+            country_id = travel_map.resolve_country(text)
+            if country_id is None:
+                unknown.append(text)
+            Trip.objects.filter(country=text).exclude(country_ref_id=country_id).update(
+                country_ref_id=country_id
+            )
+        for text in unknown[:options['show_unknown']]:
+            self.stdout.write(f'Не найдена в справочнике: {text!r}')
+
+        aggregates = {
+            'trips_count': Count('pk'),
+            'total_days': Sum(F('end_date') - F('start_date')),
+            'reviews_count': Sum('approved_reviews_count'),
+            'rating_sum': Sum('rating_sum'),
+        }
+        trips = Trip.objects.filter(country_ref__isnull=False).order_by()
+        with transaction.atomic():
+            UserCountryStats.objects.all().delete()
+            CountryStats.objects.all().delete()
+            UserCountryStats.objects.bulk_create(
+                (
+                    UserCountryStats(user_id=row['user_id'], country_id=row['country_ref_id'],
+                                     **self.stats(row))
+                    for row in trips.values('user_id', 'country_ref_id').annotate(**aggregates).iterator()
+                ),
+                batch_size=options['batch_size'],
+            )
+            CountryStats.objects.bulk_create(
+                (
+                    CountryStats(country_id=row['country_ref_id'], **self.stats(row))
+                    for row in trips.values('country_ref_id').annotate(**aggregates).iterator()
+                ),
+                batch_size=options['batch_size'],
+            )
+            transaction.on_commit(travel_map.bump_all)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Стран с поездками: {CountryStats.objects.count()}, '
+            f'нераспознанных написаний: {len(unknown)}'
+        ))
+
+    def stats(self, row):
+        duration = row['total_days']
+        return {
+            'trips_count': row['trips_count'],
+            'total_days': (duration.days if duration else 0) + row['trips_count'],
+            'reviews_count': row['reviews_count'] or 0,
+            'rating_sum': row['rating_sum'] or 0,
+        }
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from sait_app.models import Review, Trip
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные агрегаты отзывов у поездок и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправлять',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько поездок пересчитывать одним UPDATE',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='Сколько расхождений вывести подробно',
+        )
+
+    def handle(self, *args, **options):
+        approved = Review.objects.filter(
+            trip=OuterRef('pk'), is_approved=True
+        ).order_by().values('trip')
+        drifted = Trip.objects.order_by('pk').annotate(
+            actual_count=Coalesce(
+                Subquery(approved.annotate(total=Count('pk')).values('total')), 0
+            ),
+            actual_sum=Coalesce(
+                Subquery(approved.annotate(total=Sum('rating')).values('total')), 0
+            ),
+        ).filter(
+            ~Q(approved_reviews_count=F('actual_count')) | ~Q(rating_sum=F('actual_sum'))
+        ).values_list('pk', 'approved_reviews_count', 'rating_sum', 'actual_count', 'actual_sum')
+
+        total = 0
+        last_pk = 0
+        while True:
+            rows = list(drifted.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for pk, count, rating_sum, actual_count, actual_sum in rows:
+                total += 1
+                if total <= options['show']:
+                    self.stdout.write(
+                        f'Поездка #{pk}: отзывов {count} -> {actual_count}, '
+                        f'сумма оценок {rating_sum} -> {actual_sum}'
+                    )
+            if not options['check']:
+                Trip.objects.filter(pk__in=[row[0] for row in rows]).refresh_review_stats()
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено.'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'Найдено расхождений: {total}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено поездок: {total}'))
@@ -0,0 +1,184 @@
+"""Удаление файлов, на которые больше не ссылается ни одна строка.
+
+Один файл может принадлежать нескольким строкам TripPhoto (так делает
+generate_scale_data), поэтому файл удаляется только после проверки, что
+ссылок на него не осталось. Вместе с оригиналом удаляются его уменьшенные
+копии (images.py). Новые загрузки - блобы с общим счетчиком ссылок
+(blobs.py): release() отдает их blobs, а проверка ссылок остается для
+файлов, загруженных раньше.
+
+sweep() - обход каталогов загрузок для команды gc_media: файлы читаются
+потоком через os.scandir порциями, каталоги - в отсортированном порядке,
+так что обход можно прервать и продолжить с места остановки.
+"""
+import os
+import re
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .images import VARIANT_FORMATS, VARIANT_WIDTHS, variant_names
+
+# photo.220w.webp -> photo
+VARIANT_RE = re.compile(r'^(?P<root>.+)\.\d+w\.(?:%s)$' % '|'.join(VARIANT_FORMATS))
+# Сколько префиксов проверять одним запросом
+PREFIX_GROUP = 100
+
+
+def _fields():
+    from .models import TripPhoto, UserProfile
+    return ((TripPhoto, 'image'), (UserProfile, 'avatar'))
+
+
+def upload_dirs():
+    """Верхние каталоги загрузок: trip_photos, avatars"""
+    return sorted({
+        model._meta.get_field(field).upload_to.split('/')[0]
+        for model, field in _fields()
+    })
+
+
+def referenced(names):
+    """Какие из имен файлов упомянуты в TripPhoto.image или UserProfile.avatar"""
+    names = set(names)
+    found = set()
+    if not names:
+        return found
+    for model, field in _fields():
+        found.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return found
+
+
+def reference_counts(names):
+    """Сколько строк ссылается на каждое из имен: Counter"""
+    names = set(names)
+    counts = Counter()
+    if not names:
+        return counts
+    for model, field in _fields():
+        counts.update(dict(
+            model.objects.filter(**{f'{field}__in': names}).order_by()
+            .values(field).annotate(rows=Count('pk')).values_list(field, 'rows')
+        ))
+    return counts
+
+
+def referenced_roots(roots):
+    """Для каких корней копий (имя оригинала без расширения) оригинал еще в базе"""
+    roots = set(roots)
+    found = set()
+    ordered = sorted(roots)
+    for start in range(0, len(ordered), PREFIX_GROUP):
+        group = ordered[start:start + PREFIX_GROUP]
+        for model, field in _fields():
+            condition = Q()
+            for root in group:
+                condition |= Q(**{f'{field}__startswith': root + '.'})
+            for name in model.objects.filter(condition).values_list(field, flat=True):
+                found.add(os.path.splitext(name)[0])
+    return found & roots
+
+
+def delete_file(name, storage=default_storage):
+    """Удаляет оригинал и все возможные копии"""
+    targets = [name, *{target for preset in VARIANT_WIDTHS for target in variant_names(name, preset)}]
+    for target in targets:
+        if storage.exists(target):
+            storage.delete(target)
+
+
+def delete_unreferenced(names, storage=default_storage):
+    """Удаляет файлы из ``names``, на которые не осталось ссылок; возвращает их число"""
+    names = {name for name in names if name}
+    orphans = names - referenced(names)
+    for name in sorted(orphans):
+        delete_file(name, storage)
+    return len(orphans)
+
+
+def delete_unreferenced_on_commit(names):
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: delete_unreferenced(names))
+
+
+def release(names):
+    """Строки перестали ссылаться на файлы: блобам минус ссылка, прочие файлы - проверкой ссылок"""
+    from . import blobs
+    delete_unreferenced_on_commit(blobs.release(names))
+
+
+def _walk(root, relative):
+    """Каталоги в порядке обхода (сортировка по компонентам пути): (путь, имя)"""
+    try:
+        entries = sorted(
+            (entry.name for entry in os.scandir(root) if entry.is_dir(follow_symlinks=False))
+        )
+    except FileNotFoundError:
+        return
+    yield root, relative
+    for name in entries:
+        yield from _walk(os.path.join(root, name), f'{relative}/{name}')
+
+
+def _dir_key(relative):
+    return tuple(relative.split('/'))
+
+
+def _chunks(path, relative, size, max_mtime):
+    """Файлы каталога порциями [(имя в хранилище, размер)] - без чтения каталога целиком"""
+    chunk = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            # Свежий файл может принадлежать еще не закоммиченной строке
+            if stat.st_mtime > max_mtime:
+                continue
+            chunk.append((f'{relative}/{entry.name}', stat.st_size))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def find_garbage(files):
+    """Непомеченные файлы порции: [(имя, размер)] -> [(имя, размер)]"""
+    originals = {}
+    variants = {}
+    for name, size in files:
+        match = VARIANT_RE.match(name)
+        if match:
+            variants[name] = (match['root'], size)
+        else:
+            originals[name] = size
+
+    live = referenced(originals)
+    garbage = [(name, size) for name, size in originals.items() if name not in live]
+    # Живой оригинал из той же порции сразу сохраняет свои копии, остальные корни - запросом
+    live_roots = {os.path.splitext(name)[0] for name in live}
+    unknown = {root for root, _ in variants.values() if root not in live_roots}
+    live_roots |= referenced_roots(unknown)
+    garbage += [(name, size) for name, (root, size) in variants.items() if root not in live_roots]
+    return sorted(garbage)
+
+
+def sweep(min_mtime_age, chunk_size, after=None, storage=default_storage, now=None):
+    """Обходит каталоги загрузок и выдает (каталог, файлов в порции, мусор порции, каталог пройден).
+
+    ``after`` - последний полностью пройденный каталог прошлого запуска.
+    """
+    max_mtime = (now if now is not None else time.time()) - min_mtime_age
+    after_key = _dir_key(after) if after else None
+    for top in upload_dirs():
+        for path, relative in _walk(storage.path(top), top):
+            if after_key is not None and _dir_key(relative) <= after_key:
+                continue
+            for chunk in _chunks(path, relative, chunk_size, max_mtime):
+                yield relative, len(chunk), find_garbage(chunk), False
+            yield relative, 0, [], True
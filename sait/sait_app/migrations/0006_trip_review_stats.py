@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_review_stats(apps, schema_editor):
+    Trip = apps.get_model('sait_app', 'Trip')
+    Review = apps.get_model('sait_app', 'Review')
+    approved = Review.objects.filter(
+        trip=OuterRef('pk'), is_approved=True
+    ).order_by().values('trip')
+    Trip.objects.update(
+        approved_reviews_count=Coalesce(
+            Subquery(approved.annotate(total=Count('pk')).values('total')), 0
+        ),
+        rating_sum=Coalesce(
+            Subquery(approved.annotate(total=Sum('rating')).values('total')), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0005_userprofile_avatar_userprofile_bio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='approved_reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Одобренных отзывов'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0006_trip_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripphoto',
+            name='variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Копии готовы'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Копии аватара готовы'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Trip = apps.get_model('sait_app', 'Trip')
+    Review = apps.get_model('sait_app', 'Review')
+    comments = Review.objects.filter(
+        trip=OuterRef('pk'), is_approved=True
+    ).order_by().values('trip').annotate(
+        text=StringAgg('comment', delimiter=' ')
+    ).values('text')
+    vector = None
+    for config in ('russian', 'english'):
+        part = (
+            SearchVector('title', config=config, weight='A')
+            + SearchVector('country', config=config, weight='B')
+            + SearchVector('description', config=config, weight='C')
+            + SearchVector(Subquery(comments), config=config, weight='D')
+        )
+        vector = part if vector is None else vector + part
+    Trip.objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0007_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='sait_app_tr_search__a93699_gin'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,171 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+from sait_app.countries_data import COUNTRIES
+
+
+def normalize(text):
+    text = (text or '').lower().replace('ё', 'е').replace('.', '')
+    return ' '.join(text.split())
+
+
+def load_countries(apps, schema_editor):
+    Country = apps.get_model('sait_app', 'Country')
+    CountryAlias = apps.get_model('sait_app', 'CountryAlias')
+    Trip = apps.get_model('sait_app', 'Trip')
+    CountryStats = apps.get_model('sait_app', 'CountryStats')
+    UserCountryStats = apps.get_model('sait_app', 'UserCountryStats')
+
+    aliases = {}
+    for iso2, iso3, name, name_en, latitude, longitude, extra in COUNTRIES:
+        country = Country.objects.create(
+            iso2=iso2, iso3=iso3, name=name, name_en=name_en,
+            latitude=latitude, longitude=longitude,
+        )
+        for alias in (iso2, iso3, name, name_en, *extra):
+            aliases.setdefault(normalize(alias), country.pk)
+    CountryAlias.objects.bulk_create(
+        CountryAlias(alias=alias, country_id=country_id) for alias, country_id in aliases.items()
+    )
+
+    for text in Trip.objects.order_by().values_list('country', flat=True).distinct():
+        country_id = aliases.get(normalize(text))
+        if country_id is not None:
+            Trip.objects.filter(country=text).update(country_ref_id=country_id)
+
+    trips = Trip.objects.filter(country_ref__isnull=False).order_by()
+    aggregates = {
+        'trips_count': Count('pk'),
+        'total_days': Sum(F('end_date') - F('start_date')),
+        'reviews_count': Sum('approved_reviews_count'),
+        'rating_sum': Sum('rating_sum'),
+    }
+
+    def stats(row):
+        duration = row['total_days']
+        return {
+            'trips_count': row['trips_count'],
+            'total_days': (duration.days if duration else 0) + row['trips_count'],
+            'reviews_count': row['reviews_count'] or 0,
+            'rating_sum': row['rating_sum'] or 0,
+        }
+
+    UserCountryStats.objects.bulk_create(
+        UserCountryStats(user_id=row['user_id'], country_id=row['country_ref_id'], **stats(row))
+        for row in trips.values('user_id', 'country_ref_id').annotate(**aggregates)
+    )
+    CountryStats.objects.bulk_create(
+        CountryStats(country_id=row['country_ref_id'], **stats(row))
+        for row in trips.values('country_ref_id').annotate(**aggregates)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0008_trip_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iso2', models.CharField(max_length=2, unique=True, verbose_name='Код ISO 3166-1 alpha-2')),
+                ('iso3', models.CharField(max_length=3, unique=True, verbose_name='Код ISO 3166-1 alpha-3')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('name_en', models.CharField(max_length=100, verbose_name='Название (англ.)')),
+                ('latitude', models.FloatField(verbose_name='Широта центроида')),
+                ('longitude', models.FloatField(verbose_name='Долгота центроида')),
+            ],
+            options={
+                'verbose_name': 'Страна',
+                'verbose_name_plural': 'Страны',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CountryAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True, verbose_name='Написание')),
+            ],
+            options={
+                'verbose_name': 'Написание страны',
+                'verbose_name_plural': 'Написания стран',
+            },
+        ),
+        migrations.CreateModel(
+            name='CountryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trips_count', models.PositiveIntegerField(default=0, verbose_name='Поездок')),
+                ('total_days', models.PositiveIntegerField(default=0, verbose_name='Дней в поездках')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Одобренных отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика страны',
+                'verbose_name_plural': 'Статистика стран',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserCountryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trips_count', models.PositiveIntegerField(default=0, verbose_name='Поездок')),
+                ('total_days', models.PositiveIntegerField(default=0, verbose_name='Дней в поездках')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Одобренных отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика страны пользователя',
+                'verbose_name_plural': 'Статистика стран пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='country_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trips', to='sait_app.country', verbose_name='Страна из справочника'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['user', 'country_ref'], name='sait_app_tr_user_id_bda201_idx'),
+        ),
+        migrations.AddField(
+            model_name='countryalias',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='sait_app.country', verbose_name='Страна'),
+        ),
+        migrations.AddField(
+            model_name='countrystats',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait_app.country', verbose_name='Страна'),
+        ),
+        migrations.AddField(
+            model_name='usercountrystats',
+            name='country',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait_app.country', verbose_name='Страна'),
+        ),
+        migrations.AddField(
+            model_name='usercountrystats',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='country_stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='countrystats',
+            constraint=models.UniqueConstraint(fields=('country',), name='country_stats_country_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='usercountrystats',
+            constraint=models.UniqueConstraint(fields=('user', 'country'), name='user_country_stats_unique'),
+        ),
+        migrations.RunPython(load_countries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('sait_app', '0009_travel_map'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('trips_count', models.PositiveIntegerField(default=0, verbose_name='Поездок')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Отзывов')),
+                ('countries_count', models.PositiveIntegerField(default=0, verbose_name='Стран')),
+                ('total_days', models.PositiveIntegerField(default=0, verbose_name='Дней в поездках')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='sait_app_re_user_id_fe9f91_idx'),
+        ),
+    ]
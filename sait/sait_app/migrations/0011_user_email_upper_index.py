@@ -0,0 +1,28 @@
+from django.db import migrations
+
+INDEX_NAME = 'auth_user_email_upper_idx'
+
+
+def create_index(apps, schema_editor):
+    # email__iexact в PostgreSQL сравнивает UPPER(email::text) - индекс по тому же выражению
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON auth_user (UPPER(email::text))')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('sait_app', '0010_user_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_rankings(apps, schema_editor):
+    Trip = apps.get_model('sait_app', 'Trip')
+    TripRanking = apps.get_model('sait_app', 'TripRanking')
+    trips = Trip.objects.filter(deleted_at__isnull=True)
+    totals = trips.aggregate(ratings=Sum('rating_sum'), reviews=Sum('approved_reviews_count'))
+    if not totals['reviews']:
+        return
+    mean = totals['ratings'] / totals['reviews']
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    rows = trips.filter(approved_reviews_count__gte=settings.LEADERBOARD_MIN_REVIEWS).values_list(
+        'pk', 'country_ref_id', 'approved_reviews_count', 'rating_sum',
+    )
+    TripRanking.objects.bulk_create(
+        (
+            TripRanking(trip_id=pk, country_id=country_id, reviews_count=count,
+                        score=(weight * mean + rating_sum) / (weight + count))
+            for pk, country_id, count, rating_sum in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0013_review_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripRanking',
+            fields=[
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='sait_app.trip', verbose_name='Поездка')),
+                ('score', models.FloatField(verbose_name='Оценка рейтинга')),
+                ('reviews_count', models.PositiveIntegerField(verbose_name='Одобренных отзывов')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('country', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sait_app.country', verbose_name='Страна')),
+            ],
+            options={
+                'verbose_name': 'Место в рейтинге',
+                'verbose_name_plural': 'Рейтинг поездок',
+                'ordering': ['-score', 'trip'],
+                'indexes': [models.Index(fields=['-score', 'trip'], name='trip_ranking_score_idx'), models.Index(fields=['country', '-score', 'trip'], name='trip_ranking_country_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def normalize(text):
+    text = (text or '').lower().replace('ё', 'е').replace('.', '')
+    return ' '.join(text.split())
+
+
+def link_trips(apps, schema_editor):
+    """Привязывает поездки, чье написание страны добавили в справочник после 0009"""
+    Trip = apps.get_model('sait_app', 'Trip')
+    CountryAlias = apps.get_model('sait_app', 'CountryAlias')
+    CountryStats = apps.get_model('sait_app', 'CountryStats')
+    UserCountryStats = apps.get_model('sait_app', 'UserCountryStats')
+    UserStats = apps.get_model('sait_app', 'UserStats')
+    TripRanking = apps.get_model('sait_app', 'TripRanking')
+
+    aliases = dict(CountryAlias.objects.values_list('alias', 'country_id'))
+    unlinked = Trip.objects.filter(country_ref__isnull=True)
+    linked = 0
+    for text in list(unlinked.order_by().values_list('country', flat=True).distinct()):
+        country_id = aliases.get(normalize(text))
+        if country_id is not None:
+            linked += unlinked.filter(country=text).update(country_ref_id=country_id)
+    if not linked:
+        return
+
+    # Агрегаты стран пересобираются целиком, как в 0009
+    trips = Trip.objects.filter(country_ref__isnull=False, deleted_at__isnull=True).order_by()
+    aggregates = {
+        'trips_count': Count('pk'),
+        'total_days': Sum(F('end_date') - F('start_date')),
+        'reviews_count': Sum('approved_reviews_count'),
+        'rating_sum': Sum('rating_sum'),
+    }
+
+    def stats(row):
+        duration = row['total_days']
+        return {
+            'trips_count': row['trips_count'],
+            'total_days': (duration.days if duration else 0) + row['trips_count'],
+            'reviews_count': row['reviews_count'] or 0,
+            'rating_sum': row['rating_sum'] or 0,
+        }
+
+    UserCountryStats.objects.all().delete()
+    CountryStats.objects.all().delete()
+    UserCountryStats.objects.bulk_create(
+        UserCountryStats(user_id=row['user_id'], country_id=row['country_ref_id'], **stats(row))
+        for row in trips.values('user_id', 'country_ref_id').annotate(**aggregates)
+    )
+    CountryStats.objects.bulk_create(
+        CountryStats(country_id=row['country_ref_id'], **stats(row))
+        for row in trips.values('country_ref_id').annotate(**aggregates)
+    )
+    countries = UserCountryStats.objects.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+    UserStats.objects.update(
+        countries_count=Coalesce(Subquery(countries.annotate(total=Count('pk')).values('total')), 0),
+    )
+    TripRanking.objects.update(
+        country_id=Subquery(Trip.objects.filter(pk=OuterRef('trip_id')).values('country_ref_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0014_trip_ranking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='trip',
+            name='sait_app_tr_country_b52d49_idx',
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='country_ref',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trips', to='sait_app.country', verbose_name='Страна из справочника'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['country_ref', '-start_date', '-id'], name='trip_country_feed_idx'),
+        ),
+        migrations.RunPython(link_trips, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:39
+
+import django.contrib.postgres.indexes
+import sait_app.periods
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fix_reversed_dates(apps, schema_editor):
+    # Форма раньше не проверяла порядок дат; такие строки сломали бы daterange()
+    Trip = apps.get_model('sait_app', 'Trip')
+    Trip.objects.filter(end_date__lt=F('start_date')).update(
+        start_date=F('end_date'), end_date=F('start_date'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0015_trip_country_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_reversed_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trip',
+            constraint=models.CheckConstraint(condition=models.Q(('end_date__gte', models.F('start_date'))), name='trip_dates_ordered', violation_error_message='Дата окончания не может быть раньше даты начала.'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=django.contrib.postgres.indexes.GistIndex(sait_app.periods.Period(), name='trip_period_gist_idx'),
+        ),
+    ]
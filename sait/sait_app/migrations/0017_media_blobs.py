@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:46
+
+import sait_app.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0016_trip_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(verbose_name='Размер, байт')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Файл по содержимому',
+                'verbose_name_plural': 'Файлы по содержимому',
+            },
+        ),
+        migrations.AlterField(
+            model_name='tripphoto',
+            name='image',
+            field=models.ImageField(db_index=True, storage=sait_app.blobs.blob_storage, upload_to='trip_photos/%Y/%m/%d/', verbose_name='Фотография'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=sait_app.blobs.blob_storage, upload_to='avatars/%Y/%m/%d/', verbose_name='Аватар'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def _vector(weights):
+    vector = None
+    for config in ('russian', 'english'):
+        for field, weight in weights:
+            part = SearchVector(field, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def split_search_vectors(apps, schema_editor):
+    """Текст отзывов уходит из вектора поездки в векторы самих отзывов"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Trip = apps.get_model('sait_app', 'Trip')
+    Review = apps.get_model('sait_app', 'Review')
+    Review.objects.update(search_vector=_vector([('comment', 'D')]))
+    Trip.objects.update(search_vector=_vector([('title', 'A'), ('country', 'B'), ('description', 'C')]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait_app', '0018_leaderboard_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_approved', True)), fields=['search_vector'], name='review_search_idx'),
+        ),
+        migrations.RunPython(split_search_vectors, migrations.RunPython.noop),
+    ]
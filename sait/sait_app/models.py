@@ -1,8 +1,16 @@
+import collections
+
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 
+from . import blobs, fragment_cache, leaderboard, periods, search, travel_map, user_stats
+
 class UserProfile(models.Model):
     user = models.OneToOneField(
         User,
@@ -11,10 +19,17 @@ class UserProfile(models.Model):
     )
     avatar = models.ImageField(
         upload_to='avatars/%Y/%m/%d/',
+        storage=blobs.blob_storage,
+        db_index=True,
         verbose_name="Аватар",
         blank=True,
         null=True
     )
+    avatar_variants_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Копии аватара готовы"
+    )
     bio = models.TextField(
         verbose_name="О себе",
         max_length=500,
@@ -39,7 +54,165 @@ class UserProfile(models.Model):
             return self.avatar.url
         return '/static/default_avatar.png'
 
+class Country(models.Model):
+    """Справочник стран для карты: ISO-коды и центроид"""
+    iso2 = models.CharField(max_length=2, unique=True, verbose_name="Код ISO 3166-1 alpha-2")
+    iso3 = models.CharField(max_length=3, unique=True, verbose_name="Код ISO 3166-1 alpha-3")
+    name = models.CharField(max_length=100, verbose_name="Название")
+    name_en = models.CharField(max_length=100, verbose_name="Название (англ.)")
+    latitude = models.FloatField(verbose_name="Широта центроида")
+    longitude = models.FloatField(verbose_name="Долгота центроида")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Страна'
+        verbose_name_plural = 'Страны'
+
+    def __str__(self):
+        return self.name
+
+
+class CountryAlias(models.Model):
+    """Написание страны в свободном тексте Trip.country (нормализованное)"""
+    country = models.ForeignKey(
+        Country,
+        on_delete=models.CASCADE,
+        related_name='aliases',
+        verbose_name="Страна"
+    )
+    alias = models.CharField(max_length=100, unique=True, verbose_name="Написание")
+
+    class Meta:
+        verbose_name = 'Написание страны'
+        verbose_name_plural = 'Написания стран'
+
+    def __str__(self):
+        return self.alias
+
+
+class CountryStatsBase(models.Model):
+    """Агрегаты поездок по стране; средний рейтинг - по одобренным отзывам"""
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, verbose_name="Страна")
+    trips_count = models.PositiveIntegerField(default=0, verbose_name="Поездок")
+    total_days = models.PositiveIntegerField(default=0, verbose_name="Дней в поездках")
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name="Одобренных отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Сумма оценок")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def average_rating(self):
+        if self.reviews_count:
+            return round(self.rating_sum / self.reviews_count, 1)
+        return 0
+
+
+class CountryStats(CountryStatsBase):
+    class Meta:
+        verbose_name = 'Статистика страны'
+        verbose_name_plural = 'Статистика стран'
+        constraints = [
+            models.UniqueConstraint(fields=['country'], name='country_stats_country_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.country}: {self.trips_count}"
+
+
+class UserCountryStats(CountryStatsBase):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='country_stats',
+        verbose_name="Пользователь"
+    )
+
+    class Meta:
+        verbose_name = 'Статистика страны пользователя'
+        verbose_name_plural = 'Статистика стран пользователей'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'country'], name='user_country_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.country}: {self.trips_count}"
+
+
+class UserStats(models.Model):
+    """Счетчики личного кабинета, поддерживаются сигналами (см. user_stats.py)"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Пользователь"
+    )
+    trips_count = models.PositiveIntegerField(default=0, verbose_name="Поездок")
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name="Отзывов")
+    countries_count = models.PositiveIntegerField(default=0, verbose_name="Стран")
+    total_days = models.PositiveIntegerField(default=0, verbose_name="Дней в поездках")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return f"Статистика {self.user_id}"
+
+
+class TripQuerySet(models.QuerySet):
+    # Фильтры по периоду поездки (GiST по daterange, см. periods.py)
+    def in_progress(self, day):
+        return periods.in_progress(self, day)
+
+    def overlapping(self, start, end):
+        return periods.overlapping(self, start, end)
+
+    def within(self, start, end):
+        return periods.within(self, start, end)
+
+    def spanning(self, start, end):
+        return periods.spanning(self, start, end)
+
+    def refresh_review_stats(self):
+        """Пересчитывает сохраненные агрегаты одобренных отзывов одним UPDATE"""
+        approved = Review.objects.filter(
+            trip=OuterRef('pk'), is_approved=True
+        ).order_by().values('trip')
+        return self.update(
+            approved_reviews_count=Coalesce(
+                Subquery(approved.annotate(total=Count('pk')).values('total')), 0
+            ),
+            rating_sum=Coalesce(
+                Subquery(approved.annotate(total=Sum('rating')).values('total')), 0
+            ),
+        )
+
+
+def refresh_trip_review_stats(trip_ids):
+    """Пересчитывает агрегаты и рейтинг поездок, сбрасывает зависящие фрагменты"""
+    trip_ids = set(trip_ids) - {None}
+    if trip_ids:
+        Trip.objects.filter(pk__in=trip_ids).refresh_review_stats()
+        fragment_cache.bump(trip_ids, 'reviews')
+        fragment_cache.bump_trips()
+        travel_map.refresh_trips_country_stats(trip_ids)
+        leaderboard.refresh(trip_ids)
+
+
+class TripManager(models.Manager.from_queryset(TripQuerySet)):
+    def get_queryset(self):
+        # Поисковый вектор нужен только базе, в Python его не читаем.
+        # Помеченные на удаление поездки скрыты до фоновой очистки (trip_purge.py)
+        return super().get_queryset().defer('search_vector').filter(deleted_at__isnull=True)
+
+
 class Trip(models.Model):
+    # Пересчитываются в БД и не должны перезаписываться устаревшими значениями из памяти
+    DERIVED_FIELDS = ('approved_reviews_count', 'rating_sum', 'search_vector')
+
     user = models.ForeignKey(
         User, 
         on_delete=models.CASCADE, 
@@ -53,14 +226,44 @@ class Trip(models.Model):
         verbose_name="Страна",
         db_index=True
     )
+    # Страна из справочника, определяется по Trip.country (см. travel_map.py).
+    # Отдельный индекс не нужен - его заменяет trip_country_feed_idx
+    country_ref = models.ForeignKey(
+        Country,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        related_name='trips',
+        verbose_name="Страна из справочника"
+    )
     start_date = models.DateField(
         verbose_name="Дата начала",
         db_index=True
     )
     end_date = models.DateField(verbose_name="Дата окончания")
     description = models.TextField(verbose_name="Полный рассказ")
+    # Агрегаты одобренных отзывов, поддерживаются сигналами (см. signals.py)
+    approved_reviews_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Одобренных отзывов"
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Сумма оценок"
+    )
+    # Полнотекстовый индекс по поездке; отзывы - в Review.search_vector (см. search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Удалена")
+
+    objects = TripManager()
+    # Включая помеченные на удаление - для очистки
+    all_objects = models.Manager.from_queryset(TripQuerySet)()
 
     class Meta:
         ordering = ['-start_date']
@@ -68,27 +271,54 @@ class Trip(models.Model):
         verbose_name_plural = 'Поездки'
         indexes = [
             models.Index(fields=['user', 'start_date']),
-            models.Index(fields=['country']),
+            models.Index(fields=['user', 'country_ref']),
+            # Лента главной с фильтром по стране: тот же порядок, что HOME_FEED_ORDERING
+            models.Index(fields=['country_ref', '-start_date', '-id'], name='trip_country_feed_idx'),
             models.Index(fields=['created_at']),
             models.Index(fields=['start_date', 'end_date']),
+            GistIndex(periods.Period(), name='trip_period_gist_idx'),
+            GinIndex(fields=['search_vector']),
+            models.Index(
+                fields=['deleted_at'],
+                condition=models.Q(deleted_at__isnull=False),
+                name='trip_pending_purge_idx',
+            ),
+        ]
+        constraints = [
+            # Иначе daterange() для строки падает с ошибкой, а вместе с ней и весь запрос
+            models.CheckConstraint(
+                condition=models.Q(end_date__gte=models.F('start_date')),
+                name='trip_dates_ordered',
+                violation_error_message='Дата окончания не может быть раньше даты начала.',
+            ),
         ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DERIVED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('trip_detail', kwargs={'pk': self.pk})
 
     def average_rating(self):
         """Средний рейтинг поездки"""
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 1)
+        if self.approved_reviews_count:
+            return round(self.rating_sum / self.approved_reviews_count, 1)
         return 0
 
     def reviews_count(self):
         """Количество отзывов"""
-        return self.reviews.filter(is_approved=True).count()
+        return self.approved_reviews_count
 
     def duration_days(self):
         """Продолжительность поездки в днях"""
@@ -96,6 +326,56 @@ class Trip(models.Model):
             return (self.end_date - self.start_date).days + 1
         return 0
 
+class TripRanking(models.Model):
+    """Байесовская оценка поездки для рейтинга лучших (см. leaderboard.py)"""
+    trip = models.OneToOneField(
+        Trip,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name="Поездка"
+    )
+    # Копия Trip.country_ref: рейтинг страны читается одним индексом.
+    # Отдельный индекс по country не нужен - его заменяет trip_ranking_country_idx
+    country = models.ForeignKey(
+        Country,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='+',
+        verbose_name="Страна"
+    )
+    score = models.FloatField(verbose_name="Оценка рейтинга")
+    reviews_count = models.PositiveIntegerField(verbose_name="Одобренных отзывов")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score', 'trip']
+        verbose_name = 'Место в рейтинге'
+        verbose_name_plural = 'Рейтинг поездок'
+        indexes = [
+            models.Index(fields=['-score', 'trip'], name='trip_ranking_score_idx'),
+            models.Index(fields=['country', '-score', 'trip'], name='trip_ranking_country_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trip_id}: {self.score:.3f}"
+
+
+class LeaderboardState(models.Model):
+    """Общее среднее, с которым посчитаны оценки рейтинга (одна строка, см. leaderboard.py)"""
+    mean = models.FloatField(verbose_name="Средняя оценка")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+    def __str__(self):
+        return f"{self.mean:.3f}"
+
+
 class TripPhoto(models.Model):
     trip = models.ForeignKey(
         Trip, 
@@ -105,6 +385,9 @@ class TripPhoto(models.Model):
     )
     image = models.ImageField(
         upload_to='trip_photos/%Y/%m/%d/', 
+        storage=blobs.blob_storage,
+        # По имени считаются ссылки на блоб и ищутся готовые копии
+        db_index=True,
         verbose_name="Фотография"
     )
     caption = models.CharField(
@@ -112,6 +395,11 @@ class TripPhoto(models.Model):
         blank=True, 
         verbose_name="Подпись"
     )
+    variants_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Копии готовы"
+    )
     uploaded_at = models.DateTimeField(auto_now_add=True)
     order = models.PositiveIntegerField(
         default=0,
@@ -130,6 +418,84 @@ class TripPhoto(models.Model):
     def __str__(self):
         return f"Фото {self.trip.title} ({self.id})"
 
+
+class MediaBlob(models.Model):
+    """Файл, сохраненный по хэшу содержимого, и число строк, которые на него ссылаются"""
+    name = models.CharField(max_length=100, primary_key=True, verbose_name="Имя файла")
+    size = models.BigIntegerField(verbose_name="Размер, байт")
+    refs = models.PositiveIntegerField(default=0, verbose_name="Ссылок")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Файл по содержимому'
+        verbose_name_plural = 'Файлы по содержимому'
+
+    def __str__(self):
+        return f"{self.name} ({self.refs})"
+
+class ReviewQuerySet(models.QuerySet):
+    # Поля, от которых зависят агрегаты Trip и фрагменты отзывов
+    STATS_FIELDS = {'trip', 'trip_id', 'rating', 'is_approved', 'comment'}
+
+    def update(self, **kwargs):
+        changes_user = 'user' in kwargs or 'user_id' in kwargs
+        changes_stats = bool(self.STATS_FIELDS.intersection(kwargs))
+        if not changes_user and not changes_stats:
+            return super().update(**kwargs)
+        user_ids = set()
+        if changes_user:
+            user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+            new_user = kwargs.get('user', kwargs.get('user_id'))
+            user_ids.add(getattr(new_user, 'pk', new_user))
+        review_ids = []
+        if 'comment' in kwargs:
+            review_ids = list(self.values_list('pk', flat=True))
+        trip_ids = set()
+        if changes_stats:
+            trip_ids = set(self.order_by().values_list('trip_id', flat=True).distinct())
+            new_trip = kwargs.get('trip', kwargs.get('trip_id'))
+            if new_trip is not None:
+                trip_ids.add(getattr(new_trip, 'pk', new_trip))
+        rows = super().update(**kwargs)
+        if review_ids:
+            search.refresh_review_vectors(Review.objects.filter(pk__in=review_ids))
+        refresh_trip_review_stats(trip_ids)
+        user_stats.refresh(user_ids)
+        return rows
+
+    def approve(self):
+        """Одобряет отзывы одним UPDATE; агрегаты пересчитываются по разу на поездку"""
+        return self.filter(is_approved=False).update(is_approved=True)
+
+    def reject(self):
+        """Снимает одобрение одним UPDATE; агрегаты пересчитываются по разу на поездку"""
+        return self.filter(is_approved=True).update(is_approved=False)
+
+    def bulk_create(self, objs, *args, refresh_stats=True, **kwargs):
+        """refresh_stats=False - агрегаты пересчитает вызывающий код (массовая загрузка)"""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if refresh_stats:
+            search.refresh_review_vectors(Review.objects.filter(pk__in=[obj.pk for obj in objs]))
+            refresh_trip_review_stats(obj.trip_id for obj in objs)
+            for user_id, total in collections.Counter(obj.user_id for obj in objs).items():
+                user_stats.add(user_id, reviews_count=total)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if 'comment' in fields:
+            search.refresh_review_vectors(Review.objects.filter(pk__in=[obj.pk for obj in objs]))
+        if self.STATS_FIELDS.intersection(fields):
+            refresh_trip_review_stats(obj.trip_id for obj in objs)
+        return rows
+
+
+class ReviewManager(models.Manager.from_queryset(ReviewQuerySet)):
+    def get_queryset(self):
+        # Поисковый вектор нужен только базе, в Python его не читаем
+        return super().get_queryset().defer('search_vector')
+
+
 class Review(models.Model):
     RATING_CHOICES = [
         (1, '⭐ - Плохо'),
@@ -161,6 +527,13 @@ class Review(models.Model):
     created_at = models.DateTimeField(default=timezone.now, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_approved = models.BooleanField(default=True, verbose_name="Одобрен")
+    # Полнотекстовый индекс по тексту отзыва (см. search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ReviewManager()
+
+    # Пересчитывается в БД и не должно перезаписываться устаревшим значением из памяти
+    DERIVED_FIELDS = ('search_vector',)
 
     class Meta:
         ordering = ['-created_at']
@@ -169,14 +542,41 @@ class Review(models.Model):
         verbose_name_plural = 'Отзывы'
         indexes = [
             models.Index(fields=['user', 'trip']),
+            models.Index(fields=['user', '-created_at', '-id']),
             models.Index(fields=['created_at']),
             models.Index(fields=['rating']),
-            models.Index(fields=['is_approved']),
+            # Почти все отзывы одобрены: индекс по одному флагу бесполезен.
+            # Публичные ленты читают одобренные отзывы поездки от новых к старым,
+            # очередь модерации - неодобренные от старых к новым
+            models.Index(
+                fields=['trip', '-created_at', '-id'], name='review_trip_approved_idx',
+                condition=models.Q(is_approved=True),
+            ),
+            models.Index(
+                fields=['created_at', 'id'], name='review_pending_idx',
+                condition=models.Q(is_approved=False),
+            ),
+            # Поиск смотрит только одобренные отзывы
+            GinIndex(
+                fields=['search_vector'], name='review_search_idx',
+                condition=models.Q(is_approved=True),
+            ),
         ]
 
     def __str__(self):
         return f"Отзыв {self.user.username} на {self.trip.title}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DERIVED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     def get_rating_stars(self):
         """Возвращает звезды рейтинга"""
         return '⭐' * self.rating
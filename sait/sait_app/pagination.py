@@ -0,0 +1,153 @@
+import base64
+import collections.abc
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не выполняет SELECT COUNT(*) по большим таблицам.
+
+    Для нефильтрованного queryset в PostgreSQL число строк берется из
+    статистики планировщика (pg_class.reltuples). Если таблица небольшая,
+    оценки нет или queryset отфильтрован, используется обычный COUNT.
+    Фильтр, который добавляет сам менеджер модели (Trip.objects скрывает
+    помеченные на удаление), фильтром не считается: таких строк единицы
+    до фоновой очистки, и оценка по всей таблице почти не отличается.
+    """
+
+    # Ниже этого порога точный COUNT дешев и оценке не доверяем
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def is_unfiltered(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return False
+        if not queryset.query.has_filters():
+            return True
+        return queryset.query.where == queryset.model._default_manager.all().query.where
+
+    def estimated_count(self):
+        queryset = self.object_list
+        if not self.is_unfiltered():
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder обрезает время до миллисекунд; ключу курсора нужна точность БД"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage(collections.abc.Sequence):
+    """Страница keyset-пагинации: объекты и курсор следующей страницы"""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorPaginator:
+    """Keyset-пагинация без COUNT и OFFSET.
+
+    Страница выбирается условием по ключам сортировки последнего показанного
+    объекта, поэтому глубина страницы не влияет на стоимость запроса, а
+    вставка новых строк не сдвигает уже показанную ленту. Последний ключ
+    должен быть уникальным (обычно id). Курсор - непрозрачная строка base64.
+    """
+
+    def __init__(self, object_list, ordering, per_page):
+        self.object_list = object_list
+        self.ordering = list(ordering)
+        self.per_page = int(per_page)
+        self.keys = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def _key_field(self, name):
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name) for name in self.keys]
+        raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError
+            return [self._key_field(name).to_python(value) for name, value in zip(self.keys, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor('Некорректный курсор')
+
+    def _after(self, values):
+        # (a, b) < (x, y)  ->  a < x OR (a = x AND b < y), плюс a <= x для использования индекса
+        condition = Q()
+        for index, name in enumerate(self.keys):
+            lookup = 'lt' if self.descending[index] else 'gt'
+            branch = Q(**{f'{name}__{lookup}': values[index]})
+            for prev in range(index):
+                branch &= Q(**{self.keys[prev]: values[prev]})
+            condition |= branch
+        first_lookup = 'lte' if self.descending[0] else 'gte'
+        return Q(**{f'{self.keys[0]}__{first_lookup}': values[0]}) & condition
+
+    def page(self, cursor=None):
+        queryset = self.object_list.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        objects = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            next_cursor = self.encode_cursor(objects[-1])
+        return CursorPage(objects, next_cursor)
@@ -0,0 +1,60 @@
+"""Поиск поездок по периоду: кто путешествовал в день или в промежуток дат.
+
+B-tree по (start_date, end_date) помогает только условию на первую колонку:
+для «поездки, идущие 1 мая» он просматривает все поездки, начавшиеся
+раньше. Период поездки daterange(start_date, end_date, '[]') с GiST-индексом
+(trip_period_gist_idx) находит пересечения и вложения напрямую. Индекс
+построен по выражению, отдельная колонка не нужна и не может устареть.
+Условия должны использовать то же выражение (Period), иначе PostgreSQL
+индекс не применит. На других СУБД - обычные сравнения дат.
+"""
+from django.contrib.postgres.fields import DateRangeField
+from django.db import connections
+from django.db.backends.postgresql.psycopg_any import DateRange
+from django.db.models import F, Func, Q, Value
+
+# Обе даты входят в поездку
+BOUNDS = '[]'
+
+
+class Period(Func):
+    """daterange(start_date, end_date, '[]') - период поездки"""
+    function = 'daterange'
+    output_field = DateRangeField()
+
+    def __init__(self, start='start_date', end='end_date', **extra):
+        super().__init__(F(start), F(end), Value(BOUNDS), **extra)
+
+
+def is_supported(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def window(start, end):
+    return DateRange(start, end, BOUNDS)
+
+
+def _filter(queryset, lookup, value, fallback):
+    if is_supported(queryset):
+        return queryset.alias(period=Period()).filter(**{f'period__{lookup}': value})
+    return queryset.filter(fallback)
+
+
+def in_progress(queryset, day):
+    """Поездки, которые идут в день day"""
+    return _filter(queryset, 'contains', day, Q(start_date__lte=day, end_date__gte=day))
+
+
+def overlapping(queryset, start, end):
+    """Поездки, у которых есть хотя бы один день в промежутке [start, end]"""
+    return _filter(queryset, 'overlap', window(start, end), Q(start_date__lte=end, end_date__gte=start))
+
+
+def within(queryset, start, end):
+    """Поездки, целиком уложившиеся в промежуток [start, end]"""
+    return _filter(queryset, 'contained_by', window(start, end), Q(start_date__gte=start, end_date__lte=end))
+
+
+def spanning(queryset, start, end):
+    """Поездки, которые шли весь промежуток [start, end]"""
+    return _filter(queryset, 'contains', window(start, end), Q(start_date__lte=start, end_date__gte=end))
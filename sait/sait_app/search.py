@@ -0,0 +1,117 @@
+"""Полнотекстовый поиск по поездкам (PostgreSQL).
+
+Trip.search_vector хранит to_tsvector в русской и английской конфигурациях
+по названию (вес A), стране (B) и рассказу (C), Review.search_vector - по
+тексту отзыва (D). Вектор отзыва пересчитывается одним UPDATE этой строки,
+поэтому правка, одобрение или удаление отзыва не перебирает остальные
+отзывы поездки. Поиск объединяет поездки, совпавшие сами, и поездки с
+совпавшими одобренными отзывами - каждая часть по своему GIN-индексу.
+Ранжируются поездки по собственному тексту: совпавшие только отзывом идут
+после них. На других СУБД поиск откатывается к icontains.
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast, Coalesce, Substr
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+SEARCH_CONFIGS = ('russian', 'english')
+HEADLINE_CONFIG = 'russian'
+# Маркеры подсветки, которые не встречаются в пользовательском тексте
+MARK_START = '\x02'
+MARK_STOP = '\x03'
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def _vector(weights):
+    vector = None
+    for config in SEARCH_CONFIGS:
+        for field, weight in weights:
+            part = SearchVector(field, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def search_vector():
+    return _vector([('title', 'A'), ('country', 'B'), ('description', 'C')])
+
+
+def review_search_vector():
+    return _vector([('comment', 'D')])
+
+
+def refresh_search_vectors(trip_ids):
+    """Пересчитывает поисковые векторы поездок"""
+    from .models import Trip
+    trip_ids = set(trip_ids) - {None}
+    if trip_ids and is_supported():
+        Trip.objects.filter(pk__in=trip_ids).update(search_vector=search_vector())
+
+
+def refresh_review_vectors(reviews):
+    """Пересчитывает поисковые векторы отзывов из queryset одним UPDATE"""
+    if is_supported():
+        reviews.update(search_vector=review_search_vector())
+
+
+def search_query(text):
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config, search_type='websearch')
+        query = part if query is None else query | part
+    return query
+
+
+def search_filter(query):
+    """Условие на поездки: совпала сама поездка или ее одобренный отзыв"""
+    from .models import Review, Trip
+    matches = Trip.all_objects.filter(search_vector=query).order_by().values('pk').union(
+        Review.objects.filter(is_approved=True, search_vector=query).order_by().values('trip_id')
+    )
+    return Q(pk__in=matches)
+
+
+def search_trips(queryset, text):
+    """Поездки, подходящие под запрос, с рангом ``rank`` и фрагментом ``headline``.
+
+    Ранг считается по вектору самой поездки (без отзывов - 0) и приводится
+    к double precision, чтобы значение из курсора сравнивалось с ним без
+    потери точности.
+    """
+    if not is_supported():
+        return search_trips_icontains(queryset, text)
+    query = search_query(text)
+    return queryset.filter(search_filter(query)).annotate(
+        rank=Cast(Coalesce(SearchRank(F('search_vector'), query), 0.0), FloatField()),
+        headline=SearchHeadline(
+            'description',
+            query,
+            config=HEADLINE_CONFIG,
+            start_sel=MARK_START,
+            stop_sel=MARK_STOP,
+            max_words=35,
+            min_words=15,
+        ),
+    )
+
+
+def search_trips_icontains(queryset, text):
+    """Прежний поиск подстрокой (ILIKE), без индекса"""
+    return queryset.filter(
+        Q(title__icontains=text)
+        | Q(country__icontains=text)
+        | Q(description__icontains=text)
+    ).annotate(
+        rank=Value(0.0, output_field=FloatField()),
+        headline=Substr('description', 1, 300),
+    )
+
+
+def highlight(headline):
+    """Экранирует фрагмент и заменяет маркеры на <mark>"""
+    html = escape(headline).replace(MARK_START, '<mark>').replace(MARK_STOP, '</mark>')
+    return mark_safe(html)
@@ -0,0 +1,199 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import auth_backends, fragment_cache, images, leaderboard, media_gc, search, travel_map, trip_purge, user_stats
+from .models import Review, Trip, TripPhoto, UserProfile, refresh_trip_review_stats
+
+
+def _loaded(instance, attname):
+    """Значение поля без обращения к БД: у отложенных (only/defer) полей - None"""
+    value = instance.__dict__.get(attname)
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=Review)
+def remember_review_stats_state(sender, instance, **kwargs):
+    """Запоминает поля отзыва, от которых зависят агрегаты поездки"""
+    instance._stats_state = tuple(
+        _loaded(instance, attname) for attname in ('trip_id', 'rating', 'is_approved')
+    )
+    instance._comment = _loaded(instance, 'comment')
+    instance._user_id = _loaded(instance, 'user_id')
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    """Обновляет поисковый вектор отзыва и агрегаты поездки, если изменились оценка, модерация или поездка"""
+    if raw:
+        return
+    old_state = instance._stats_state
+    state = (instance.trip_id, instance.rating, instance.is_approved)
+    if created or instance.comment != instance._comment:
+        # Только строка этого отзыва, остальные отзывы поездки не перечитываются
+        search.refresh_review_vectors(Review.objects.filter(pk=instance.pk))
+    if created or state != old_state:
+        refresh_trip_review_stats({instance.trip_id, old_state[0]})
+    elif instance.is_approved and instance.comment != instance._comment:
+        fragment_cache.bump([instance.trip_id], 'reviews')
+    if created:
+        user_stats.add(instance.user_id, reviews_count=1)
+    elif instance.user_id != instance._user_id:
+        user_stats.refresh([instance.user_id, instance._user_id])
+    instance._stats_state = state
+    instance._comment = instance.comment
+    instance._user_id = instance.user_id
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """Обновляет агрегаты поездки и счетчик автора после удаления отзыва"""
+    # Неодобренный отзыв не входит ни в агрегаты, ни в поиск, ни в страницы
+    if instance._stats_state[2] is not False:
+        refresh_trip_review_stats([instance.trip_id])
+    user_stats.add(instance.user_id, reviews_count=-1)
+
+
+@receiver(post_init, sender=TripPhoto)
+def remember_photo_name(sender, instance, **kwargs):
+    instance._image_name = _loaded(instance, 'image')
+
+
+@receiver(pre_save, sender=TripPhoto)
+def reset_photo_variants(sender, instance, **kwargs):
+    if instance.image.name != instance._image_name:
+        instance.variants_ready = False
+
+
+@receiver(post_save, sender=TripPhoto)
+def photo_saved(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь построение уменьшенных копий нового фото, старый файл отпускает"""
+    if raw:
+        return
+    if instance.image and not instance.variants_ready:
+        images.schedule(images.build_trip_photo_variants, instance.pk)
+    old_image = instance._image_name
+    instance._image_name = instance.image.name
+    if old_image and old_image != instance.image.name:
+        media_gc.release([old_image])
+    fragment_cache.bump([instance.trip_id], 'photos')
+
+
+@receiver(post_delete, sender=TripPhoto)
+def photo_deleted(sender, instance, **kwargs):
+    """Файл фото удаляется после коммита, если на него не ссылаются другие строки"""
+    fragment_cache.bump([instance.trip_id], 'photos')
+    media_gc.release([instance.image.name])
+
+
+def _trip_map_state(instance):
+    return tuple(
+        _loaded(instance, attname)
+        for attname in ('user_id', 'country_ref_id', 'start_date', 'end_date')
+    )
+
+
+@receiver(post_init, sender=Trip)
+def remember_trip_map_state(sender, instance, **kwargs):
+    """Запоминает поля поездки, от которых зависят агрегаты карты"""
+    instance._country_text = _loaded(instance, 'country')
+    instance._map_state = _trip_map_state(instance)
+
+
+@receiver(pre_save, sender=Trip)
+def resolve_trip_country(sender, instance, raw=False, **kwargs):
+    """Сопоставляет свободный текст страны со справочником"""
+    if raw:
+        return
+    if instance.country != instance._country_text or instance.country_ref_id is None:
+        instance.country_ref_id = travel_map.resolve_country(instance.country)
+
+
+@receiver(post_save, sender=Trip)
+def trip_saved(sender, instance, created, raw=False, **kwargs):
+    """Пересчитывает поисковый вектор и агрегаты карты после изменения поездки"""
+    if raw:
+        return
+    search.refresh_search_vectors([instance.pk])
+    fragment_cache.bump_trips()
+    old_state = instance._map_state
+    state = _trip_map_state(instance)
+    if created or state != old_state:
+        travel_map.refresh_country_stats([old_state[:2], state[:2]])
+    if not created and state[1] != old_state[1]:
+        # Поездка переехала в рейтинг другой страны
+        leaderboard.refresh([instance.pk])
+    old_user_id, _, old_start, old_end = old_state
+    if created:
+        user_stats.add(instance.user_id, trips_count=1,
+                       total_days=user_stats.trip_days(instance.start_date, instance.end_date))
+    elif old_user_id != instance.user_id or None in (old_start, old_end):
+        user_stats.refresh([instance.user_id, old_user_id])
+    else:
+        user_stats.add(instance.user_id, total_days=(
+            user_stats.trip_days(instance.start_date, instance.end_date)
+            - user_stats.trip_days(old_start, old_end)
+        ))
+    instance._country_text = instance.country
+    instance._map_state = state
+
+
+@receiver(post_delete, sender=Trip)
+def trip_deleted(sender, instance, **kwargs):
+    """Фрагменты удаленной поездки больше не нужны, агрегаты карты и счетчики автора уменьшаются"""
+    if instance.deleted_at is not None:
+        # Уже вычтена при пометке (trip_purge.mark_deleted)
+        return
+    trip_purge.withdraw(instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """Вычитает статистику пользователя из общих агрегатов до каскадного удаления"""
+    travel_map.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, **kwargs):
+    """Свежая копия пользователя в кэше входа (auth_backends.py)"""
+    if not raw:
+        auth_backends.remember_user(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=UserProfile)
+def user_or_profile_deleted(sender, instance, **kwargs):
+    auth_backends.forget_user(instance.pk if sender is User else instance.user_id)
+    if sender is UserProfile:
+        media_gc.release([instance.avatar.name])
+
+
+@receiver(post_init, sender=UserProfile)
+def remember_avatar_name(sender, instance, **kwargs):
+    instance._avatar_name = _loaded(instance, 'avatar')
+
+
+@receiver(pre_save, sender=UserProfile)
+def reset_avatar_variants(sender, instance, **kwargs):
+    if instance.avatar.name != instance._avatar_name:
+        instance.avatar_variants_ready = False
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь построение копий нового аватара, старый удаляет после коммита"""
+    if not raw and instance.avatar and not instance.avatar_variants_ready:
+        images.schedule(images.build_avatar_variants, instance.pk)
+    old_avatar = instance._avatar_name
+    instance._avatar_name = instance.avatar.name
+    if raw:
+        return
+    if old_avatar and old_avatar != instance.avatar.name:
+        media_gc.release([old_avatar])
+    if UserProfile.user.is_cached(instance):
+        # Пользователь запроса уже держит этот профиль - пишем в кэш обоих
+        user = instance.user
+        user.profile = instance
+        auth_backends.remember_user(user)
+    else:
+        auth_backends.forget_user(instance.user_id)
@@ -0,0 +1,190 @@
+"""Статика с хэшем содержимого в имени и заранее сжатыми копиями.
+
+CompressedManifestStaticFilesStorage при collectstatic дает каждому файлу
+имя с хэшем (diary.3f2a1c9e7b04.css) и кладет рядом diary.3f2a1c9e7b04.css.gz
+и .br (если установлен пакет brotli). Раз имя меняется вместе с
+содержимым, файл можно кэшировать в браузере навсегда.
+
+StaticFilesMiddleware отдает STATIC_ROOT без nginx: выбирает сжатую копию по
+Accept-Encoding и ставит Cache-Control immutable для имен с хэшем.
+"""
+import gzip
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - сжатие br необязательно
+    brotli = None
+
+# Что имеет смысл сжимать: картинки и шрифты уже сжаты
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.svg', '.html', '.txt', '.json', '.map', '.xml', '.ico'}
+# Маленькие файлы не сжимаем: выигрыш меньше заголовков
+MIN_COMPRESS_SIZE = 256
+# Сжатая копия нужна, только если она заметно меньше
+MAX_COMPRESS_RATIO = 0.95
+# Порядок предпочтения: (кодировка, суффикс файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress_gzip(data):
+    # mtime=0: одинаковый вход - одинаковый файл, без лишних изменений при деплое
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def compressors():
+    found = [('.gz', compress_gzip)]
+    if brotli is not None:
+        found.insert(0, ('.br', compress_brotli))
+    return found
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic еще не запускали (разработка, тесты) - отдаем исходное имя
+            if self.hashed_files:
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not dry_run and not isinstance(processed, Exception):
+                names.update(filter(None, (name, hashed_name)))
+        if dry_run:
+            return
+        for name in sorted(names):
+            for compressed_name in self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name):
+        """Пишет сжатые копии файла; возвращает их имена"""
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return []
+        with self.open(name) as source:
+            data = source.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+        written = []
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            target = name + suffix
+            if self.exists(target):
+                self.delete(target)
+            if len(compressed) <= len(data) * MAX_COMPRESS_RATIO:
+                self._save(target, ContentFile(compressed))
+                written.append(target)
+        return written
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с ненулевым q"""
+    accepted = set()
+    for part in header.split(','):
+        encoding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if encoding and quality > 0:
+            accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def _hashed_names():
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None) or {}
+    return set(hashed_files.values())
+
+
+class StaticFilesMiddleware:
+    """Отдает STATIC_ROOT со сжатием и долгим кэшем, не доходя до сессий и БД.
+
+    Работает под WSGI и ASGI: иначе Django переключал бы поток вокруг нее
+    на каждом запросе, включая асинхронные страницы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else None
+        self.root = settings.STATIC_ROOT
+        self.hashed = None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.static_response(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.static_response(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def static_response(self, request):
+        if (
+            self.prefix and self.root and not settings.DEBUG
+            and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+        ):
+            return self.serve(request, request.path[len(self.prefix):])
+        return None
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except ValueError:
+            return None
+        # Сжатые копии напрямую не отдаем: у них был бы тип исходного файла без Content-Encoding
+        if not name or name.endswith(tuple(suffix for _, suffix in ENCODINGS)) or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding = None
+            for candidate, suffix in ENCODINGS:
+                if candidate in accepted and os.path.isfile(path + suffix):
+                    encoding, path = candidate, path + suffix
+                    break
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(stat.st_mtime)
+        if self.hashed is None:
+            self.hashed = _hashed_names()
+        if name in self.hashed:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}, immutable'
+        else:
+            # Имя без хэша может получить новое содержимое при следующем деплое
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_UNHASHED_MAX_AGE}'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
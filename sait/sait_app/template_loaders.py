@@ -0,0 +1,41 @@
+"""Загрузчики шаблонов, которые убирают отступы разметки.
+
+Шаблоны дневника отформатированы отступами, и на странице с десятками
+карточек пробелы занимают заметную часть HTML. Сжимается исходник шаблона
+один раз при загрузке - под cached.Loader это ничего не стоит на запрос,
+а вывод переменных не трогается.
+
+Любая цепочка пробелов с переводом строки заменяется одним переводом
+строки: для HTML это то же самое, а в <script> перевод строки по-прежнему
+завершает // комментарий и инструкцию. Шаблоны с <pre> и <textarea>, где
+пробелы значимы, отдаются как есть.
+"""
+import re
+
+from django.template.loaders import app_directories, filesystem
+
+INDENT_RE = re.compile(r'[ \t\r]*\n\s*')
+SIGNIFICANT_WHITESPACE_RE = re.compile(r'<(pre|textarea)\b', re.IGNORECASE)
+MINIFY_EXTENSIONS = ('.html',)
+
+
+def minify(source):
+    if SIGNIFICANT_WHITESPACE_RE.search(source):
+        return source
+    return INDENT_RE.sub('\n', source)
+
+
+class MinifyMixin:
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+        if origin.name.endswith(MINIFY_EXTENSIONS):
+            contents = minify(contents)
+        return contents
+
+
+class FilesystemLoader(MinifyMixin, filesystem.Loader):
+    pass
+
+
+class AppDirectoriesLoader(MinifyMixin, app_directories.Loader):
+    pass
@@ -0,0 +1,47 @@
+from django import template
+
+from .. import fragment_cache
+
+register = template.Library()
+
+
+class TripFragmentNode(template.Node):
+    def __init__(self, nodelist, name, trip, dependencies):
+        self.nodelist = nodelist
+        self.name = name
+        self.trip = trip
+        self.dependencies = dependencies
+
+    def render(self, context):
+        trip = self.trip.resolve(context)
+        dependencies = [dependency.resolve(context) for dependency in self.dependencies]
+        key = fragment_cache.fragment_key(self.name.resolve(context), trip, dependencies)
+        html = fragment_cache.get_fragment(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragment_cache.set_fragment(key, html)
+        return html
+
+
+@register.tag('tripfragment')
+def do_tripfragment(parser, token):
+    """Кэширует фрагмент, зависящий от поездки.
+
+    Пример: {% tripfragment 'photos' trip 'photos' %}...{% endtripfragment %}
+    Фрагмент обновляется при изменении trip.updated_at и перечисленных
+    зависимостей ('photos', 'reviews'). Внутри не должно быть ничего,
+    что зависит от текущего пользователя.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' принимает имя фрагмента, поездку и список зависимостей"
+        )
+    nodelist = parser.parse(('endtripfragment',))
+    parser.delete_first_token()
+    return TripFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -0,0 +1,28 @@
+from django import template
+
+from ..images import VARIANT_WIDTHS, variant_name, variant_srcset
+
+register = template.Library()
+
+
+@register.inclusion_tag('diary/_responsive_image.html')
+def responsive_image(field_file, ready, preset, sizes='', alt='', css_class='', style=''):
+    """<picture> с WebP/JPEG-копиями; пока копий нет, отдает оригинал.
+
+    Пример: {% responsive_image photo.image photo.variants_ready 'photo' sizes='280px' %}
+    """
+    context = {
+        'src': field_file.url,
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+        'style': style,
+    }
+    if ready:
+        largest = VARIANT_WIDTHS[preset][-1]
+        context.update({
+            'src': field_file.storage.url(variant_name(field_file.name, largest, 'jpg')),
+            'webp_srcset': variant_srcset(field_file, preset, 'webp'),
+            'jpg_srcset': variant_srcset(field_file, preset, 'jpg'),
+        })
+    return context
@@ -1,3 +1,1645 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import blobs, compression, fragment_cache, leaderboard, loaders, search, throttle, travel_map, trip_purge, views
+from .compression import CompressionMiddleware
+from .db_router import STICKY_COOKIE, ReplicaMiddleware
+from .forms import CustomUserCreationForm
+from . import images
+from .images import variant_names
+from .management.commands.bench_asgi import async_views
+from .pagination import EstimatedCountPaginator
+from .staticfiles import StaticFilesMiddleware
+from .template_loaders import minify
+from .uploads import save_trip_photos
+
+from .models import (
+    CountryAlias, CountryStats, LeaderboardState, MediaBlob, Review, Trip, TripPhoto, TripRanking, UserCountryStats,
+    UserProfile, UserStats,
+)
+from . import user_stats
+
+
+def make_trip(user, **kwargs):
+    defaults = {
+        'title': 'Поездка',
+        'country': 'Россия',
+        'start_date': datetime.date(2024, 5, 1),
+        'end_date': datetime.date(2024, 5, 10),
+        'description': 'Рассказ о поездке',
+    }
+    defaults.update(kwargs)
+    return Trip.objects.create(user=user, **defaults)
+
+
+def make_trips(user, count):
+    return [make_trip(user, title=f'Поездка {index}') for index in range(count)]
+
+
+def make_image(name='photo.jpg', size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'navy').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class TempMediaMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(
+            MEDIA_ROOT=cls.media_root, IMAGE_VARIANTS_ASYNC=False, TRIP_PURGE_ASYNC=False,
+        )
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class TripReviewStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.readers = [User.objects.create_user(f'reader{i}', password='pass') for i in range(3)]
+        cls.trip = make_trip(cls.author)
+
+    def assertStats(self, count, rating_sum):
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.approved_reviews_count, count)
+        self.assertEqual(self.trip.rating_sum, rating_sum)
+
+    def test_create_edit_delete(self):
+        review = Review.objects.create(user=self.readers[0], trip=self.trip, rating=5, comment='!')
+        Review.objects.create(user=self.readers[1], trip=self.trip, rating=2, comment='!')
+        self.assertStats(2, 7)
+        self.assertEqual(self.trip.average_rating(), 3.5)
+
+        review.rating = 3
+        review.save()
+        self.assertStats(2, 5)
+
+        review.delete()
+        self.assertStats(1, 2)
+
+    def test_comment_edit_refreshes_only_search_vector(self):
+        review = Review.objects.create(user=self.readers[0], trip=self.trip, rating=4, comment='!')
+        review.comment = 'Изменено'
+        with CaptureQueriesContext(connection) as ctx:
+            review.save()
+        # Агрегаты не пересчитываются; вектор пересчитывается только у этого отзыва
+        refreshes = [query['sql'] for query in ctx.captured_queries[1:]]
+        self.assertEqual(len(refreshes), 1 if search.is_supported() else 0)
+        for sql in refreshes:
+            self.assertIn('UPDATE "sait_app_review" SET "search_vector"', sql)
+            self.assertNotIn('sait_app_trip', sql)
+        self.assertStats(1, 4)
+
+    def test_moderation_flag(self):
+        review = Review.objects.create(user=self.readers[0], trip=self.trip, rating=4, comment='!')
+        review.is_approved = False
+        review.save()
+        self.assertStats(0, 0)
+        self.assertEqual(self.trip.average_rating(), 0)
+
+    def test_bulk_update(self):
+        for reader in self.readers:
+            Review.objects.create(user=reader, trip=self.trip, rating=4, comment='!')
+        Review.objects.filter(user=self.readers[0]).update(is_approved=False)
+        self.assertStats(2, 8)
+        Review.objects.update(rating=1)
+        self.assertStats(2, 2)
+        Review.objects.all().delete()
+        self.assertStats(0, 0)
+
+    def test_rebuild_command_reports_drift(self):
+        Review.objects.create(user=self.readers[0], trip=self.trip, rating=5, comment='!')
+        Trip.objects.filter(pk=self.trip.pk).update(approved_reviews_count=10, rating_sum=1)
+
+        out = StringIO()
+        call_command('rebuild_review_stats', '--check', stdout=out)
+        self.assertIn('Найдено расхождений: 1', out.getvalue())
+        self.assertStats(10, 1)
+
+        call_command('rebuild_review_stats', stdout=StringIO())
+        self.assertStats(1, 5)
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    # Число запросов не должно зависеть от количества строк на странице
+    QUERY_BUDGET = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        users = [User.objects.create_user(f'user{i}') for i in range(20)]
+        for i, user in enumerate(users):
+            trip = make_trip(user, title=f'Поездка {i}')
+            TripPhoto.objects.create(trip=trip, image=f'trip_photos/p{i}.jpg')
+            Review.objects.bulk_create(
+                Review(user=reader, trip=trip, rating=4, comment='!') for reader in users[:5]
+            )
+        UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertChangelistWithinBudget(self, model_name, **params):
+        url = reverse(f'admin:sait_app_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries), self.QUERY_BUDGET,
+            '\n'.join(query['sql'] for query in ctx.captured_queries),
+        )
+        # Боковой фильтр не собирает значения по всей таблице поездок
+        self.assertFalse(any('DISTINCT "sait_app_trip"."country"' in query['sql'] for query in ctx.captured_queries))
+
+    def test_trip_changelist(self):
+        self.assertChangelistWithinBudget('trip')
+        self.assertChangelistWithinBudget('trip', o='7')
+        self.assertChangelistWithinBudget('trip', o='-8')
+
+    def test_review_changelist(self):
+        self.assertChangelistWithinBudget('review')
+
+    def test_tripphoto_changelist(self):
+        self.assertChangelistWithinBudget('tripphoto')
+        self.assertChangelistWithinBudget('tripphoto', trip__country_ref__id__exact=Trip.objects.first().country_ref_id)
+
+    def test_userprofile_changelist(self):
+        self.assertChangelistWithinBudget('userprofile')
+
+    def test_manager_filter_keeps_estimate(self):
+        # Trip.objects скрывает помеченные на удаление, но для оценки это вся таблица
+        self.assertTrue(EstimatedCountPaginator(Trip.objects.order_by('pk'), 10).is_unfiltered())
+        self.assertTrue(EstimatedCountPaginator(Review.objects.order_by('pk'), 10).is_unfiltered())
+        self.assertFalse(EstimatedCountPaginator(Trip.objects.filter(title='Поездка 1'), 10).is_unfiltered())
+        self.assertFalse(EstimatedCountPaginator(Trip.all_objects.filter(deleted_at__isnull=False), 10).is_unfiltered())
+
+
+class HomeFeedCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author')
+        # Несколько поездок с одинаковой датой проверяют разрешение ничьих по id
+        cls.trips = [
+            make_trip(cls.user, title=f'Поездка {i}', start_date=datetime.date(2024, 1, 1 + i // 3))
+            for i in range(10)
+        ]
+
+    def collect_feed(self):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('trip_feed'), {'cursor': cursor} if cursor else {})
+            seen.extend(trip.pk for trip in response.context['trips'])
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return seen
+
+    def test_pages_cover_feed_in_order(self):
+        expected = list(Trip.objects.order_by('-start_date', '-id').values_list('pk', flat=True))
+        self.assertEqual(self.collect_feed(), expected)
+
+    def test_insert_does_not_shift_pages(self):
+        first = self.client.get(reverse('home'))
+        cursor = first.context['trips'].next_cursor
+        make_trip(self.user, title='Новая', start_date=datetime.date(2025, 1, 1), end_date=datetime.date(2025, 1, 5))
+        second = self.client.get(reverse('home'), {'cursor': cursor})
+        shown = {trip.pk for trip in first.context['trips']}
+        self.assertFalse(shown & {trip.pk for trip in second.context['trips']})
+
+    def test_feed_does_not_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('trip_feed'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('home'), {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['trips']), 4)
+
+
+class ImageVariantsTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        self.trip = make_trip(self.user)
+
+    def test_variants_built_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = TripPhoto.objects.create(trip=self.trip, image=make_image())
+        photo.refresh_from_db()
+        self.assertTrue(photo.variants_ready)
+        for name in variant_names(photo.image.name, 'photo'):
+            self.assertTrue(default_storage.exists(name), name)
+        with default_storage.open(variant_names(photo.image.name, 'photo')[0]) as variant:
+            self.assertEqual(Image.open(variant).width, 220)
+
+        response = self.client.get(self.trip.get_absolute_url())
+        self.assertContains(response, '.220w.webp 220w')
+
+    def test_original_served_until_variants_ready(self):
+        photo = TripPhoto.objects.create(trip=self.trip, image=make_image())
+        response = self.client.get(self.trip.get_absolute_url())
+        self.assertContains(response, f'src="{photo.image.url}"')
+        self.assertNotContains(response, 'srcset')
+
+    def test_backfill_command(self):
+        photo = TripPhoto.objects.create(trip=self.trip, image=make_image())
+        self.assertFalse(photo.variants_ready)
+        call_command('build_image_variants', '--workers=1', stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertTrue(photo.variants_ready)
+
+
+class PhotoUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        self.client.force_login(self.user)
+
+    def trip_data(self, **extra):
+        data = {
+            'title': 'Байкал',
+            'country': 'Россия',
+            'start_date': '2024-02-01',
+            'end_date': '2024-02-10',
+            'description': 'Лед',
+        }
+        data.update(extra)
+        return data
+
+    def test_add_trip_saves_photos_in_order(self):
+        photos = [make_image(f'{i}.jpg', (40, 30)) for i in range(3)]
+        response = self.client.post(reverse('add_trip'), self.trip_data(photos=photos))
+        trip = Trip.objects.get()
+        self.assertRedirects(response, trip.get_absolute_url())
+        self.assertEqual(list(trip.photos.values_list('order', flat=True)), [0, 1, 2])
+
+        more = [make_image('more.jpg', (40, 30))]
+        self.client.post(reverse('edit_trip', args=[trip.pk]), self.trip_data(photos=more))
+        self.assertEqual(list(trip.photos.values_list('order', flat=True)), [0, 1, 2, 3])
+
+    def test_invalid_files_rejected_while_streaming(self):
+        fake = SimpleUploadedFile('fake.jpg', b'not an image', content_type='image/jpeg')
+        script = SimpleUploadedFile('run.sh', b'#!/bin/sh', content_type='text/x-sh')
+        with override_settings(PHOTO_UPLOAD_MAX_SIZE=1024):
+            big = make_image('big.jpg', (800, 600))
+            response = self.client.post(
+                reverse('add_trip'),
+                self.trip_data(photos=[fake, script, big, make_image('ok.jpg', (10, 10))]),
+                follow=True,
+            )
+        trip = Trip.objects.get()
+        self.assertEqual(trip.photos.count(), 1)
+        self.assertContains(response, 'fake.jpg')
+        self.assertContains(response, 'big.jpg')
+
+
+class TripDetailQueryTests(TestCase):
+    # поездка с автором + фото + отзывы с пользователями и профилями
+    ANONYMOUS_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.trip = make_trip(cls.author)
+
+    def add_content(self, count):
+        start = self.trip.photos.count()
+        TripPhoto.objects.bulk_create(
+            TripPhoto(trip=self.trip, image=f'trip_photos/{start + i}.jpg', order=start + i)
+            for i in range(count)
+        )
+        readers = User.objects.bulk_create(
+            User(username=f'reader{start + i}') for i in range(count)
+        )
+        UserProfile.objects.bulk_create(
+            UserProfile(user=reader, avatar=f'avatars/{reader.username}.jpg') for reader in readers
+        )
+        Review.objects.bulk_create(
+            Review(user=reader, trip=self.trip, rating=5, comment='!') for reader in readers
+        )
+
+    def test_query_count_independent_of_content(self):
+        url = self.trip.get_absolute_url()
+        for count in (1, 20):
+            self.add_content(count)
+            with self.assertNumQueries(self.ANONYMOUS_QUERIES):
+                response = self.client.get(url)
+            shown = min(self.trip.reviews.count(), loaders.TRIP_REVIEWS_PER_PAGE)
+            self.assertEqual(len(response.context['reviews']), shown)
+
+    def test_logged_in_query_count(self):
+        self.add_content(10)
+        self.client.force_login(self.author)
+        url = self.trip.get_absolute_url()
+        # Первый запрос после входа кладет пользователя с профилем в кэш
+        self.client.get(url)
+        with self.assertNumQueries(self.ANONYMOUS_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.context['user'], self.author)
+
+    def test_hides_unapproved_reviews(self):
+        self.add_content(3)
+        Review.objects.filter(user__username='reader0').update(is_approved=False)
+        response = self.client.get(self.trip.get_absolute_url())
+        self.assertEqual(len(response.context['reviews']), 2)
+        self.assertContains(response, '(2 отзывов)')
+
+    @mock.patch.object(loaders, 'TRIP_REVIEWS_PER_PAGE', 3)
+    def test_reviews_paginated_by_cursor(self):
+        self.add_content(5)
+        with self.assertNumQueries(self.ANONYMOUS_QUERIES):
+            response = self.client.get(self.trip.get_absolute_url())
+        reviews = response.context['reviews']
+        self.assertEqual(len(reviews), 3)
+        self.assertContains(response, 'Отзывы (5)')
+        self.assertContains(response, reverse('trip_reviews_feed', args=[self.trip.pk]))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('trip_reviews_feed', args=[self.trip.pk]),
+                                       {'cursor': reviews.next_cursor})
+        self.assertEqual(len(response.context['reviews']), 2)
+        self.assertNotIn('X-Next-Cursor', response)
+        shown = {review.pk for review in reviews} | {review.pk for review in response.context['reviews']}
+        self.assertEqual(shown, set(self.trip.reviews.values_list('pk', flat=True)))
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.trip = make_trip(cls.author, title='Алтай')
+
+    def setUp(self):
+        fragment_cache.get_cache().clear()
+        fragment_cache.reset_stats()
+
+    def render_detail(self):
+        return self.client.get(self.trip.get_absolute_url())
+
+    def test_hits_after_first_render(self):
+        self.render_detail()
+        self.assertEqual(fragment_cache.stats(), {'hits': 0, 'misses': 3, 'hit_ratio': 0.0})
+        self.render_detail()
+        self.assertEqual(fragment_cache.stats()['hits'], 3)
+
+    def test_trip_edit_invalidates(self):
+        self.render_detail()
+        self.trip.title = 'Горный Алтай'
+        self.trip.save()
+        self.assertContains(self.render_detail(), 'Горный Алтай')
+
+    def test_review_invalidates_header_only(self):
+        self.render_detail()
+        Review.objects.create(user=self.reader, trip=self.trip, rating=4, comment='!')
+        fragment_cache.reset_stats()
+        self.assertContains(self.render_detail(), '⭐ 4.0 (1 отзывов)')
+        self.assertEqual(fragment_cache.stats()['misses'], 1)
+
+        Review.objects.update(is_approved=False)
+        self.assertNotContains(self.render_detail(), '(1 отзывов)')
+
+    def test_photo_changes_invalidate(self):
+        self.render_detail()
+        photo = TripPhoto.objects.create(trip=self.trip, image='trip_photos/new.jpg')
+        self.assertContains(self.render_detail(), 'trip_photos/new.jpg')
+        photo.delete()
+        self.assertNotContains(self.render_detail(), 'trip_photos/new.jpg')
+
+    def test_home_cards(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(fragment_cache.stats()['hits'], 1)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            },
+        }):
+            self.render_detail()
+            self.render_detail()
+            self.assertEqual(fragment_cache.stats()['hits'], 3)
+
+    def test_stats_written_in_batches(self):
+        cache = fragment_cache.get_cache()
+        with mock.patch.multiple(fragment_cache, STATS_FLUSH_EVERY=5, STATS_FLUSH_SECONDS=3600):
+            self.render_detail()
+            self.assertIsNone(cache.get(fragment_cache.MISSES_KEY))
+            self.render_detail()
+            self.assertEqual(cache.get(fragment_cache.MISSES_KEY), 3)
+            self.assertEqual(cache.get(fragment_cache.HITS_KEY), 2)
+        self.assertEqual(fragment_cache.stats()['hits'], 3)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.trip = make_trip(cls.author, title='Ледники Норвегии', description='Фьорды и <b>водопады</b>')
+        cls.other = make_trip(cls.author, title='Пляжи Турции', description='Море')
+
+    def test_search_finds_trip_and_escapes_snippet(self):
+        response = self.client.get(reverse('search'), {'q': 'водопады'})
+        self.assertEqual([trip.pk for trip in response.context['results']], [self.trip.pk])
+        self.assertNotContains(response, '<b>водопады</b>')
+
+    @skipUnless(connection.vendor == 'postgresql', 'полнотекстовый поиск требует PostgreSQL')
+    def test_vector_covers_approved_reviews_and_stemming(self):
+        review = Review.objects.create(user=self.reader, trip=self.other, rating=5, comment='Красивые закаты')
+        found = self.client.get(reverse('search'), {'q': 'закат'}).context['results']
+        self.assertEqual([trip.pk for trip in found], [self.other.pk])
+        self.assertContains(self.client.get(reverse('search'), {'q': 'водопад'}), '<mark>')
+
+        Review.objects.filter(pk=review.pk).update(comment='Тихие бухты')
+        self.assertFalse(self.client.get(reverse('search'), {'q': 'закат'}).context['results'])
+        self.assertTrue(self.client.get(reverse('search'), {'q': 'бухта'}).context['results'])
+
+        review.is_approved = False
+        review.save()
+        self.assertFalse(self.client.get(reverse('search'), {'q': 'бухта'}).context['results'])
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('search'))
+        self.assertIsNone(response.context['results'])
+
+
+class TravelMapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.other = User.objects.create_user('other')
+        cls.reader = User.objects.create_user('reader')
+
+    def setUp(self):
+        travel_map.cache.clear()
+
+    def stats(self, iso2, user=None):
+        if user is None:
+            row = CountryStats.objects.get(country__iso2=iso2)
+        else:
+            row = UserCountryStats.objects.get(user=user, country__iso2=iso2)
+        return row.trips_count, row.total_days, row.average_rating()
+
+    def test_free_text_is_mapped(self):
+        trip = make_trip(self.author, country='  грузия ')
+        self.assertEqual(trip.country_ref.iso2, 'GE')
+        self.assertEqual(make_trip(self.author, country='U.S.A.').country_ref.iso2, 'US')
+        self.assertIsNone(make_trip(self.author, country='Атлантида').country_ref)
+
+    def test_aggregates_follow_trip_and_review_changes(self):
+        trip = make_trip(self.author, country='Грузия')
+        make_trip(self.other, country='Georgia', end_date=datetime.date(2024, 5, 1))
+        self.assertEqual(self.stats('GE', self.author), (1, 10, 0))
+        self.assertEqual(self.stats('GE'), (2, 11, 0))
+
+        review = Review.objects.create(user=self.reader, trip=trip, rating=4, comment='!')
+        self.assertEqual(self.stats('GE'), (2, 11, 4.0))
+        review.is_approved = False
+        review.save()
+        self.assertEqual(self.stats('GE', self.author), (1, 10, 0))
+
+        trip.country = 'Армения'
+        trip.save()
+        self.assertEqual(self.stats('GE'), (1, 1, 0))
+        self.assertEqual(self.stats('AM', self.author), (1, 10, 0))
+        self.assertFalse(UserCountryStats.objects.filter(user=self.author, country__iso2='GE').exists())
+
+        trip.delete()
+        self.assertEqual(self.stats('AM'), (0, 0, 0))
+
+    def test_user_deletion(self):
+        make_trip(self.other, country='Грузия')
+        make_trip(self.author, country='Грузия')
+        self.other.delete()
+        self.assertEqual(self.stats('GE'), (1, 10, 0))
+
+    def test_rebuild_matches_incremental(self):
+        make_trip(self.author, country='Грузия')
+        make_trip(self.other, country='Армения')
+        expected = sorted(CountryStats.objects.values_list('country_id', 'trips_count', 'total_days'))
+        CountryStats.objects.update(trips_count=0)
+        call_command('rebuild_map_stats', stdout=StringIO())
+        self.assertEqual(
+            sorted(CountryStats.objects.values_list('country_id', 'trips_count', 'total_days')), expected
+        )
+
+    def test_geojson_etag(self):
+        for _ in range(3):
+            make_trip(self.author, country='Грузия')
+        self.client.login(username='author', password='pass')
+        url = reverse('travel_map_data')
+        response = self.client.get(url, {'scope': 'mine'})
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        feature, = response.json()['features']
+        self.assertEqual(feature['id'], 'GE')
+        self.assertEqual(feature['properties']['trips'], 3)
+
+        with self.assertNumQueries(0):  # сессия и пользователь - из кэша
+            cached = self.client.get(url, {'scope': 'mine'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_trip(self.author, country='Армения')
+        response = self.client.get(url, {'scope': 'mine'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['features']), 2)
+
+
+class ScaleBenchmarkTests(TempMediaMixin, TestCase):
+    def test_generate_and_bench_routes(self):
+        call_command(
+            'generate_scale_data', users=5, trips=12, reviews=30, photos_per_trip=1,
+            placeholders=1, batch_size=5, stdout=StringIO(),
+        )
+        self.assertEqual(Trip.objects.count(), 12)
+        self.assertEqual(Review.objects.count(), 30)
+        self.assertEqual(UserProfile.objects.count(), 5)
+        trip = Trip.objects.order_by('pk').first()
+        approved = trip.reviews.filter(is_approved=True)
+        self.assertEqual(trip.approved_reviews_count, approved.count())
+        self.assertEqual(CountryStats.objects.aggregate(total=Sum('trips_count'))['total'], 12)
+
+        output = os.path.join(self.media_root, 'bench.json')
+        call_command('bench_routes', requests=3, warmup=0, sample=2, output=output, stdout=StringIO())
+        with open(output, encoding='utf-8') as result_file:
+            results = {(row['route'], row['mode']): row for row in json.load(result_file)['results']}
+        self.assertEqual(results[('profile', 'user')]['status'], [200])
+        self.assertEqual(results[('profile', 'anonymous')]['status'], [302])
+        self.assertLessEqual(results[('trip_detail', 'anonymous')]['queries_max'], 3)
+
+
+class ProfileStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        UserProfile.objects.create(user=cls.author)
+        cls.reader = User.objects.create_user('reader')
+
+    def setUp(self):
+        travel_map.cache.clear()
+        self.client.login(username='author', password='pass')
+
+    def stats(self):
+        return UserStats.objects.values_list(
+            'trips_count', 'reviews_count', 'countries_count', 'total_days'
+        ).get(user=self.author)
+
+    def test_counters_follow_changes(self):
+        user_stats.for_user(self.author)
+        trip = make_trip(self.author, country='Грузия')
+        make_trip(self.author, country='Армения', end_date=datetime.date(2024, 5, 1))
+        other = make_trip(self.reader)
+        self.assertEqual(self.stats(), (2, 0, 2, 11))
+
+        trip.end_date = datetime.date(2024, 5, 3)
+        trip.save()
+        review = Review.objects.create(user=self.author, trip=other, rating=5, comment='!')
+        self.assertEqual(self.stats(), (2, 1, 2, 4))
+
+        review.delete()
+        trip.delete()
+        self.assertEqual(self.stats(), (1, 0, 1, 1))
+        stored = self.stats()
+        user_stats.refresh([self.author.pk])
+        self.assertEqual(self.stats(), stored)
+
+    def test_profile_queries_do_not_grow(self):
+        other = make_trip(self.reader)
+        self.client.get(reverse('profile'))
+
+        def profile_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('profile'))
+            return response, len(context.captured_queries)
+
+        _, before = profile_queries()
+        for index in range(25):
+            make_trip(self.author, title=f'Поездка {index}')
+        Review.objects.bulk_create(
+            Review(user=self.author, trip=trip, rating=4, comment='!')
+            for trip in [other, *make_trips(self.reader, 14)]
+        )
+        response, after = profile_queries()
+        self.assertEqual(after, before)
+        self.assertEqual(len(response.context['user_trips']), 10)
+        self.assertContains(response, '<h3>25</h3>')
+        self.assertContains(response, '<h3>15</h3>')
+
+        feed = self.client.get(reverse('profile_trips'), {'cursor': response.context['user_trips'].next_cursor})
+        self.assertEqual(len(feed.context['user_trips']), 10)
+        self.assertIn('X-Next-Cursor', feed)
+
+    def test_my_reviews_paginated(self):
+        Review.objects.bulk_create(
+            Review(user=self.author, trip=trip, rating=3, comment='!')
+            for trip in make_trips(self.reader, 25)
+        )
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(1):  # только страница отзывов: сессия и пользователь с профилем в кэше
+            response = self.client.get(reverse('my_reviews'))
+        self.assertEqual(len(response.context['reviews']), 20)
+        feed = self.client.get(reverse('my_reviews_feed'), {'cursor': response.context['reviews'].next_cursor})
+        self.assertEqual(len(feed.context['reviews']), 5)
+        self.assertNotIn('X-Next-Cursor', feed)
+
+
+class ApiConditionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.trip = make_trip(cls.author, title='Байкал', description='Лед')
+
+    def setUp(self):
+        fragment_cache.get_cache().clear()
+
+    def test_detail_etag_and_last_modified(self):
+        url = reverse('api_trip_detail', args=[self.trip.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['title'], 'Байкал')
+        self.assertEqual(response.json()['author'], 'author')
+        self.assertFalse(response['ETag'].startswith('W/'))
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        Review.objects.create(user=self.reader, trip=self.trip, rating=5, comment='!')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['reviews_count'], 1)
+
+    def test_list_sparse_fields_and_cursor(self):
+        make_trip(self.author, title='Алтай', start_date=datetime.date(2023, 1, 1))
+        url = reverse('api_trip_list')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'fields': 'id,title'})
+        self.assertNotIn('description', context.captured_queries[0]['sql'])
+        self.assertEqual(response.json()['results'][0], {'id': self.trip.pk, 'title': 'Байкал'})
+
+        # Только агрегат валидатора, без выборки поездок
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'fields': 'id,title'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(url, {'fields': 'id,nope'}).status_code, 400)
+
+        self.trip.title = 'Озеро Байкал'
+        self.trip.save()
+        response = self.client.get(url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        # Запись в обход сигналов (команда, другой процесс) версию списка в кэше не меняет
+        etag = response['ETag']
+        Trip.objects.filter(pk=self.trip.pk).update(
+            title='Байкал зимой', updated_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        response = self.client.get(url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_photos_and_reviews(self):
+        TripPhoto.objects.create(trip=self.trip, image='trip_photos/a.jpg', variants_ready=True)
+        photos = self.client.get(reverse('api_trip_photos', args=[self.trip.pk])).json()['results']
+        self.assertTrue(photos[0]['thumbnail'].endswith('a.220w.webp'))
+
+        url = reverse('api_trip_reviews', args=[self.trip.pk])
+        review = Review.objects.create(user=self.reader, trip=self.trip, rating=4, comment='Хорошо')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['comment'], 'Хорошо')
+        review.comment = 'Отлично'
+        review.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['results'][0]['comment'], 'Отлично')
+        self.assertEqual(self.client.get(reverse('api_trip_reviews', args=[0])).status_code, 404)
+
+
+class AsyncViewsTests(TempMediaMixin, TransactionTestCase):
+    """Выборки асинхронных страниц идут в других потоках, поэтому без общей транзакции"""
+    databases = '__all__'
+    serialized_rollback = True
+
+    def setUp(self):
+        travel_map.cache.clear()
+        self.author = User.objects.create_user('author', password='pass')
+        UserProfile.objects.create(user=self.author)
+        self.reader = User.objects.create_user('reader', password='pass')
+        self.trip = make_trip(self.author, title='Поездка в горы')
+        Review.objects.create(user=self.reader, trip=self.trip, rating=4, comment='Красиво!')
+        self.client = AsyncClient()
+        self.client.force_login(self.author)
+        views = async_views(True)
+        views.__enter__()
+        self.addCleanup(views.__exit__, None, None, None)
+
+    async def test_pages_render_with_concurrent_queries(self):
+        response = await self.client.get(reverse('home'))
+        self.assertContains(response, 'Поездка в горы')
+        response = await self.client.get(reverse('trip_detail', args=[self.trip.pk]))
+        self.assertContains(response, 'Красиво!')
+        self.assertEqual(response.context['reviews'][0].user, self.reader)
+        response = await self.client.get(reverse('profile'))
+        self.assertContains(response, '<h3>1</h3>')
+        self.assertEqual(response.context['user_trips'][0], self.trip)
+        response = await self.client.get(reverse('my_reviews'))
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.client.get(reverse('trip_detail', args=[self.trip.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+        anonymous = await AsyncClient().get(reverse('profile'))
+        self.assertEqual(anonymous.status_code, 302)
+
+    async def test_review_post_uses_sync_view(self):
+        client = AsyncClient()
+        await client.aforce_login(self.reader)
+        other = await Trip.objects.acreate(
+            user=self.author, title='Еще одна', country='Грузия',
+            start_date=datetime.date(2024, 6, 1), end_date=datetime.date(2024, 6, 3),
+        )
+        response = await client.post(reverse('trip_detail', args=[other.pk]), {'rating': 5, 'comment': 'Ура'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Review.objects.filter(trip=other, user=self.reader).aexists())
+
+    def test_bench_asgi(self):
+        output = os.path.join(self.media_root, 'bench_asgi.json')
+        call_command('bench_asgi', requests=4, concurrency=2, output=output, stdout=StringIO())
+        with open(output, encoding='utf-8') as result_file:
+            results = {(row['route'], row['server']): row for row in json.load(result_file)['results']}
+        self.assertEqual(results[('profile', 'asgi')]['status'], [200])
+        self.assertEqual(results[('trip_detail', 'wsgi')]['status'], [200])
+
+
+class GatherQueriesTests(SimpleTestCase):
+    def gather(self):
+        return async_to_sync(loaders.gather_queries)(threading.get_ident, threading.get_ident)
+
+    def test_serial_in_one_thread_without_pool(self):
+        with mock.patch.object(loaders.connections, 'close_all') as close_all:
+            first, second = self.gather()
+        self.assertEqual(first, second)
+        close_all.assert_not_called()
+
+    def test_concurrent_threads_with_pool(self):
+        pooled = {**connections.settings['default'], 'OPTIONS': {'pool': True}}
+        with mock.patch.dict(connections.settings, {'default': pooled}), \
+                mock.patch.object(loaders.connections, 'close_all') as close_all:
+            self.gather()
+        self.assertEqual(close_all.call_count, 2)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_STICKY_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+    """Выбор базы проверяется без запросов: псевдоним replica1 не обязан существовать"""
+
+    def view(self, write=False):
+        def view(request):
+            self.seen = {'read': router.db_for_read(Trip), 'session': router.db_for_read(Session)}
+            if write:
+                router.db_for_write(Review)
+                self.seen['after_write'] = router.db_for_read(Trip)
+            return HttpResponse()
+        return view
+
+    def request(self, method='get', cookies=None, write=False):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaMiddleware(self.view(write))(request)
+
+    def test_reads_of_safe_requests_go_to_replica(self):
+        response = self.request()
+        self.assertEqual(self.seen, {'read': 'replica1', 'session': 'default'})
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(Trip), 'default')
+
+        self.request('post')
+        self.assertEqual(self.seen['read'], 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.request()
+        self.assertEqual(self.seen['read'], 'default')
+
+    def test_write_sticks_to_primary(self):
+        response = self.request(write=True)
+        self.assertEqual(self.seen['after_write'], 'default')
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+
+        self.request(cookies={STICKY_COOKIE: cookie.value})
+        self.assertEqual(self.seen['read'], 'default')
+        self.request(cookies={STICKY_COOKIE: '0'})
+        self.assertEqual(self.seen['read'], 'replica1')
+
+    def test_async_requests_and_worker_threads(self):
+        async def view(request):
+            self.seen = {'thread': await sync_to_async(router.db_for_read, thread_sensitive=False)(Trip)}
+            await sync_to_async(router.db_for_write)(Review)
+            self.seen['after_write'] = router.db_for_read(Trip)
+            return HttpResponse()
+
+        response = asyncio.run(ReplicaMiddleware(view)(RequestFactory().get('/')))
+        self.assertEqual(self.seen, {'thread': 'replica1', 'after_write': 'default'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    THROTTLE_RATES={'login_ip': (100, 60), 'login_username': (3, 60), 'register_ip': (2, 60)},
+)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('traveler', email='Traveler@example.com', password='right-pass')
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+
+    def login(self, password, username='traveler'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+
+    def test_only_atomic_shared_cache_trusted(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem, THROTTLE_CACHE_ALIAS='default'):
+            self.assertFalse(throttle.is_shared())
+        filebased = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.id(),
+        }}
+        with override_settings(CACHES=filebased, THROTTLE_CACHE_ALIAS='default'):
+            self.assertFalse(throttle.is_shared())
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(CACHES=redis, THROTTLE_CACHE_ALIAS='default'):
+            self.assertTrue(throttle.is_shared())
+
+    def test_login_limited_by_username_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('wrong').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.login('right-pass')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertContains(response, 'Слишком много попыток', status_code=429)
+        # Другое имя с того же адреса проходит: лимит по адресу выше
+        self.assertEqual(self.login('wrong', username='someone').status_code, 200)
+
+    def test_successful_login_resets_username_counter(self):
+        self.login('wrong')
+        self.login('wrong')
+        self.assertEqual(self.login('right-pass').status_code, 302)
+        self.client.logout()
+        for _ in range(3):
+            self.assertEqual(self.login('wrong').status_code, 200)
+
+    def test_register_limited_by_ip(self):
+        data = {'username': 'bot', 'email': 'bot@example.com', 'first_name': 'Б', 'last_name': 'Б',
+                'password1': 'x', 'password2': 'y'}
+        self.client.post(reverse('register'), data)
+        self.client.post(reverse('register'), data)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('register'), data)
+        self.assertEqual(response.status_code, 429)
+        other_ip = self.client.post(reverse('register'), data, REMOTE_ADDR='198.51.100.7')
+        self.assertEqual(other_ip.status_code, 200)
+
+    def test_email_uniqueness_ignores_case(self):
+        form = CustomUserCreationForm(data={
+            'username': 'other', 'email': 'traveler@EXAMPLE.com', 'first_name': 'И', 'last_name': 'Ф',
+            'password1': 'Str0ng-pass-1', 'password2': 'Str0ng-pass-1',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+    def test_bench_auth_throttle(self):
+        stdout = StringIO()
+        call_command('bench_auth_throttle', attempts=6, ips=1, stdout=stdout)
+        output = stdout.getvalue()
+        # Лимит register_ip = 2: остальные четыре регистрации отклонены до формы
+        self.assertIn('302: 2, 429: 4', output)
+        self.assertIn('register: сэкономлено CPU', output)
+        self.assertFalse(User.objects.filter(username__startswith='bot-').exists())
+
+
+class CachedAuthTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('traveler', email='t@example.com', password='pass')
+        self.profile = UserProfile.objects.create(user=self.user, bio='Старое', avatar=make_image('a.jpg'))
+        self.client.force_login(self.user)
+        self.client.get(reverse('edit_profile'))
+
+    def page_user(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('delete_avatar'))
+        return response.context['user']
+
+    def test_user_and_profile_come_from_cache(self):
+        user = self.page_user()
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.profile.bio, 'Старое')
+
+    def test_edit_profile_writes_through(self):
+        response = self.client.post(reverse('edit_profile'), {
+            'username': 'traveler', 'email': 't@example.com', 'first_name': 'Новое', 'last_name': 'Имя',
+            'bio': 'Новое о себе',
+        })
+        self.assertEqual(response.status_code, 302)
+        user = self.page_user()
+        self.assertEqual((user.first_name, user.profile.bio), ('Новое', 'Новое о себе'))
+
+    def test_process_local_cache_not_trusted(self):
+        # Блокировка в обход сигналов: кэш этого процесса держит активного пользователя
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        with override_settings(AUTH_USER_CACHE_REQUIRE_SHARED=True):
+            self.assertEqual(self.client.get(reverse('profile')).status_code, 302)
+
+    def test_delete_avatar_and_variants_refresh_cache(self):
+        self.assertTrue(self.page_user().profile.avatar)
+        self.client.post(reverse('delete_avatar'))
+        self.assertFalse(self.page_user().profile.avatar)
+
+        self.profile.refresh_from_db()
+        self.profile.avatar = make_image('b.jpg')
+        self.profile.save()
+        self.client.get(reverse('delete_avatar'))
+        images.build_avatar_variants(self.profile.pk)
+        response = self.client.get(reverse('delete_avatar'))
+        self.assertTrue(response.context['user'].profile.avatar_variants_ready)
+
+    def test_password_change_logs_out(self):
+        self.user.set_password('new-pass')
+        self.user.save()
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ImportDiariesTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        travel_map.cache.clear()
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        with open(os.path.join(self.source, 'photo.jpg'), 'wb') as photo:
+            photo.write(make_image().read())
+        with open(os.path.join(self.source, 'fake.jpg'), 'wb') as photo:
+            photo.write(b'not an image')
+
+    def trip(self, title, username='author', **extra):
+        return {'username': username, 'title': title, 'country': 'Грузия', 'start_date': '2024-05-01',
+                'end_date': '2024-05-03', 'description': 'Рассказ', **extra}
+
+    def write(self, name, records):
+        path = os.path.join(self.source, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def run_import(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_diaries', path, photos_root=self.source, batch_size=2, workers=2,
+                     stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_jsonl_import_validates_and_refreshes_aggregates(self):
+        path = self.write('trips.jsonl', [
+            self.trip('Тбилиси', photos=[{'path': 'photo.jpg', 'caption': 'Вид'}, 'fake.jpg'], reviews=[
+                {'username': 'reader', 'rating': 5, 'comment': 'Супер'},
+                {'username': 'ghost', 'rating': 4, 'comment': 'Кто я'},
+                {'username': 'reader', 'rating': 9, 'comment': 'Плохая оценка'},
+            ]),
+            self.trip(''),
+            self.trip('Батуми', username='nobody'),
+        ])
+        with mock.patch.object(fragment_cache, 'bump', wraps=fragment_cache.bump) as bump:
+            stdout, stderr = self.run_import(path, method='bulk')
+
+        trip = Trip.objects.get()
+        bump.assert_any_call([trip.pk])
+        self.assertEqual((trip.title, trip.user, trip.approved_reviews_count, trip.rating_sum),
+                         ('Тбилиси', self.author, 1, 5))
+        self.assertIsNotNone(trip.country_ref_id)
+        photo = trip.photos.get()
+        self.assertEqual((photo.caption, photo.variants_ready), ('Вид', False))
+        self.assertTrue(default_storage.exists(photo.image.name))
+        self.assertEqual(UserStats.objects.get(user=self.author).trips_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.reader).reviews_count, 1)
+        self.assertEqual(CountryStats.objects.get().trips_count, 1)
+        self.assertIn('поездок: 1', stdout)
+        self.assertIn('отклонено: 5', stdout)
+        self.assertIn('Строка 2', stderr)
+        self.assertIn("'nobody'", stderr)
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('trips.jsonl', [self.trip(f'Поездка {index}') for index in range(5)])
+        with open(f'{path}.checkpoint', 'w', encoding='utf-8') as checkpoint:
+            json.dump({'input': os.path.abspath(path), 'line': 3, 'finished': False,
+                       'counts': {'trips': 3, 'reviews': 0, 'photos': 0, 'rejected': 0}}, checkpoint)
+        stdout, _ = self.run_import(path)
+        self.assertIn('Продолжаем после строки 3', stdout)
+        self.assertEqual(sorted(Trip.objects.values_list('title', flat=True)), ['Поездка 3', 'Поездка 4'])
+        self.assertIn('поездок 5', stdout)
+
+        stdout, _ = self.run_import(path)
+        self.assertIn('уже загружен', stdout)
+        self.assertEqual(Trip.objects.count(), 2)
+
+    def test_csv_with_photos_column(self):
+        path = os.path.join(self.source, 'trips.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as source:
+            writer = csv.DictWriter(source, ['username', 'title', 'country', 'start_date', 'end_date',
+                                             'description', 'photos'])
+            writer.writeheader()
+            writer.writerow({**self.trip('Ереван'), 'photos': 'photo.jpg|photo.jpg'})
+        self.run_import(path)
+        self.assertEqual(list(Trip.objects.get().photos.values_list('order', flat=True)), [0, 1])
+
+
+class TripPurgeTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='pass')
+        self.reader = User.objects.create_user('reader')
+        self.trip = make_trip(self.user)
+        self.photo = TripPhoto.objects.create(trip=self.trip, image=make_image())
+        Review.objects.create(trip=self.trip, user=self.reader, rating=5, comment='Хорошо')
+        user_stats.refresh([self.user.pk, self.reader.pk])
+        self.client.force_login(self.user)
+
+    def test_delete_hides_then_purges(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('delete_trip', args=[self.trip.pk]))
+        self.assertRedirects(response, reverse('home'))
+        self.assertFalse(Trip.objects.filter(pk=self.trip.pk).exists())
+        self.assertEqual(self.client.get(self.trip.get_absolute_url()).status_code, 404)
+        self.assertEqual(UserStats.objects.get(user=self.user).trips_count, 0)
+        # Строки еще на месте - их удалит фоновая очистка
+        self.assertTrue(Trip.all_objects.filter(pk=self.trip.pk).exists())
+        self.assertEqual(TripPhoto.objects.filter(trip_id=self.trip.pk).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        self.assertFalse(Trip.all_objects.filter(pk=self.trip.pk).exists())
+        self.assertFalse(TripPhoto.objects.exists())
+        self.assertFalse(Review.objects.exists())
+        self.assertFalse(default_storage.exists(self.photo.image.name))
+        self.assertEqual(UserStats.objects.get(user=self.user).trips_count, 0)
+        self.assertEqual(UserStats.objects.get(user=self.reader).reviews_count, 0)
+
+    def test_shared_file_kept(self):
+        other = make_trip(self.user, title='Другая')
+        TripPhoto.objects.create(trip=other, image=self.photo.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_trip', args=[self.trip.pk]))
+        self.assertFalse(TripPhoto.objects.filter(trip_id=self.trip.pk).exists())
+        self.assertTrue(default_storage.exists(self.photo.image.name))
+
+    def test_leftovers_purged_by_command(self):
+        Trip.objects.filter(pk=self.trip.pk).update(deleted_at=datetime.datetime.now(datetime.timezone.utc))
+        call_command('purge_deleted_trips', '--batch-size=1', stdout=StringIO())
+        self.assertFalse(Trip.all_objects.exists())
+        self.assertFalse(Review.objects.exists())
+
+    def test_replaced_avatar_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.create(user=self.user, avatar=make_image('a.jpg'))
+        old = profile.avatar.name
+        self.assertTrue(default_storage.exists(variant_names(old, 'avatar')[0]))
+        with self.captureOnCommitCallbacks(execute=True):
+            # Другое содержимое: тот же снимок остался бы тем же файлом
+            profile.avatar = make_image('b.jpg', (40, 30))
+            profile.save()
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(default_storage.exists(variant_names(old, 'avatar')[0]))
+        self.assertTrue(default_storage.exists(profile.avatar.name))
+
+
+class GcMediaTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        # Каждому тесту свой каталог: файлы прошлых тестов для него были бы мусором
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=self.media_root)))
+        user = User.objects.create_user('author')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photo = TripPhoto.objects.create(trip=make_trip(user), image=make_image())
+        self.live = [self.photo.image.name, *variant_names(self.photo.image.name, 'photo')]
+        folder = os.path.dirname(self.photo.image.name)
+        self.orphans = [f'{folder}/lost.jpg', f'{folder}/lost.220w.webp', 'avatars/2020/01/01/gone.64w.jpg']
+        for name in self.orphans:
+            default_storage.save(name, make_image())
+        self.fresh = default_storage.save(f'{folder}/uploading.jpg', make_image())
+        old = datetime.datetime(2020, 1, 1).timestamp()
+        for name in [*self.live, *self.orphans]:
+            os.utime(default_storage.path(name), (old, old))
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', '--chunk=2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_keeps_files(self):
+        output = self.gc('--dry-run', '--verbose-files')
+        for name in self.orphans:
+            self.assertIn(name, output)
+            self.assertTrue(default_storage.exists(name))
+        self.assertIn('Было бы удалено: 3', output)
+
+    def test_sweep_removes_only_garbage(self):
+        self.assertIn('Удалено: 3', self.gc())
+        for name in self.orphans:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in [*self.live, self.fresh]:
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_resumes_from_state(self):
+        state = os.path.join(self.media_root, 'gc.json')
+        self.gc('--state', state, '--max-files=1')
+        # Остановились внутри avatars/2020/01/01 - пройден только его родитель
+        with open(state, encoding='utf-8') as state_file:
+            self.assertEqual(json.load(state_file)['after'], 'avatars/2020/01')
+        self.assertFalse(default_storage.exists(self.orphans[2]))
+        self.assertTrue(default_storage.exists(self.orphans[0]))
+        self.assertIn('Удалено: 2', self.gc('--state', state))
+        self.assertFalse(os.path.exists(state))
+
+
+class StaticAssetsTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.static_override = override_settings(STATIC_ROOT=cls.static_root)
+        cls.static_override.enable()
+        call_command('collectstatic', '--noinput', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_override.disable()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def hashed_url(self):
+        return static('css/diary.css')
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        url = self.hashed_url()
+        self.assertRegex(url, r'^/static/css/diary\.[0-9a-f]{12}\.css$')
+        name = url[len(settings.STATIC_URL):]
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, name + '.gz')))
+
+    def test_negotiates_encoding_and_caches_forever(self):
+        url = self.hashed_url()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        css = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'.trip-card', css)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'.trip-card', b''.join(response.streaming_content))
+
+    def test_unhashed_and_compressed_names(self):
+        response = self.client.get('/static/css/diary.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(self.hashed_url() + '.gz').status_code, 404)
+
+    def test_async_chain_served_without_thread_switch(self):
+        async def page(request):
+            return HttpResponse('page')
+
+        middleware = StaticFilesMiddleware(page)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(RequestFactory().get(self.hashed_url())))
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+        response = asyncio.run(middleware(RequestFactory().get('/trips/')))
+        self.assertEqual(response.content, b'page')
+
+    def test_pages_have_no_inline_styles(self):
+        response = self.client.get(reverse('travel_map'))
+        self.assertContains(response, self.hashed_url())
+        self.assertNotContains(response, '<style')
+        self.assertNotContains(response, 'style="')
+
+
+class CompressionTests(TestCase):
+    def middleware(self, response):
+        return CompressionMiddleware(lambda request: response)
+
+    def test_page_gzipped_and_minified(self):
+        user = User.objects.create_user('author')
+        trip = make_trip(user)
+        plain = self.client.get(trip.get_absolute_url())
+        self.assertNotIn('\n    ', plain.content.decode())
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(trip.get_absolute_url(), HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertIn(trip.title, gzip.decompress(response.content).decode())
+
+    def test_streaming_response(self):
+        chunks = [b'<p>' + b'x' * 500 + b'</p>'] * 3
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = StreamingHttpResponse(iter(chunks), content_type='text/html')
+        response['ETag'] = '"abc"'
+        response = self.middleware(response)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(chunks))
+
+    def test_pages_with_csrf_token_not_brotli(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        with mock.patch.object(compression, 'brotli', mock.Mock()):
+            self.assertEqual(compression.choose_encoding(request), 'br')
+            get_token(request)
+            self.assertEqual(compression.choose_encoding(request), 'gzip')
+
+    def test_skips_small_and_binary(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        small = self.middleware(HttpResponse('коротко'))(request)
+        self.assertFalse(small.has_header('Content-Encoding'))
+        image = self.middleware(HttpResponse(b'\xff' * 1000, content_type='image/jpeg'))(request)
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+    def test_minify_keeps_significant_whitespace(self):
+        self.assertEqual(minify('<div>\n    <p>a  b</p>\n\n    </div>'), '<div>\n<p>a  b</p>\n</div>')
+        source = '<pre>\n    код\n</pre>'
+        self.assertEqual(minify(source), source)
+
+    def test_bench_render(self):
+        user = User.objects.create_user('author')
+        UserProfile.objects.create(user=user)
+        make_trip(user)
+        out = StringIO()
+        call_command('bench_render', '--requests=1', '--warmup=0', stdout=out)
+        self.assertIn('trip_detail', out.getvalue())
+        self.assertIn('раза меньше', out.getvalue())
+
+
+class ReviewModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.moderator = User.objects.create_user('moderator', is_staff=True)
+        cls.moderator.user_permissions.add(*Permission.objects.filter(
+            codename__in=['change_review', 'delete_review'],
+        ))
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        cls.trips = make_trips(cls.admin, 2)
+        created = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        for index, reader in enumerate(cls.readers):
+            for trip in cls.trips:
+                Review.objects.create(
+                    user=reader, trip=trip, rating=4, comment='!', is_approved=False,
+                    created_at=created + datetime.timedelta(hours=index * 2 + trip.pk),
+                )
+
+    def assertApproved(self, *counts):
+        for trip, count in zip(self.trips, counts):
+            trip.refresh_from_db()
+            self.assertEqual(trip.approved_reviews_count, count)
+
+    def test_admin_bulk_actions(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:sait_app_review_changelist')
+        ids = list(Review.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(url, {'action': 'approve_reviews', '_selected_action': ids})
+        self.assertApproved(3, 3)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "sait_app_review"')]
+        self.assertEqual(len(updates), 1)
+        trip_updates = [q['sql'] for q in ctx.captured_queries
+                        if q['sql'].startswith('UPDATE "sait_app_trip" SET "approved_reviews_count"')]
+        self.assertEqual(len(trip_updates), 1)
+
+        rejected = Review.objects.filter(trip=self.trips[0]).values_list('pk', flat=True)
+        self.client.post(url, {'action': 'reject_reviews', '_selected_action': list(rejected)})
+        self.assertApproved(0, 3)
+
+    def test_moderation_queue_cursor(self):
+        self.client.force_login(self.readers[0])
+        self.assertEqual(self.client.get(reverse('moderation')).status_code, 403)
+
+        self.client.force_login(self.moderator)
+        with mock.patch.object(views, 'MODERATION_PER_PAGE', 4):
+            first = self.client.get(reverse('moderation'))
+            second = self.client.get(reverse('moderation'), {'cursor': first.context['reviews'].next_cursor})
+        pending = list(Review.objects.order_by('created_at', 'id'))
+        self.assertEqual(list(first.context['reviews']), pending[:4])
+        self.assertEqual(list(second.context['reviews']), pending[4:])
+        self.assertFalse(second.context['reviews'].has_next())
+
+    def test_moderation_approve_and_delete(self):
+        self.client.force_login(self.moderator)
+        first, second = self.readers[:2]
+        approve = Review.objects.filter(user=first).values_list('pk', flat=True)
+        response = self.client.post(reverse('moderation'), {'action': 'approve', 'review': list(approve)})
+        self.assertRedirects(response, reverse('moderation'))
+        self.assertApproved(1, 1)
+
+        delete = Review.objects.filter(user=second).values_list('pk', flat=True)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('moderation'), {'action': 'delete', 'review': list(delete)})
+        self.assertFalse(Review.objects.filter(user=second).exists())
+        self.assertFalse(any(q['sql'].startswith('UPDATE "sait_app_trip"') for q in ctx.captured_queries))
+        self.assertApproved(1, 1)
+        self.assertEqual(Review.objects.filter(is_approved=False).count(), 2)
+
+    def test_moderation_ignores_bad_ids_and_deleted_trips(self):
+        self.client.force_login(self.moderator)
+        response = self.client.post(reverse('moderation'), {'action': 'approve', 'review': ['abc', '']})
+        self.assertRedirects(response, reverse('moderation'))
+        self.assertApproved(0, 0)
+
+        Trip.objects.filter(pk=self.trips[0].pk).update(deleted_at=datetime.datetime.now(datetime.timezone.utc))
+        response = self.client.get(reverse('moderation'))
+        self.assertEqual({review.trip_id for review in response.context['reviews']}, {self.trips[1].pk})
+        hidden = Review.objects.filter(trip=self.trips[0]).values_list('pk', flat=True)
+        self.client.post(reverse('moderation'), {'action': 'approve', 'review': list(hidden)})
+        self.assertFalse(Review.objects.filter(trip=self.trips[0], is_approved=True).exists())
+
+
+@override_settings(LEADERBOARD_PRIOR_WEIGHT=5, LEADERBOARD_MIN_REVIEWS=1)
+class LeaderboardTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(10)]
+
+    def setUp(self):
+        leaderboard.cache.delete(leaderboard.MEAN_KEY)
+
+    def review(self, trip, ratings):
+        Review.objects.bulk_create(
+            Review(user=reader, trip=trip, rating=rating, comment='!')
+            for reader, rating in zip(self.readers, ratings)
+        )
+
+    def rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_leaderboard', stdout=StringIO())
+
+    def test_confidence_beats_single_review(self):
+        lucky = make_trip(self.author, title='Один отзыв', country='Франция')
+        solid = make_trip(self.author, title='Много отзывов', country='Франция')
+        weak = make_trip(self.author, title='Плохая', country='Грузия')
+        make_trip(self.author, title='Без отзывов')
+        self.review(lucky, [5])
+        self.review(solid, [5] * 8 + [4] * 2)
+        self.review(weak, [1] * 5)
+        self.rebuild()
+
+        self.assertEqual([r.trip for r in leaderboard.top()], [solid, lucky, weak])
+        self.assertEqual([r.trip for r in leaderboard.top(lucky.country_ref_id)], [solid, lucky])
+        mean = (5 + 48 + 5) / 16
+        self.assertAlmostEqual(TripRanking.objects.get(trip=lucky).score, (5 * mean + 5) / 6)
+
+    def test_incremental_updates(self):
+        trip = make_trip(self.author, country='Франция')
+        self.review(trip, [4, 4])
+        ranking = TripRanking.objects.get(trip=trip)
+        self.assertEqual((ranking.reviews_count, ranking.country.iso2), (2, 'FR'))
+
+        trip.country = 'Грузия'
+        trip.save()
+        self.assertEqual(TripRanking.objects.get(trip=trip).country.iso2, 'GE')
+
+        Review.objects.filter(trip=trip).update(is_approved=False)
+        self.assertFalse(TripRanking.objects.filter(trip=trip).exists())
+
+        Review.objects.filter(trip=trip).update(is_approved=True)
+        trip_purge.mark_deleted(trip)
+        self.assertFalse(TripRanking.objects.filter(trip=trip).exists())
+
+    def test_mean_shared_through_database(self):
+        trip = make_trip(self.author)
+        self.review(trip, [5, 3])
+        self.assertEqual(leaderboard.prior_mean(), 4)
+        self.review(make_trip(self.author), [1, 1])
+        # Другой процесс со своим кэшем берет то же среднее из БД, а не считает заново
+        leaderboard.cache.delete(leaderboard.MEAN_KEY)
+        self.assertEqual(leaderboard.prior_mean(), 4)
+
+        self.rebuild()
+        self.assertEqual(LeaderboardState.objects.get().mean, 2.5)
+        leaderboard.cache.delete(leaderboard.MEAN_KEY)
+        self.assertEqual(leaderboard.prior_mean(), 2.5)
+
+    def test_page_reads_only_rankings(self):
+        for index in range(3):
+            self.review(make_trip(self.author, title=f'Поездка {index}', country='Франция'), [5, 4])
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('top_trips'), {'country': 'fr'})
+        self.assertEqual(len(response.context['rankings']), 3)
+        self.assertEqual(response.context['country'].iso2, 'FR')
+        self.assertContains(response, 'Поездка 2')
+
+
+class CountryFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.french = [make_trip(cls.author, title=f'Франция {i}', country=country)
+                      for i, country in enumerate(['Франция', 'франция', 'France', 'FR', 'Франция'])]
+        make_trip(cls.author, title='Грузия', country='Грузия')
+        cls.unknown = make_trip(cls.author, title='Нарния', country='Нарния')
+
+    def setUp(self):
+        travel_map.cache.clear()
+
+    def test_facets_from_cache(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual([(f['iso2'], f['trips']) for f in response.context['facets']], [('FR', 5), ('GE', 1)])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        self.assertFalse(any('sait_app_countrystats' in q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_trip(self.author, country='Georgia')
+        facets = self.client.get(reverse('home')).context['facets']
+        self.assertEqual([(f['iso2'], f['trips']) for f in facets], [('FR', 5), ('GE', 2)])
+
+    def test_filter_follows_cursor(self):
+        response = self.client.get(reverse('home'), {'country': 'fr'})
+        self.assertEqual(response.context['country']['iso2'], 'FR')
+        seen = [trip.pk for trip in response.context['trips']]
+        cursor = response.context['trips'].next_cursor
+        feed = self.client.get(reverse('trip_feed'), {'country': 'FR', 'cursor': cursor})
+        seen += [trip.pk for trip in feed.context['trips']]
+        self.assertFalse(feed.has_header('X-Next-Cursor'))
+        self.assertEqual(sorted(seen), sorted(trip.pk for trip in self.french))
+
+        unknown = self.client.get(reverse('home'), {'country': 'XX'})
+        self.assertIsNone(unknown.context['country'])
+        self.assertEqual(len(unknown.context['trips']), 4)
+
+    def test_new_alias_links_old_trips(self):
+        self.assertIsNone(self.unknown.country_ref)
+        france = self.french[0].country_ref
+        CountryAlias.objects.create(country=france, alias='нарния')
+        travel_map.invalidate_aliases()
+        self.assertEqual(travel_map.relink_trips(), 1)
+        self.unknown.refresh_from_db()
+        self.assertEqual(self.unknown.country_ref, france)
+        self.assertEqual(CountryStats.objects.get(country=france).trips_count, 6)
+
+
+class TripPeriodTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        day = datetime.date
+        cls.may = make_trip(cls.author, title='Май', start_date=day(2024, 5, 1), end_date=day(2024, 5, 10))
+        cls.weekend = make_trip(cls.author, title='Выходные', start_date=day(2024, 5, 4), end_date=day(2024, 5, 5))
+        cls.june = make_trip(cls.author, title='Июнь', start_date=day(2024, 6, 1), end_date=day(2024, 6, 1))
+
+    def titles(self, queryset):
+        return sorted(trip.title for trip in queryset)
+
+    def test_queryset_filters(self):
+        day = datetime.date
+        self.assertEqual(self.titles(Trip.objects.in_progress(day(2024, 5, 5))), ['Выходные', 'Май'])
+        self.assertEqual(self.titles(Trip.objects.in_progress(day(2024, 5, 11))), [])
+        self.assertEqual(self.titles(Trip.objects.overlapping(day(2024, 5, 10), day(2024, 6, 1))), ['Июнь', 'Май'])
+        self.assertEqual(self.titles(Trip.objects.within(day(2024, 5, 1), day(2024, 5, 31))), ['Выходные', 'Май'])
+        self.assertEqual(self.titles(Trip.objects.spanning(day(2024, 5, 3), day(2024, 5, 6))), ['Май'])
+
+    def test_travelling_view(self):
+        within = {'date_from': '2024-05-04', 'date_to': '2024-05-31', 'mode': 'within'}
+        response = self.client.get(reverse('travelling'), within)
+        self.assertEqual(self.titles(response.context['trips']), ['Выходные'])
+        response = self.client.get(reverse('travelling'), {'date_from': '2024-06-01'})
+        self.assertEqual(self.titles(response.context['trips']), ['Июнь'])
+        response = self.client.get(reverse('travelling'), {'date_from': '2024-06-01', 'date_to': '2024-05-01'})
+        self.assertIsNone(response.context['trips'])
+        self.assertTrue(response.context['form'].errors)
+
+    def test_reversed_dates_rejected(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('add_trip'), {
+            'title': 'Наоборот', 'country': 'Россия', 'description': '!',
+            'start_date': '2024-05-10', 'end_date': '2024-05-01',
+        })
+        self.assertContains(response, 'Дата окончания не может быть раньше даты начала.')
+        self.assertFalse(Trip.objects.filter(title='Наоборот').exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'GiST-индекс есть только в PostgreSQL')
+    def test_period_filter_uses_expression(self):
+        sql = str(Trip.objects.in_progress(datetime.date(2024, 5, 5)).query)
+        self.assertIn('daterange(', sql)
+        self.assertIn('@>', sql)
+
+
+class MediaBlobTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.trip = make_trip(User.objects.create_user('author'))
+
+    def upload(self, image=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return TripPhoto.objects.create(trip=self.trip, image=image or make_image())
+
+    def test_same_content_stored_once(self):
+        first = self.upload(make_image('a.jpg'))
+        with mock.patch.object(images, 'build_variants') as build:
+            second = self.upload(make_image('b.JPG'))
+        build.assert_not_called()
+        second.refresh_from_db()
+        self.assertTrue(second.variants_ready)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^trip_photos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(MediaBlob.objects.get().refs, 2)
+        self.assertEqual(blobs.stats()['saved'], first.image.size)
+
+    def test_file_deleted_with_last_reference(self):
+        first = self.upload()
+        second = self.upload()
+        other = self.upload(make_image(size=(40, 30)))
+        files = [first.image.name, *variant_names(first.image.name, 'photo')]
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+        self.assertEqual(MediaBlob.objects.get(pk=second.image.name).refs, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+        self.assertFalse(MediaBlob.objects.filter(pk=second.image.name).exists())
+        self.assertTrue(default_storage.exists(other.image.name))
+
+    def files(self):
+        return sorted(name for _, _, names in os.walk(default_storage.path('trip_photos')) for name in names)
+
+    def test_failed_upload_releases_reference(self):
+        self.upload()
+        before = self.files()
+        with mock.patch.object(TripPhoto.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                save_trip_photos(self.trip, [make_image(), make_image(size=(40, 30))])
+        self.assertEqual(list(MediaBlob.objects.values_list('refs', flat=True)), [1])
+        self.assertEqual(self.files(), before)
+
+    def test_shared_avatar_released_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            profiles = [
+                UserProfile.objects.create(user=User.objects.create_user(f'reader{i}'), avatar=make_image())
+                for i in range(3)
+            ]
+        name = profiles[0].avatar.name
+        self.assertEqual(MediaBlob.objects.get(pk=name).refs, 3)
+        self.client.force_login(profiles[0].user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_avatar'))
+        self.assertEqual(MediaBlob.objects.get(pk=name).refs, 2)
+        self.client.force_login(profiles[1].user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_avatar'))
+        self.assertEqual(MediaBlob.objects.get(pk=name).refs, 1)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_command_rebuilds_counts_and_reports_savings(self):
+        photo = self.upload()
+        TripPhoto.objects.create(trip=self.trip, image=photo.image.name)
+        MediaBlob.objects.update(refs=5)
+        out = StringIO()
+        call_command('media_blobs', '--rebuild', stdout=out)
+        self.assertEqual(MediaBlob.objects.get().refs, 2)
+        self.assertIn('Исправлено счетчиков: 1', out.getvalue())
+        self.assertIn(f'Сэкономлено: {photo.image.size} байт', out.getvalue())
@@ -0,0 +1,111 @@
+"""Ограничение частоты входа и регистрации по скользящему окну.
+
+Каждая попытка входа или регистрации стоит сотни миллисекунд CPU на
+PBKDF2, поэтому перебор паролей с десятка адресов занимает все воркеры.
+Проверка лимита выполняется до формы - без хэширования и без запросов
+к БД, только чтение двух счетчиков из кэша.
+
+Окно считается приближенно: счетчик текущего интервала плюс доля
+счетчика предыдущего, пропорциональная непрошедшей части окна. Так не
+бывает всплеска на границе интервалов, а в кэше всего два ключа на
+правило. Правила задает settings.THROTTLE_RATES: scope -> (лимит, окно
+в секундах); scope без правила не ограничивается.
+
+Счетчики должны быть общими для всех воркеров: с LocMemCache у каждого
+процесса свои, и лимит умножается на число воркеров. Кроме того, incr
+должен быть атомарным: у файлового кэша и кэша в БД это чтение и запись,
+и одновременные попытки теряют прибавления. Поэтому годятся только Redis и
+Memcached; gunicorn.conf.py проверяет это при старте (is_shared).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Бэкенды, чьи данные не видны другим процессам
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+# Общие бэкенды с атомарным incr
+ATOMIC_BACKENDS = {
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+}
+
+
+def _cache():
+    return caches[settings.THROTTLE_CACHE_ALIAS]
+
+
+def is_shared():
+    """Видят ли счетчики все процессы и не теряют ли прибавления; django.setup() не нужен"""
+    return settings.CACHES[settings.THROTTLE_CACHE_ALIAS]['BACKEND'] in ATOMIC_BACKENDS
+
+
+def client_ip(request):
+    header = settings.THROTTLE_IP_HEADER
+    if header and request.META.get(header):
+        # X-Forwarded-For: client, proxy1, proxy2 - берем адрес клиента
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _keys(scope, ident, seconds, now):
+    digest = hashlib.sha1(str(ident).encode()).hexdigest()[:20]
+    index = int(now // seconds)
+    return f'throttle:{scope}:{digest}:{index}', f'throttle:{scope}:{digest}:{index - 1}'
+
+
+def retry_after(scope, ident):
+    """Через сколько секунд можно повторить попытку; 0 - лимит не исчерпан"""
+    rate = settings.THROTTLE_RATES.get(scope)
+    if rate is None:
+        return 0
+    limit, seconds = rate
+    now = time.time()
+    current_key, previous_key = _keys(scope, ident, seconds, now)
+    counts = _cache().get_many([current_key, previous_key])
+    elapsed = now % seconds
+    weight = 1 - elapsed / seconds
+    used = counts.get(current_key, 0) + counts.get(previous_key, 0) * weight
+    if used < limit:
+        return 0
+    return int(seconds - elapsed) + 1
+
+
+def hit(scope, ident):
+    rate = settings.THROTTLE_RATES.get(scope)
+    if rate is None:
+        return
+    seconds = rate[1]
+    current_key, _ = _keys(scope, ident, seconds, time.time())
+    cache = _cache()
+    # Ключ нужен и в следующем интервале - как «предыдущий»
+    if not cache.add(current_key, 1, timeout=2 * seconds):
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            cache.set(current_key, 1, timeout=2 * seconds)
+
+
+def reset(scope, ident):
+    rate = settings.THROTTLE_RATES.get(scope)
+    if rate is not None:
+        _cache().delete_many(_keys(scope, ident, rate[1], time.time()))
+
+
+def check(rules):
+    """Проверяет правила [(scope, ident)] и засчитывает попытку.
+
+    Возвращает число секунд до повтора, если хоть одно правило исчерпано;
+    отклоненная попытка не засчитывается, чтобы окно не продлевалось.
+    """
+    wait = max((retry_after(scope, ident) for scope, ident in rules), default=0)
+    if not wait:
+        for scope, ident in rules:
+            hit(scope, ident)
+    return wait
@@ -0,0 +1,278 @@
+"""Данные карты путешествий.
+
+Свободный текст Trip.country сопоставляется со справочником Country по
+нормализованным написаниям (CountryAlias). Для каждой пары (пользователь,
+страна) хранится строка UserCountryStats, для страны в целом - CountryStats.
+При изменении поездки или ее отзывов строка пользователя пересчитывается
+запросом по индексу (user, country_ref), а разница прибавляется к общей
+строке страны, поэтому стоимость не зависит от числа поездок в стране.
+
+GeoJSON и фасеты ленты (число поездок по странам) кэшируются по версии
+области (пользователь или все поездки). Версия меняется после фиксации
+транзакции с пересчетом, ETag строится из версии без обращения к БД.
+"""
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from . import leaderboard, user_stats
+from .countries_data import COUNTRIES
+
+GLOBAL_SCOPE = 'all'
+PREFIX = 'diary:map'
+ALIASES_KEY = f'{PREFIX}:aliases'
+GENERATION_KEY = f'{PREFIX}:generation'
+STATS_FIELDS = ('trips_count', 'total_days', 'reviews_count', 'rating_sum')
+# Готовые GeoJSON и фасеты хранятся до смены версии, таймаут только освобождает память
+GEOJSON_TIMEOUT = 24 * 60 * 60
+
+
+def normalize(text):
+    """Написание страны для сравнения: регистр, ё, точки и лишние пробелы"""
+    text = (text or '').lower().replace('ё', 'е').replace('.', '')
+    return ' '.join(text.split())
+
+
+def country_aliases(country_row):
+    iso2, iso3, name, name_en, _latitude, _longitude, extra = country_row
+    return {normalize(alias) for alias in (iso2, iso3, name, name_en, *extra)}
+
+
+def sync_countries():
+    """Добавляет и обновляет страны справочника из countries_data"""
+    from .models import Country, CountryAlias
+    existing = {country.iso2: country for country in Country.objects.all()}
+    aliases = []
+    for row in COUNTRIES:
+        iso2, iso3, name, name_en, latitude, longitude, _extra = row
+        values = {'iso3': iso3, 'name': name, 'name_en': name_en,
+                  'latitude': latitude, 'longitude': longitude}
+        country = existing.get(iso2)
+        if country is None:
+            country = Country.objects.create(iso2=iso2, **values)
+        elif any(getattr(country, field) != value for field, value in values.items()):
+            Country.objects.filter(pk=country.pk).update(**values)
+        aliases.extend(CountryAlias(country=country, alias=alias) for alias in country_aliases(row))
+    CountryAlias.objects.bulk_create(aliases, ignore_conflicts=True)
+    invalidate_aliases()
+    bump_all()
+
+
+def invalidate_aliases():
+    cache.delete(ALIASES_KEY)
+
+
+def alias_map():
+    """Словарь написание -> id страны; весь справочник помещается в один ключ кэша"""
+    from .models import CountryAlias
+    aliases = cache.get(ALIASES_KEY)
+    if aliases is None:
+        aliases = dict(CountryAlias.objects.values_list('alias', 'country_id'))
+        cache.set(ALIASES_KEY, aliases, None)
+    return aliases
+
+
+def resolve_country(text):
+    """id страны справочника для свободного текста или None"""
+    if not text:
+        return None
+    return alias_map().get(normalize(text))
+
+
+def _version_key(scope):
+    return f'{PREFIX}:version:{scope}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def version(scope):
+    """Версия данных области; один запрос к кэшу"""
+    keys = [GENERATION_KEY, _version_key(scope)]
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        # Версию вытеснили: новая не совпадет ни с одним выданным ETag
+        cache.set_many(missing, None)
+        found.update(missing)
+    return f'{found[GENERATION_KEY]}.{found[keys[1]]}'
+
+
+def bump(scopes):
+    new_version = _new_version()
+    cache.set_many({_version_key(scope): new_version for scope in scopes}, None)
+
+
+def bump_all():
+    """Устаревают данные всех пользователей сразу (после полной пересборки)"""
+    cache.set(GENERATION_KEY, _new_version(), None)
+
+
+def etag(scope):
+    return f'"map-{scope}-{version(scope)}"'
+
+
+def _actual_stats(user_id, country_id):
+    from .models import Trip
+    actual = Trip.objects.filter(user_id=user_id, country_ref_id=country_id).order_by().aggregate(
+        trips_count=Count('pk'),
+        # Разность дат - длительность без последнего дня, его добавляем ниже
+        total_days=Sum(F('end_date') - F('start_date')),
+        reviews_count=Sum('approved_reviews_count'),
+        rating_sum=Sum('rating_sum'),
+    )
+    duration = actual['total_days']
+    actual['total_days'] = (duration.days if duration else 0) + actual['trips_count']
+    return {field: actual[field] or 0 for field in STATS_FIELDS}
+
+
+def _refresh_pair(user_id, country_id):
+    from .models import CountryStats, UserCountryStats
+    actual = _actual_stats(user_id, country_id)
+    row = UserCountryStats.objects.select_for_update().filter(
+        user_id=user_id, country_id=country_id
+    ).first()
+    stored = {field: getattr(row, field) if row else 0 for field in STATS_FIELDS}
+    if actual == stored:
+        return False
+
+    now = timezone.now()
+    if not actual['trips_count']:
+        UserCountryStats.objects.filter(pk=row.pk).delete()
+    elif row is None:
+        UserCountryStats.objects.create(user_id=user_id, country_id=country_id, **actual)
+    else:
+        UserCountryStats.objects.filter(pk=row.pk).update(updated_at=now, **actual)
+
+    CountryStats.objects.get_or_create(country_id=country_id)
+    CountryStats.objects.filter(country_id=country_id).update(
+        updated_at=now,
+        **{field: F(field) + actual[field] - stored[field] for field in STATS_FIELDS},
+    )
+    return True
+
+
+def refresh_country_stats(pairs):
+    """Пересчитывает агрегаты для пар (id пользователя, id страны)"""
+    pairs = sorted({(user_id, country_id) for user_id, country_id in pairs
+                    if user_id is not None and country_id is not None})
+    changed_users = set()
+    for user_id, country_id in pairs:
+        with transaction.atomic():
+            if _refresh_pair(user_id, country_id):
+                changed_users.add(user_id)
+    if changed_users:
+        user_stats.refresh_countries(changed_users)
+        scopes = changed_users | {GLOBAL_SCOPE}
+        transaction.on_commit(lambda: bump(scopes))
+
+
+def refresh_trips_country_stats(trip_ids):
+    """Пересчитывает агрегаты стран, к которым относятся поездки"""
+    from .models import Trip
+    refresh_country_stats(
+        Trip.objects.filter(pk__in=trip_ids, country_ref__isnull=False)
+        .order_by().values_list('user_id', 'country_ref_id').distinct()
+    )
+
+
+def forget_user(user_id):
+    """Вычитает строки пользователя из общих агрегатов перед его удалением"""
+    from .models import CountryStats, UserCountryStats
+    rows = list(UserCountryStats.objects.select_for_update().filter(user_id=user_id))
+    for row in rows:
+        CountryStats.objects.filter(country_id=row.country_id).update(
+            updated_at=timezone.now(),
+            **{field: F(field) - getattr(row, field) for field in STATS_FIELDS},
+        )
+    UserCountryStats.objects.filter(user_id=user_id).delete()
+    if rows:
+        transaction.on_commit(lambda: bump([GLOBAL_SCOPE]))
+
+
+def relink_trips():
+    """Привязывает к справочнику поездки с ранее нераспознанным написанием страны.
+
+    Нужна после добавления написаний (CountryAlias): одно UPDATE на каждое
+    распознанное написание, агрегаты пересчитываются только для затронутых пар
+    """
+    from .models import Trip
+    unlinked = Trip.objects.filter(country_ref__isnull=True)
+    linked = 0
+    for text in unlinked.order_by().values_list('country', flat=True).distinct().iterator():
+        country_id = resolve_country(text)
+        if country_id is None:
+            continue
+        trips = unlinked.filter(country=text)
+        trip_ids = list(trips.values_list('pk', flat=True))
+        users = set(trips.values_list('user_id', flat=True))
+        linked += trips.update(country_ref_id=country_id)
+        refresh_country_stats((user_id, country_id) for user_id in users)
+        leaderboard.refresh(trip_ids)
+    return linked
+
+
+def _facets_key():
+    return f'{PREFIX}:facets:{version(GLOBAL_SCOPE)}'
+
+
+def country_facets():
+    """Страны с числом поездок для фильтра ленты - из CountryStats, в кэше до смены версии"""
+    from .models import CountryStats
+    key = _facets_key()
+    facets = cache.get(key)
+    if facets is None:
+        rows = CountryStats.objects.filter(trips_count__gt=0).order_by('-trips_count', 'country__name')
+        facets = [
+            {'id': country_id, 'iso2': iso2, 'name': name, 'trips': trips}
+            for country_id, iso2, name, trips in rows.values_list(
+                'country_id', 'country__iso2', 'country__name', 'trips_count',
+            )
+        ]
+        cache.set(key, facets, GEOJSON_TIMEOUT)
+    return facets
+
+
+def build_geojson(scope):
+    from .models import CountryStats, UserCountryStats
+    if scope == GLOBAL_SCOPE:
+        rows = CountryStats.objects.all()
+    else:
+        rows = UserCountryStats.objects.filter(user_id=scope)
+    rows = rows.filter(trips_count__gt=0).order_by('-trips_count').values_list(
+        'country__iso2', 'country__name', 'country__longitude', 'country__latitude',
+        *STATS_FIELDS,
+    )
+    features = []
+    for iso2, name, longitude, latitude, trips, days, reviews, rating_sum in rows:
+        features.append({
+            'type': 'Feature',
+            'id': iso2,
+            'geometry': {'type': 'Point', 'coordinates': [round(longitude, 2), round(latitude, 2)]},
+            'properties': {
+                'name': name,
+                'trips': trips,
+                'days': days,
+                'rating': round(rating_sum / reviews, 1) if reviews else None,
+            },
+        })
+    return json.dumps(
+        {'type': 'FeatureCollection', 'features': features},
+        ensure_ascii=False,
+        separators=(',', ':'),
+    )
+
+
+def geojson(scope):
+    """GeoJSON области, из кэша для текущей версии"""
+    key = f'{PREFIX}:geojson:{scope}:{version(scope)}'
+    body = cache.get(key)
+    if body is None:
+        body = build_geojson(scope)
+        cache.set(key, body, GEOJSON_TIMEOUT)
+    return body
@@ -0,0 +1,110 @@
+"""Удаление поездки в два шага.
+
+trip.delete() в запросе удаляет каскадом все фото и отзывы, и на каждую
+строку срабатывают сигналы - у поездки с сотнями фото ответ занимает
+секунды. mark_deleted() только ставит Trip.deleted_at (менеджер Trip.objects
+такие поездки не видит) и сразу вычитает поездку из агрегатов, а строки
+удаляет purge_trip() в фоне - порциями, каждая в своей транзакции.
+
+Поездки, чья очистка не завершилась (перезапуск процесса), дочищает
+команда purge_deleted_trips.
+"""
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import fragment_cache, leaderboard, media_gc, travel_map, user_stats
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def withdraw(trip):
+    """Убирает поездку из агрегатов карты, рейтинга, счетчиков автора и кэша фрагментов"""
+    fragment_cache.forget([trip.pk])
+    fragment_cache.bump_trips()
+    leaderboard.refresh([trip.pk])
+    travel_map.refresh_country_stats([(trip.user_id, trip.country_ref_id)])
+    user_stats.add(trip.user_id, trips_count=-1,
+                   total_days=-user_stats.trip_days(trip.start_date, trip.end_date))
+
+
+def mark_deleted(trip):
+    """Скрывает поездку и ставит удаление ее строк в очередь после коммита"""
+    from .models import Trip
+    with transaction.atomic():
+        now = timezone.now()
+        # updated_at - чтобы валидатор списка в API заметил исчезновение поездки
+        if not Trip.objects.filter(pk=trip.pk).update(deleted_at=now, updated_at=now):
+            return False
+        withdraw(trip)
+        schedule(trip.pk)
+    return True
+
+
+def _delete_batches(queryset, fields, batch_size):
+    """Удаляет строки порциями, выдавая значения ``fields`` каждой порции"""
+    model = queryset.model
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    sql = f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN (%s)'
+    while True:
+        with transaction.atomic(using=alias):
+            rows = list(queryset.using(alias).order_by('pk').values_list('pk', *fields)[:batch_size])
+            if not rows:
+                return
+            # Без сборщика каскада и сигналов: на фото и отзывы никто не ссылается,
+            # агрегаты поправляет вызывающий
+            with connection.cursor() as cursor:
+                cursor.execute(sql % ', '.join(['%s'] * len(rows)), [row[0] for row in rows])
+            yield rows
+
+
+def purge_trip(trip_id, batch_size=None):
+    """Удаляет фото, отзывы и саму помеченную поездку"""
+    from .models import Review, Trip, TripPhoto
+    batch_size = batch_size or settings.TRIP_PURGE_BATCH_SIZE
+    if not Trip.all_objects.filter(pk=trip_id, deleted_at__isnull=False).exists():
+        return False
+
+    for rows in _delete_batches(TripPhoto.objects.filter(trip_id=trip_id), ['image'], batch_size):
+        media_gc.release([image for _, image in rows])
+    for rows in _delete_batches(Review.objects.filter(trip_id=trip_id), ['user_id'], batch_size):
+        for user_id, count in Counter(user_id for _, user_id in rows).items():
+            user_stats.add(user_id, reviews_count=-count)
+
+    with transaction.atomic():
+        trip = Trip.all_objects.filter(pk=trip_id, deleted_at__isnull=False).first()
+        if trip is not None:
+            trip.delete()
+    return True
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trip-purge')
+    return _executor
+
+
+def _run(trip_id):
+    try:
+        purge_trip(trip_id)
+    except Exception:
+        logger.exception('Не удалось дочистить поездку %s', trip_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(trip_id):
+    """Ставит очистку поездки в очередь после коммита текущей транзакции"""
+    if getattr(settings, 'TRIP_PURGE_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run, trip_id))
+    else:
+        transaction.on_commit(lambda: purge_trip(trip_id))
@@ -0,0 +1,116 @@
+"""Пакетная загрузка фотографий поездки.
+
+Файлы проверяются по типу и размеру прямо во время приема запроса
+(PhotoUploadHandler), затем записываются в хранилище параллельно и
+вставляются одним bulk_create. Повторно загруженное фото не занимает
+места: хранилище по содержимому (blobs.py) отдает имя уже лежащего файла.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import transaction
+from django.db.models import Max
+
+from . import blobs, fragment_cache, images
+from .models import Trip, TripPhoto
+
+PHOTO_FIELD = 'photos'
+
+# Сигнатуры начала файла для допустимых типов
+IMAGE_SIGNATURES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/webp': (b'RIFF',),
+}
+
+
+def max_photo_size():
+    return getattr(settings, 'PHOTO_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+class PhotoUploadHandler(FileUploadHandler):
+    """Отбрасывает неподходящие фото, не дожидаясь конца загрузки файла.
+
+    Ставится первым в request.upload_handlers и только проверяет поток,
+    сами данные передаются следующим обработчикам. Отклоненные файлы
+    попадают в ``rejected`` как пары (имя файла, причина).
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejected = []
+        self.max_size = max_photo_size()
+
+    def reject(self, reason):
+        self.rejected.append((self.file_name, reason))
+        raise SkipFile(reason)
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+        if field_name != PHOTO_FIELD:
+            return
+        if content_type not in IMAGE_SIGNATURES:
+            self.reject('неподдерживаемый формат')
+        if content_length is not None and content_length > self.max_size:
+            self.reject('слишком большой файл')
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name != PHOTO_FIELD:
+            return raw_data
+        if start == 0 and not raw_data.startswith(IMAGE_SIGNATURES[self.content_type]):
+            self.reject('содержимое не похоже на изображение')
+        if start + len(raw_data) > self.max_size:
+            self.reject('слишком большой файл')
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def install_photo_upload_handler(request):
+    """Подключает проверку фото; вызывать до первого обращения к request.POST/FILES"""
+    handler = PhotoUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+def save_trip_photos(trip, files):
+    """Сохраняет фото поездки: параллельная запись файлов и один INSERT.
+
+    Порядок показа продолжает уже существующие фото поездки.
+    """
+    if not files:
+        return []
+    field = TripPhoto._meta.get_field('image')
+    photos = [TripPhoto(trip=trip) for _ in files]
+    names = [field.generate_filename(photo, upload.name) for photo, upload in zip(photos, files)]
+
+    workers = min(len(files), getattr(settings, 'PHOTO_UPLOAD_WORKERS', 8))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if isinstance(field.storage, blobs.BlobStorage):
+            # В потоках только запись и sha256; счетчики ссылок - в соединении запроса
+            saved_names = [field.storage.store(staged) for staged in pool.map(field.storage.stage, names, files)]
+        else:
+            saved_names = list(pool.map(field.storage.save, names, files))
+
+    try:
+        with transaction.atomic():
+            # Блокируем поездку, чтобы параллельные загрузки не получили одинаковый order
+            Trip.objects.select_for_update().filter(pk=trip.pk).exists()
+            last_order = trip.photos.aggregate(last=Max('order'))['last']
+            first_order = 0 if last_order is None else last_order + 1
+            for index, (photo, name) in enumerate(zip(photos, saved_names)):
+                photo.image = name
+                photo.order = first_order + index
+            photos = TripPhoto.objects.bulk_create(photos)
+    except Exception:
+        for name in saved_names:
+            field.storage.delete(name)
+        raise
+
+    fragment_cache.bump([trip.pk], 'photos')
+    for photo in photos:
+        images.schedule(images.build_trip_photo_variants, photo.pk)
+    return photos
@@ -1,22 +1,41 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views, views_async
+
+# Страницы для чтения под ASGI обслуживают асинхронные версии
+pages = views_async if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('trip/<int:pk>/', views.trip_detail, name='trip_detail'),
+    path('', pages.home, name='home'),
+    path('trips/feed/', views.trip_feed, name='trip_feed'),
+    path('trip/<int:pk>/', pages.trip_detail, name='trip_detail'),
+    path('trip/<int:pk>/reviews/', views.trip_reviews_feed, name='trip_reviews_feed'),
     path('map/', views.travel_map, name='travel_map'),
+    path('map/data.geojson', views.travel_map_data, name='travel_map_data'),
+    path('search/', views.search, name='search'),
+    path('top/', views.top_trips, name='top_trips'),
+    path('travelling/', views.travelling, name='travelling'),
+
+    # JSON API только для чтения
+    path('api/trips/', api.trip_list, name='api_trip_list'),
+    path('api/trips/<int:pk>/', api.trip_detail, name='api_trip_detail'),
+    path('api/trips/<int:pk>/photos/', api.trip_photos, name='api_trip_photos'),
+    path('api/trips/<int:pk>/reviews/', api.trip_reviews, name='api_trip_reviews'),
 
     # Авторизация
-    path('login/', auth_views.LoginView.as_view(template_name='diary/login.html'), name='login'),
+    path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='home'), name='logout'),
     path('register/', views.register, name='register'),
 
     # Личный кабинет
-    path('profile/', views.profile, name='profile'),
+    path('profile/', pages.profile, name='profile'),
+    path('profile/trips/', views.profile_trips, name='profile_trips'),
+    path('profile/reviews/', views.profile_reviews, name='profile_reviews'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('profile/delete-avatar/', views.delete_avatar, name='delete_avatar'),
-    path('my-reviews/', views.my_reviews, name='my_reviews'),
+    path('my-reviews/', pages.my_reviews, name='my_reviews'),
+    path('my-reviews/feed/', views.my_reviews_feed, name='my_reviews_feed'),
     path('add-trip/', views.add_trip, name='add_trip'),
 
     # Редактирование и удаление
@@ -24,4 +43,7 @@ urlpatterns = [
     path('trip/<int:pk>/delete/', views.delete_trip, name='delete_trip'),
     path('review/<int:pk>/edit/', views.edit_review, name='edit_review'),
     path('review/<int:pk>/delete/', views.delete_review, name='delete_review'),
+
+    # Модерация отзывов
+    path('moderation/', views.moderation, name='moderation'),
 ]
\ No newline at end of file
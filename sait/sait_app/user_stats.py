@@ -0,0 +1,76 @@
+"""Сводная статистика пользователя для личного кабинета.
+
+UserStats хранит число поездок, отзывов, посещенных стран (строк
+UserCountryStats) и сумму дней в поездках. Поездки и отзывы меняют
+счетчики приращениями через F(), поэтому стоимость не зависит от числа
+записей пользователя. Строка создается полным пересчетом при первом
+чтении (for_user), до этого приращения просто некуда прибавлять.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def trip_days(start_date, end_date):
+    if start_date and end_date:
+        return (end_date - start_date).days + 1
+    return 0
+
+
+def refresh(user_ids):
+    """Пересчитывает строки пользователей целиком, создавая недостающие"""
+    from .models import Review, Trip, UserCountryStats, UserStats
+    user_ids = set(user_ids) - {None}
+    if not user_ids:
+        return
+    values = {user_id: {'trips_count': 0, 'total_days': 0, 'reviews_count': 0, 'countries_count': 0}
+              for user_id in user_ids}
+    trips = Trip.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(
+        trips=Count('pk'), days=Sum(F('end_date') - F('start_date')),
+    )
+    for row in trips:
+        values[row['user_id']]['trips_count'] = row['trips']
+        values[row['user_id']]['total_days'] = (row['days'].days if row['days'] else 0) + row['trips']
+    for field, queryset in (('reviews_count', Review.objects), ('countries_count', UserCountryStats.objects)):
+        counts = queryset.filter(user_id__in=user_ids).order_by().values('user_id').annotate(total=Count('pk'))
+        for row in counts:
+            values[row['user_id']][field] = row['total']
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id, **fields) for user_id, fields in values.items()],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['trips_count', 'total_days', 'reviews_count', 'countries_count', 'updated_at'],
+    )
+
+
+def add(user_id, **deltas):
+    """Прибавляет приращения к счетчикам пользователя"""
+    from .models import UserStats
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    UserStats.objects.filter(user_id=user_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+
+
+def refresh_countries(user_ids):
+    """Обновляет число стран после изменения строк UserCountryStats"""
+    from .models import UserCountryStats, UserStats
+    countries = UserCountryStats.objects.filter(user_id=OuterRef('pk')).order_by().values('user_id')
+    UserStats.objects.filter(user_id__in=set(user_ids)).update(
+        countries_count=Coalesce(Subquery(countries.annotate(total=Count('pk')).values('total')), 0),
+        updated_at=timezone.now(),
+    )
+
+
+def for_user(user):
+    """Статистика пользователя; при отсутствии строки она создается"""
+    from .models import UserStats
+    stats = UserStats.objects.filter(user=user).first()
+    if stats is None:
+        refresh([user.pk])
+        stats = UserStats.objects.get(user=user)
+    return stats
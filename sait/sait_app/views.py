@@ -1,31 +1,138 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
 from django.contrib.auth import login
-from .models import Trip, Review, UserProfile, TripPhoto
-from .forms import ReviewForm, CustomUserCreationForm, TripForm, UserProfileForm, UserUpdateForm
+from django.contrib.auth import views as auth_views
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition, require_safe
+from .models import Country, CountryStats, Trip, Review, UserProfile
+from .forms import ReviewForm, CustomUserCreationForm, TravelPeriodForm, TripForm, UserProfileForm, UserUpdateForm
+from .loaders import load_trip_detail, trip_reviews_page
+from .pagination import CursorPaginator, InvalidCursor
+from .search import highlight, search_trips
+from . import leaderboard, throttle
+from . import trip_purge
+from . import travel_map as map_data
+from . import user_stats
+from .uploads import install_photo_upload_handler, save_trip_photos
+
+# Лента поездок: (start_date, id) по убыванию, id делает порядок однозначным
+HOME_FEED_ORDERING = ['-start_date', '-id']
+HOME_FEED_PER_PAGE = 4
+SEARCH_PER_PAGE = 10
+TRAVELLING_PER_PAGE = 20
+# Разделы личного кабинета и «Мои отзывы» отдаются порциями по курсору
+PROFILE_TRIPS_ORDERING = ['-start_date', '-id']
+PROFILE_REVIEWS_ORDERING = ['-created_at', '-id']
+PROFILE_PER_PAGE = 10
+MY_REVIEWS_PER_PAGE = 20
+# Очередь модерации: от старых к новым, по частичному индексу review_pending_idx
+MODERATION_ORDERING = ['created_at', 'id']
+MODERATION_PER_PAGE = 50
+
+
+def _cursor_page(request, queryset, ordering, per_page, param='cursor'):
+    paginator = CursorPaginator(queryset, ordering, per_page)
+    try:
+        return paginator.page(request.GET.get(param))
+    except InvalidCursor:
+        return paginator.page()
 
 
-def home(request):
-    trips_list = Trip.objects.all().order_by('-start_date')
+def _feed_response(request, template_name, context, page):
+    """HTML-фрагмент следующей порции; курсор продолжения - в заголовке"""
+    response = render(request, template_name, context)
+    if page.has_next():
+        response['X-Next-Cursor'] = page.next_cursor
+    return response
 
-    paginator = Paginator(trips_list, 4)
-    page = request.GET.get('page')
 
-    try:
-        trips = paginator.page(page)
-    except PageNotAnInteger:
-        trips = paginator.page(1)
-    except EmptyPage:
-        trips = paginator.page(paginator.num_pages)
+def _home_country(request):
+    """Фасет выбранной страны (?country=FR) или None; справочник берется из кэша фасетов"""
+    code = request.GET.get('country', '').upper()
+    if not code:
+        return None
+    return next((facet for facet in map_data.country_facets() if facet['iso2'] == code), None)
+
+
+def _home_feed_page(request, country=None):
+    trips = Trip.objects.all()
+    if country is not None:
+        trips = trips.filter(country_ref_id=country['id'])
+    return _cursor_page(request, trips, HOME_FEED_ORDERING, HOME_FEED_PER_PAGE)
+
+
+def home(request):
+    country = _home_country(request)
+    trips = _home_feed_page(request, country)
+    return render(request, 'diary/home.html', {
+        'trips': trips,
+        'country': country,
+        'facets': map_data.country_facets(),
+    })
 
-    return render(request, 'diary/home.html', {'trips': trips})
+
+def trip_feed(request):
+    """Следующая порция карточек для бесконечной прокрутки (HTML-фрагмент)"""
+    trips = _home_feed_page(request, _home_country(request))
+    return _feed_response(request, 'diary/_trip_cards.html', {'trips': trips}, trips)
+
+
+def _user_trips_page(request, param='cursor'):
+    trips = Trip.objects.filter(user=request.user).only(
+        'pk', 'user_id', 'title', 'country', 'start_date', 'end_date'
+    )
+    return _cursor_page(request, trips, PROFILE_TRIPS_ORDERING, PROFILE_PER_PAGE, param)
+
+
+def _user_reviews_page(request, per_page, param='cursor'):
+    # Отзывы к удаленным поездкам живут до фоновой очистки - не показываем их
+    reviews = Review.objects.filter(user=request.user, trip__deleted_at__isnull=True)
+    reviews = reviews.select_related('trip').only(
+        'pk', 'user_id', 'rating', 'comment', 'created_at', 'trip__title', 'trip__country'
+    )
+    return _cursor_page(request, reviews, PROFILE_REVIEWS_ORDERING, per_page, param)
+
+
+def search(request):
+    """Полнотекстовый поиск по поездкам и отзывам"""
+    query = request.GET.get('q', '').strip()
+    results = None
+    if query:
+        paginator = CursorPaginator(
+            search_trips(Trip.objects.all(), query), ['-rank', '-id'], SEARCH_PER_PAGE
+        )
+        try:
+            results = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            results = paginator.page()
+        for trip in results:
+            trip.highlighted = highlight(trip.headline)
+
+    return render(request, 'diary/search.html', {'query': query, 'results': results})
+
+
+def travelling(request):
+    """Кто был в пути в день или в промежуток дат (GiST по периоду поездки)"""
+    form = TravelPeriodForm(request.GET or None)
+    trips = None
+    if form.is_valid():
+        queryset = Trip.objects.select_related('user').only(
+            'pk', 'title', 'country', 'start_date', 'end_date', 'user__username',
+        )
+        if form.cleaned_data['mine'] and request.user.is_authenticated:
+            queryset = queryset.filter(user=request.user)
+        trips = _cursor_page(request, form.filter(queryset), HOME_FEED_ORDERING, TRAVELLING_PER_PAGE)
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    return render(request, 'diary/travelling.html', {'form': form, 'trips': trips, 'query': query.urlencode()})
 
 
 def trip_detail(request, pk):
-    trip = get_object_or_404(Trip, pk=pk)
-    reviews = trip.reviews.filter(is_approved=True)
+    context = load_trip_detail(pk, request.GET.get('cursor'))
+    trip = context['trip']
 
     if request.method == 'POST':
         if not request.user.is_authenticated:
@@ -47,15 +154,48 @@ def trip_detail(request, pk):
     else:
         form = ReviewForm()
 
-    return render(request, 'diary/trip_detail.html', {
-        'trip': trip,
-        'reviews': reviews,
-        'form': form
-    })
+    context['form'] = form
+    return render(request, 'diary/trip_detail.html', context)
+
+
+def trip_reviews_feed(request, pk):
+    reviews = trip_reviews_page(pk, request.GET.get('cursor'))
+    return _feed_response(request, 'diary/_trip_reviews.html', {'reviews': reviews}, reviews)
+
+
+def _throttled(request, template_name, form, wait):
+    """Ответ 429 без разбора формы: ни хэширования пароля, ни запросов к БД"""
+    messages.error(request, f'Слишком много попыток. Повторите через {wait} с.')
+    response = render(request, template_name, {'form': form}, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+class LoginView(auth_views.LoginView):
+    """Вход с лимитом попыток по IP и по имени пользователя"""
+    template_name = 'diary/login.html'
+
+    def _rules(self):
+        username = self.request.POST.get('username', '').strip().lower()
+        return [('login_ip', throttle.client_ip(self.request)), ('login_username', username)]
+
+    def post(self, request, *args, **kwargs):
+        wait = throttle.check(self._rules())
+        if wait:
+            return _throttled(request, self.template_name, self.get_form_class()(request), wait)
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        # Успешный вход не должен мешать владельцу аккаунта войти снова
+        throttle.reset('login_username', self._rules()[1][1])
+        return super().form_valid(form)
 
 
 def register(request):
     if request.method == 'POST':
+        wait = throttle.check([('register_ip', throttle.client_ip(request))])
+        if wait:
+            return _throttled(request, 'diary/register.html', CustomUserCreationForm(), wait)
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
             user = form.save()
@@ -72,19 +212,43 @@ def register(request):
 
 @login_required
 def profile(request):
-    user_profile = request.user.profile
-    user_trips = Trip.objects.filter(user=request.user)
-    user_reviews = Review.objects.filter(user=request.user)
-
+    # Счетчики из UserStats, списки - по одной странице на раздел
     return render(request, 'diary/profile.html', {
-        'profile': user_profile,
-        'user_trips': user_trips,
-        'user_reviews': user_reviews
+        'profile': request.user.profile,
+        'stats': user_stats.for_user(request.user),
+        'user_trips': _user_trips_page(request, 'trips_cursor'),
+        'user_reviews': _user_reviews_page(request, PROFILE_PER_PAGE, 'reviews_cursor'),
     })
 
 
 @login_required
+def profile_trips(request):
+    trips = _user_trips_page(request)
+    return _feed_response(request, 'diary/_profile_trips.html', {'user_trips': trips}, trips)
+
+
+@login_required
+def profile_reviews(request):
+    reviews = _user_reviews_page(request, PROFILE_PER_PAGE)
+    return _feed_response(request, 'diary/_profile_reviews.html', {'user_reviews': reviews}, reviews)
+
+
+def _save_uploaded_photos(request, trip, upload_handler):
+    for file_name, reason in upload_handler.rejected:
+        messages.warning(request, f'Фото «{file_name}» не загружено: {reason}.')
+    save_trip_photos(trip, request.FILES.getlist('photos'))
+
+
+@login_required
+@csrf_exempt
 def add_trip(request):
+    # Проверка фото должна встать до разбора тела запроса, поэтому CSRF проверяется ниже
+    upload_handler = install_photo_upload_handler(request)
+    return _add_trip(request, upload_handler)
+
+
+@csrf_protect
+def _add_trip(request, upload_handler):
     if request.method == 'POST':
         form = TripForm(request.POST)
         if form.is_valid():
@@ -93,9 +257,7 @@ def add_trip(request):
             trip.save()
 
             # Обработка загруженных фотографий
-            photos = request.FILES.getlist('photos')
-            for photo in photos:
-                TripPhoto.objects.create(trip=trip, image=photo)
+            _save_uploaded_photos(request, trip, upload_handler)
 
             messages.success(request, 'Поездка успешно добавлена!')
             return redirect('trip_detail', pk=trip.pk)
@@ -108,7 +270,14 @@ def add_trip(request):
 
 
 @login_required
+@csrf_exempt
 def edit_trip(request, pk):
+    upload_handler = install_photo_upload_handler(request)
+    return _edit_trip(request, pk, upload_handler)
+
+
+@csrf_protect
+def _edit_trip(request, pk, upload_handler):
     trip = get_object_or_404(Trip, pk=pk)
 
     # Проверяем, что пользователь является автором поездки
@@ -122,9 +291,7 @@ def edit_trip(request, pk):
             form.save()
 
             # Обработка новых фотографий
-            photos = request.FILES.getlist('photos')
-            for photo in photos:
-                TripPhoto.objects.create(trip=trip, image=photo)
+            _save_uploaded_photos(request, trip, upload_handler)
 
             messages.success(request, 'Поездка успешно обновлена!')
             return redirect('trip_detail', pk=pk)
@@ -147,7 +314,8 @@ def delete_trip(request, pk):
         return redirect('trip_detail', pk=pk)
 
     if request.method == 'POST':
-        trip.delete()
+        # Фото и отзывы удаляются в фоне (trip_purge.py), поездка уже скрыта
+        trip_purge.mark_deleted(trip)
         messages.success(request, 'Поездка успешно удалена!')
         return redirect('home')
 
@@ -196,16 +364,95 @@ def delete_review(request, pk):
     return render(request, 'diary/delete_review.html', {'review': review})
 
 
+@login_required
+@permission_required('sait_app.change_review', raise_exception=True)
+def moderation(request):
+    """Очередь неодобренных отзывов: одобрение и удаление отмеченных одним запросом.
+
+    Отзывы удаленных поездок в очередь не попадают: их уберет trip_purge.
+    """
+    queue = Review.objects.filter(is_approved=False, trip__deleted_at__isnull=True)
+    if request.method == 'POST':
+        ids = [pk for pk in request.POST.getlist('review') if pk.isdigit()]
+        pending = queue.filter(pk__in=ids)
+        action = request.POST.get('action')
+        if action == 'approve':
+            rows = pending.approve()
+            messages.success(request, f'Одобрено отзывов: {rows}')
+        elif action == 'delete' and request.user.has_perm('sait_app.delete_review'):
+            # Неодобренные отзывы не входят в агрегаты - поездки не пересчитываются.
+            # ReviewQuerySet.reject() только снимает одобрение - в очереди это ничего не меняет
+            rows, _ = pending.delete()
+            messages.success(request, f'Удалено отзывов: {rows}')
+        else:
+            messages.error(request, 'Неизвестное действие.')
+        # Обработанные строки ушли из очереди - продолжаем с того же места
+        cursor = request.POST.get('cursor')
+        return redirect(f'{request.path}?cursor={cursor}' if cursor else request.path)
+
+    reviews = queue.select_related('user', 'trip').only(
+        'pk', 'rating', 'comment', 'created_at', 'is_approved', 'user__username', 'trip__title',
+    )
+    reviews = _cursor_page(request, reviews, MODERATION_ORDERING, MODERATION_PER_PAGE)
+    return render(request, 'diary/moderation.html', {
+        'reviews': reviews,
+        'cursor': request.GET.get('cursor', ''),
+    })
+
+
 @login_required
 def my_reviews(request):
-    reviews = Review.objects.filter(user=request.user).select_related('trip')
+    reviews = _user_reviews_page(request, MY_REVIEWS_PER_PAGE)
     return render(request, 'diary/my_reviews.html', {'reviews': reviews})
 
 
+@login_required
+def my_reviews_feed(request):
+    reviews = _user_reviews_page(request, MY_REVIEWS_PER_PAGE)
+    return _feed_response(request, 'diary/_my_reviews.html', {'reviews': reviews}, reviews)
+
+
 def travel_map(request):
     return render(request, 'diary/map.html')
 
 
+def top_trips(request):
+    """Лучшие поездки по байесовской оценке, все или одной страны (?country=FR)"""
+    country = None
+    code = request.GET.get('country', '').upper()
+    if code:
+        country = Country.objects.filter(iso2=code).first()
+    # Для выбора - только страны, у поездок которых есть одобренные отзывы
+    countries = CountryStats.objects.filter(reviews_count__gt=0).select_related('country').order_by('country__name')
+    rankings = leaderboard.top(country.pk if country else None)
+    return render(request, 'diary/top_trips.html', {
+        'rankings': rankings,
+        'country': country,
+        'countries': [stats.country for stats in countries],
+    })
+
+
+def _map_scope(request):
+    if request.GET.get('scope') == 'mine' and request.user.is_authenticated:
+        return request.user.pk
+    return map_data.GLOBAL_SCOPE
+
+
+@require_safe
+@condition(etag_func=lambda request: map_data.etag(_map_scope(request)))
+def travel_map_data(request):
+    """Агрегаты по странам в GeoJSON; повторный запрос с тем же ETag получает 304"""
+    scope = _map_scope(request)
+    response = HttpResponse(map_data.geojson(scope), content_type='application/geo+json')
+    if scope == map_data.GLOBAL_SCOPE:
+        patch_cache_control(response, public=True, max_age=60)
+    else:
+        # Браузер хранит ответ, но сверяет ETag при каждом открытии карты
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+
 @login_required
 def edit_profile(request):
     """Редактирование профиля пользователя"""
@@ -234,7 +481,7 @@ def delete_avatar(request):
     if request.method == 'POST':
         profile = request.user.profile
         if profile.avatar:
-            profile.avatar.delete(save=False)
+            # Ссылку на файл отпустит signals.profile_saved - avatar.delete() отпустил бы вторую
             profile.avatar = None
             profile.save()
             messages.success(request, 'Фото профиля удалено!')
@@ -0,0 +1,77 @@
+"""Асинхронные версии страниц для чтения, подключаются под ASGI.
+
+Независимые выборки страницы выполняются одновременно (loaders.gather_queries):
+например, личный кабинет ждет самый долгий из четырех запросов, а не их сумму.
+Одновременность требует пула psycopg (SAIT_DB_POOL=1, включен в gunicorn.conf.py),
+без него выборки идут по очереди на одном соединении.
+Шаблон рендерится в синхронном потоке - теги кэша фрагментов и ленивые
+связи обращаются к кэшу и БД. Отправка отзыва остается синхронной.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+
+from . import travel_map as map_data
+from . import user_stats, views
+from .forms import ReviewForm
+from .loaders import aload_trip_detail, gather_queries, load_profile
+
+arender = sync_to_async(render)
+
+
+async def _auth_user(request):
+    """Пользователь запроса; дальше request.user уже не обращается к БД"""
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+async def home(request):
+    user = await _auth_user(request)
+    country, facets = await sync_to_async(lambda: (views._home_country(request), map_data.country_facets()))()
+    trips, _ = await gather_queries(
+        lambda: views._home_feed_page(request, country),
+        lambda: load_profile(user),
+    )
+    return await arender(request, 'diary/home.html', {'trips': trips, 'country': country, 'facets': facets})
+
+
+async def trip_detail(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(views.trip_detail)(request, pk)
+    user = await _auth_user(request)
+    context, _ = await asyncio.gather(
+        aload_trip_detail(pk, request.GET.get('cursor')),
+        gather_queries(lambda: load_profile(user)),
+    )
+    context['form'] = ReviewForm()
+    return await arender(request, 'diary/trip_detail.html', context)
+
+
+@login_required
+async def profile(request):
+    user = await _auth_user(request)
+    stats, user_trips, user_reviews, profile = await gather_queries(
+        lambda: user_stats.for_user(user),
+        lambda: views._user_trips_page(request, 'trips_cursor'),
+        lambda: views._user_reviews_page(request, views.PROFILE_PER_PAGE, 'reviews_cursor'),
+        lambda: load_profile(user),
+    )
+    return await arender(request, 'diary/profile.html', {
+        'profile': profile,
+        'stats': stats,
+        'user_trips': user_trips,
+        'user_reviews': user_reviews,
+    })
+
+
+@login_required
+async def my_reviews(request):
+    await _auth_user(request)
+    reviews, _ = await gather_queries(
+        lambda: views._user_reviews_page(request, views.MY_REVIEWS_PER_PAGE),
+        lambda: load_profile(request.user),
+    )
+    return await arender(request, 'diary/my_reviews.html', {'reviews': reviews})
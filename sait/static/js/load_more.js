@@ -0,0 +1,26 @@
+// Кнопки «Показать ещё»: догружают HTML-фрагмент по курсору в контейнер из data-load-more
+document.querySelectorAll('[data-load-more]').forEach(function (more) {
+    var target = document.querySelector(more.dataset.loadMore);
+    more.addEventListener('click', function (event) {
+        event.preventDefault();
+        if (more.dataset.loading) {
+            return;
+        }
+        more.dataset.loading = '1';
+        fetch(more.dataset.feedUrl + '?cursor=' + encodeURIComponent(more.dataset.cursor))
+            .then(function (response) {
+                var next = response.headers.get('X-Next-Cursor');
+                return response.text().then(function (html) {
+                    target.insertAdjacentHTML('beforeend', html);
+                    if (next) {
+                        more.dataset.cursor = next;
+                    } else {
+                        more.parentNode.remove();
+                    }
+                });
+            })
+            .finally(function () {
+                delete more.dataset.loading;
+            });
+    });
+});
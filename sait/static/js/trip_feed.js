@@ -0,0 +1,46 @@
+// Бесконечная прокрутка: догружаем карточки, когда кнопка появляется на экране
+(function () {
+    var more = document.getElementById('trip-feed-more');
+    if (!more || !('IntersectionObserver' in window)) {
+        return;
+    }
+    var feed = document.getElementById('trip-feed');
+    var loading = false;
+
+    function loadMore() {
+        if (loading || !more.dataset.cursor) {
+            return;
+        }
+        loading = true;
+        // Фильтр по стране сохраняется и в ленте, и в ссылке для перехода без JS
+        var country = more.dataset.country ? 'country=' + encodeURIComponent(more.dataset.country) + '&' : '';
+        fetch(more.dataset.feedUrl + '?' + country + 'cursor=' + encodeURIComponent(more.dataset.cursor))
+            .then(function (response) {
+                var next = response.headers.get('X-Next-Cursor');
+                return response.text().then(function (html) {
+                    feed.insertAdjacentHTML('beforeend', html);
+                    if (next) {
+                        more.dataset.cursor = next;
+                        more.href = '?' + country + 'cursor=' + next;
+                    } else {
+                        observer.disconnect();
+                        more.parentNode.remove();
+                    }
+                });
+            })
+            .finally(function () {
+                loading = false;
+            });
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+            loadMore();
+        }
+    }, {rootMargin: '400px'});
+    observer.observe(more);
+    more.addEventListener('click', function (event) {
+        event.preventDefault();
+        loadMore();
+    });
+})();